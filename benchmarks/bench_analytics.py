@@ -0,0 +1,60 @@
+"""Benchmark of vectorized lap analytics
+Compares f_one.analytics.analyze on NumPy arrays with per-row Python
+aggregation of the same synthetic laps: median and MAD of lap times,
+quantiles, aggregate.best_laps, aggregate.rank and team best/mean.
+
+Example: python benchmarks/bench_analytics.py --laps 1000000
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'flaskr'))
+
+from f_one import aggregate, analytics  # noqa: E402
+from bench_memory import synthetic_laps  # noqa: E402
+from synthetic import TEAMS  # noqa: E402
+
+
+def python_analytics(laps: list, pilots: dict) -> list:
+    positive = [end - start for _, _, start, end in laps if end > start]
+    median = statistics.median(positive)
+    statistics.median([abs(lap_ms - median) for lap_ms in positive])  # MAD
+    statistics.quantiles(positive, n=20)
+    best, _ = aggregate.best_laps(laps)
+    standings = aggregate.rank(best)
+    teams = {}
+    for standing in standings:
+        teams.setdefault(pilots[standing.code][1], []).append(standing.lap_ms)
+    return [(car, min(times), sum(times) / len(times))
+            for car, times in teams.items()]
+
+
+def timed(func, *args) -> float:
+    started = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - started
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--laps', type=int, default=1_000_000)
+    arg_parser.add_argument('--drivers', type=int, default=1000)
+    args = arg_parser.parse_args()
+    laps = list(synthetic_laps(args.drivers, max(1, args.laps // args.drivers)))
+    pilots = {}
+    for code, *_ in laps:
+        pilots.setdefault(code, (f'Driver {code}',
+                                 TEAMS[len(pilots) % len(TEAMS)]))
+    arrays = analytics.from_rows(((code, lap, end - start)
+                                  for code, lap, start, end in laps), pilots)
+    print(f'laps: {len(laps)}')
+    print(f'per-row Python: {timed(python_analytics, laps, pilots):.3f} s')
+    print(f'NumPy analyze: {timed(analytics.analyze, arrays, 15):.3f} s')
+
+
+if __name__ == '__main__':
+    main()
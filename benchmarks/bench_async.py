@@ -0,0 +1,123 @@
+"""Load test of sync (Flask, thread per request) and async (asgi.py) API
+Both apps serve /api/v1/report/ from SQLite database (db backend) filled with
+synthetic laps. Sync app handles requests in a pool of --threads threads
+like a threaded WSGI server; async app handles --clients concurrent clients
+on one event loop with the same number of threads for SQLite access.
+
+Example: python benchmarks/bench_async.py --clients 64 --threads 8
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'flaskr'))
+
+import app  # noqa: E402
+import asgi  # noqa: E402
+import db  # noqa: E402
+import models  # noqa: E402
+from bench_load import percentile  # noqa: E402
+from synthetic import generate_logs  # noqa: E402
+
+URL = '/api/v1/report/'
+CONFIG = {'REPORT_BACKEND': 'db', 'REPORT_EVENT': None,
+          'REPORT_SESSION': 'Q1'}
+
+
+def summary(latencies: list, elapsed: float) -> dict:
+    return {'requests': len(latencies),
+            'rps': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p99_ms': round(percentile(latencies, 99), 3)}
+
+
+def run_sync(requests: int, threads: int) -> dict:
+    web_app = app.create_app({**CONFIG, 'SWAGGER_ENABLED': False})
+    local = threading.local()
+
+    def request(_):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = web_app.test_client()
+        started = time.perf_counter()
+        assert client.get(URL).status_code == 200
+        return (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        latencies = list(executor.map(request, range(requests)))
+    return summary(latencies, time.perf_counter() - started)
+
+
+def run_async(requests: int, clients: int, threads: int) -> dict:
+    asgi_app = asgi.create_asgi_app({**CONFIG, 'ASYNC_IO_THREADS': threads})
+    scope = {'type': 'http', 'method': 'GET', 'path': URL,
+             'query_string': b'', 'headers': []}
+    latencies = []
+
+    async def receive():
+        return {'type': 'http.request'}
+
+    async def client(count: int):
+        for _ in range(count):
+            statuses = []
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    statuses.append(message['status'])
+
+            started = time.perf_counter()
+            await asgi_app(scope, receive, send)
+            latencies.append((time.perf_counter() - started) * 1000)
+            assert statuses == [200]
+
+    async def main():
+        await asyncio.gather(*(client(requests // clients
+                                      + (index < requests % clients))
+                               for index in range(clients)))
+
+    started = time.perf_counter()
+    asyncio.run(main())
+    elapsed = time.perf_counter() - started
+    asgi_app.executor.shutdown()
+    return summary(latencies, elapsed)
+
+
+def run(drivers: int, laps: int, requests: int, clients: int,
+        threads: int) -> dict:
+    with tempfile.TemporaryDirectory() as folder:
+        laps_dir = str(generate_logs(Path(folder) / 'data', drivers, laps))
+        database = models.db.database
+        models.configure(str(Path(folder) / 'f1.sqlite3'))
+        try:
+            with models.db.connection_context():
+                db.create_tables()
+                db.ingest(laps_dir)
+            return {'laps': drivers * laps,
+                    'sync': run_sync(requests, threads),
+                    'async': run_async(requests, clients, threads)}
+        finally:
+            models.configure(database)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--drivers', type=int, default=20)
+    arg_parser.add_argument('--laps', type=int, default=5000)
+    arg_parser.add_argument('--requests', type=int, default=2000)
+    arg_parser.add_argument('--clients', type=int, default=64)
+    arg_parser.add_argument('--threads', type=int, default=8)
+    args = arg_parser.parse_args()
+    print(json.dumps(run(args.drivers, args.laps, args.requests,
+                         args.clients, args.threads), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""Benchmark of compiled columnar lap cache
+Compares f_one.build_report parsing text logs with build_report reading laps
+from compiled file (f_one.columnar) mapped with mmap, and time to map the
+file alone (what a new worker process pays at startup).
+
+Example: python benchmarks/bench_columnar.py --laps 1000000
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'flaskr'))
+
+from f_one import columnar, f_one  # noqa: E402
+from synthetic import generate_logs  # noqa: E402
+
+
+def timed(func, *args) -> float:
+    started = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - started
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--laps', type=int, default=1_000_000)
+    arg_parser.add_argument('--drivers', type=int, default=1000)
+    args = arg_parser.parse_args()
+    laps = max(1, args.laps // args.drivers)
+    with tempfile.TemporaryDirectory() as folder:
+        generate_logs(folder, args.drivers, laps)
+        paths = f_one.generate_file_paths(folder)
+        f_one.COMPILED_CACHE = False
+        parsed = timed(f_one.build_report, folder)
+        compile_time = timed(columnar.get_laps, paths)
+        f_one.COMPILED_CACHE = True
+        compiled = timed(f_one.build_report, folder)
+        mapped = timed(columnar.get_laps, paths)
+        size = (Path(folder) / columnar.CACHE_FILE).stat().st_size
+    print(f'laps: {args.drivers * laps}, compiled file: '
+          f'{size / 2 ** 20:.1f} MiB')
+    print(f'build_report from text logs: {parsed:.3f} s')
+    print(f'compile laps: {compile_time:.3f} s')
+    print(f'build_report from compiled file: {compiled:.3f} s')
+    print(f'map compiled file: {mapped * 1000:.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Benchmark of bulk ingest of season archive into SQLite
+Loads synthetic season archive with db.load_season using insert_many and the
+executemany fast path for every --batch-sizes value. Prints seconds, laps per
+second and peak traced memory (tracemalloc) of every run.
+
+Example: python benchmarks/bench_ingest.py --events 50 --laps 500
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'flaskr'))
+
+import db  # noqa: E402
+import models  # noqa: E402
+from bench_season import generate_archive  # noqa: E402
+
+
+def measure(folder: str, root: Path, batch_size: int, fast: bool) -> dict:
+    """Load archive into new database, return seconds, laps and peak memory"""
+    models.configure(Path(folder) / f'ingest-{time.perf_counter_ns()}.sqlite3')
+    with models.connection():
+        db.create_tables()
+        tracemalloc.start()
+        started = time.perf_counter()
+        laps = db.load_season(root, batch_size=batch_size, fast=fast,
+                              progress=None)
+        seconds = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {'seconds': round(seconds, 3), 'laps': laps,
+            'laps_per_second': round(laps / seconds),
+            'peak_memory_mb': round(peak / 2 ** 20, 1)}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--events', type=int, default=50)
+    arg_parser.add_argument('--drivers', type=int, default=20)
+    arg_parser.add_argument('--laps', type=int, default=500)
+    arg_parser.add_argument('--batch-sizes', type=int, nargs='+',
+                            default=[100, 1000, 5000])
+    args = arg_parser.parse_args()
+    with tempfile.TemporaryDirectory() as folder:
+        root = generate_archive(Path(folder) / 'season', args.events,
+                                args.drivers, args.laps)
+        for batch_size in args.batch_sizes:
+            for fast in (False, True):
+                # insert_many binds every value, SQLite allows 32766 variables
+                if not fast and batch_size * len(db.LAP_FIELDS) > 32766:
+                    continue
+                result = measure(folder, root, batch_size, fast)
+                print(f"{'executemany' if fast else 'insert_many'} "
+                      f"batch {batch_size}: {result}")
+    models.configure()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Load test of HTTP endpoints with Flask test client
+Sends requests to /report, /report/pilots and /api/v1/<type>/ from several
+threads and reports p50/p99 latency and requests per second of every
+endpoint. Data is generated with synthetic module.
+
+Example: python benchmarks/bench_load.py --requests 2000 --threads 4
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'flaskr'))
+
+import app  # noqa: E402
+from synthetic import generate_logs  # noqa: E402
+
+ENDPOINTS = ('/report', '/report?order=desc', '/report/pilots',
+             '/api/v1/report/', '/api/v1/report/?format=xml',
+             '/api/v1/pilots/')
+
+
+def percentile(values: list, percent: float) -> float:
+    values = sorted(values)
+    index = min(len(values) - 1, round(percent / 100 * (len(values) - 1)))
+    return values[index]
+
+
+def load(web_app, url: str, requests: int, threads: int) -> dict:
+    """Send requests to url from threads. Return latency statistics"""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    per_thread = max(1, requests // threads)
+
+    def worker():
+        own = []
+        with web_app.test_client() as client:
+            for _ in range(per_thread):
+                started = time.perf_counter()
+                resp = client.get(url)
+                own.append((time.perf_counter() - started) * 1000)
+                if resp.status_code != 200:
+                    errors.append(resp.status_code)
+        with lock:
+            latencies.extend(own)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {'requests': len(latencies),
+            'errors': len(errors),
+            'rps': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'mean_ms': round(statistics.fmean(latencies), 3)}
+
+
+def run(drivers: int, laps: int, requests: int, threads: int) -> dict:
+    """Run load test of every endpoint. Return dict with results"""
+    with tempfile.TemporaryDirectory() as folder:
+        laps_dir = str(generate_logs(Path(folder) / 'data', drivers, laps))
+        web_app = app.create_app({'LAPS_DIR': laps_dir,
+                                  'REPORT_BACKEND': 'file'})
+        with web_app.test_client() as client:
+            client.get('/report')  # warm up cache
+        return {url: load(web_app, url, requests, threads)
+                for url in ENDPOINTS}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--drivers', type=int, default=20)
+    arg_parser.add_argument('--laps', type=int, default=10)
+    arg_parser.add_argument('--requests', type=int, default=1000)
+    arg_parser.add_argument('--threads', type=int, default=4)
+    args = arg_parser.parse_args()
+    print(json.dumps(run(args.drivers, args.laps, args.requests, args.threads),
+                     indent=2))
+
+
+if __name__ == '__main__':
+    main()
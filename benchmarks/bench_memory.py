@@ -0,0 +1,79 @@
+"""Memory of lap records
+Measures with tracemalloc memory taken by 1M laps kept as the lists of the
+previous implementation ([code, start datetime, end datetime, lap timedelta]),
+as f_one.records.Lap NamedTuples and as f_one.records.LapTable columns.
+
+Example: python benchmarks/bench_memory.py --laps 1000000
+"""
+
+import argparse
+import datetime
+import gc
+import random
+import sys
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'flaskr'))
+
+from f_one import parser  # noqa: E402
+from f_one.records import Lap, LapTable  # noqa: E402
+from synthetic import driver_codes  # noqa: E402
+
+SESSION_START_MS = 1_527_163_200_000  # 2018-05-24 12:00:00
+
+
+def synthetic_laps(drivers: int, laps: int, seed: int = 0):
+    """Yield (code, lap, start_ms, end_ms) of synthetic session"""
+    rnd = random.Random(seed)
+    for code in driver_codes(drivers):
+        moment = SESSION_START_MS + rnd.randrange(600_000)
+        for lap in range(1, laps + 1):
+            lap_ms = rnd.randrange(70_000, 80_000)
+            yield code, lap, moment, moment + lap_ms
+            moment += lap_ms
+
+
+def legacy_records(laps) -> list:
+    records = []
+    for code, lap, start_ms, end_ms in laps:
+        start = parser.ms_to_datetime(start_ms)
+        stop = parser.ms_to_datetime(end_ms)
+        records.append([code, start, stop, stop - start])
+    return records
+
+
+def lap_records(laps) -> list:
+    return [Lap(*lap) for lap in laps]
+
+
+def measure(func, laps) -> int:
+    """Return bytes allocated by records that func builds"""
+    gc.collect()
+    tracemalloc.start()
+    records = func(laps)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del records
+    return size
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--laps', type=int, default=1_000_000,
+                            help='Number of laps')
+    arg_parser.add_argument('--drivers', type=int, default=1000)
+    args = arg_parser.parse_args()
+    laps_per_driver = max(1, args.laps // args.drivers)
+    laps = list(synthetic_laps(args.drivers, laps_per_driver))
+    print(f'laps: {len(laps)}')
+    for label, func in (('legacy lists', legacy_records),
+                        ('Lap NamedTuple', lap_records),
+                        ('LapTable', LapTable.from_laps)):
+        size = measure(func, laps)
+        print(f'{label}: {size / 2 ** 20:.1f} MiB, '
+              f'{size / len(laps):.1f} bytes per lap')
+
+
+if __name__ == '__main__':
+    main()
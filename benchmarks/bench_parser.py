@@ -0,0 +1,68 @@
+"""Benchmark of lap log parsing
+Compares lines/sec of the streaming parser (f_one.parser) with the previous
+readlines() + datetime.strptime implementation on synthetic logs.
+
+Example: python benchmarks/bench_parser.py --lines 1000000
+"""
+
+import argparse
+import datetime
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'flaskr'))
+
+from f_one import parser  # noqa: E402
+from synthetic import generate_logs  # noqa: E402
+
+
+def legacy_parse(path) -> int:
+    """Previous implementation used in f_one.build_report and db"""
+    count = 0
+    with open(path, 'r') as file:
+        for line in file.readlines():
+            if line == '\n':
+                continue
+            name = line[0:3]
+            dt = datetime.datetime.strptime(line[3:].rstrip(),
+                                            '%Y-%m-%d_%H:%M:%S.%f')
+            count += 1
+    return count
+
+
+def streaming_parse(path) -> int:
+    count = 0
+    for _ in parser.iter_timings(path):
+        count += 1
+    return count
+
+
+def measure(func, path) -> float:
+    """Return lines per second"""
+    started = time.perf_counter()
+    lines = func(path)
+    return lines / (time.perf_counter() - started)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--lines', type=int, default=1_000_000,
+                            help='Number of lines in start.log')
+    arg_parser.add_argument('--drivers', type=int, default=1000)
+    args = arg_parser.parse_args()
+    laps = max(1, args.lines // args.drivers)
+    with tempfile.TemporaryDirectory() as folder:
+        generate_logs(folder, args.drivers, laps)
+        path = Path(folder) / 'start.log'
+        print(f'lines: {args.drivers * laps}')
+        legacy = measure(legacy_parse, path)
+        streaming = measure(streaming_parse, path)
+        print(f'readlines + strptime: {legacy:12,.0f} lines/sec')
+        print(f'streaming parser:     {streaming:12,.0f} lines/sec')
+        print(f'speedup: {streaming / legacy:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
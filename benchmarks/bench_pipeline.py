@@ -0,0 +1,97 @@
+"""Micro-benchmarks of report pipeline
+Measures build_report, print_report, XML converters of API and
+db.store_laps_files on synthetic logs (drivers x laps). build_report parses
+text logs every time: compiled lap cache is measured by bench_columnar.py.
+
+Example: python benchmarks/bench_pipeline.py --drivers 200 --laps 50
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'flaskr'))
+
+import db  # noqa: E402
+import models  # noqa: E402
+from api import pilots_report_to_xml_et, qual_report_to_xml_et  # noqa: E402
+from f_one import f_one  # noqa: E402
+from synthetic import generate_logs  # noqa: E402
+
+
+def timeit(func, repeat: int) -> dict:
+    """Run func repeat times. Return min, median and max time in ms"""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - started) * 1000)
+    return {'min_ms': round(min(times), 3),
+            'median_ms': round(statistics.median(times), 3),
+            'max_ms': round(max(times), 3),
+            'repeat': repeat}
+
+
+def store_laps(laps_dir: str, db_dir: str):
+    """Store drivers and laps of directory in new database"""
+    database = models.db.database
+    db_path = Path(db_dir) / f'bench-{time.perf_counter_ns()}.sqlite3'
+    models.configure(str(db_path))
+    try:
+        with models.db.connection_context():
+            db.create_tables()
+            db.store_drivers(db.parse_drivers_files(laps_dir))
+            db.store_laps_files(db.parse_laps_files(laps_dir))
+    finally:
+        models.configure(database)
+        db_path.unlink()
+
+
+def run(drivers: int, laps: int, repeat: int = 5) -> dict:
+    """Run micro-benchmarks. Return dict with results of every benchmark"""
+    compiled_cache = f_one.COMPILED_CACHE
+    f_one.COMPILED_CACHE = False
+    try:
+        return _run(drivers, laps, repeat)
+    finally:
+        f_one.COMPILED_CACHE = compiled_cache
+
+
+def _run(drivers: int, laps: int, repeat: int) -> dict:
+    with tempfile.TemporaryDirectory() as folder:
+        laps_dir = str(generate_logs(Path(folder) / 'data', drivers, laps))
+        report, pilots, _ = f_one.build_report(laps_dir)
+
+        def print_report():
+            with contextlib.redirect_stdout(io.StringIO()):
+                f_one.print_report(list(report), reverse=True)
+
+        return {
+            'build_report': timeit(lambda: f_one.build_report(laps_dir), repeat),
+            'print_report': timeit(print_report, repeat),
+            'qual_report_to_xml_et': timeit(
+                lambda: qual_report_to_xml_et(report), repeat),
+            'pilots_report_to_xml_et': timeit(
+                lambda: pilots_report_to_xml_et(pilots), repeat),
+            'store_laps_files': timeit(lambda: store_laps(laps_dir, folder),
+                                       max(1, repeat // 2)),
+        }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--drivers', type=int, default=200)
+    arg_parser.add_argument('--laps', type=int, default=50)
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    args = arg_parser.parse_args()
+    print(json.dumps(run(args.drivers, args.laps, args.repeat), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Benchmark of season archive build
+Compares serial build of synthetic season archive (workers=1) with
+f_one.season.build_season in process pool. Compiled lap cache is turned off
+and compiled files are removed before every run, so both runs parse text logs
+and the first one does not pay for compiling files the second one maps.
+
+Example: python benchmarks/bench_season.py --events 200 --workers 4
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'flaskr'))
+
+from f_one import columnar, f_one, season  # noqa: E402
+from synthetic import generate_logs  # noqa: E402
+
+
+def generate_archive(folder, events: int, drivers: int, laps: int) -> Path:
+    """Write synthetic archive with Q1 directory of every event"""
+    root = Path(folder)
+    for event in range(events):
+        generate_logs(root / f'event{event:03d}' / 'Q1', drivers, laps,
+                      seed=event)
+    return root
+
+
+def measure(root, workers: int) -> float:
+    """Return seconds of season build"""
+    for path in Path(root).rglob(columnar.CACHE_FILE):
+        path.unlink()  # left by workers that did not inherit COMPILED_CACHE
+    started = time.perf_counter()
+    season.build_season(str(root), workers=workers)
+    return time.perf_counter() - started
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--events', type=int, default=200)
+    arg_parser.add_argument('--drivers', type=int, default=20)
+    arg_parser.add_argument('--laps', type=int, default=500)
+    arg_parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = arg_parser.parse_args()
+    f_one.COMPILED_CACHE = False  # forked workers inherit it
+    with tempfile.TemporaryDirectory() as folder:
+        root = generate_archive(folder, args.events, args.drivers, args.laps)
+        serial = measure(root, 1)
+        parallel = measure(root, args.workers)
+    print(f'events: {args.events}, laps per event: '
+          f'{args.drivers * args.laps}')
+    print(f'serial: {serial:.2f} s')
+    print(f'{args.workers} workers: {parallel:.2f} s '
+          f'({serial / parallel:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Benchmark of report serializers
+Compares ElementTree and json.dumps of whole report (previous API code) with
+streaming serializers of serializers module on synthetic reports.
+
+Example: python benchmarks/bench_serializers.py --rows 100000
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'flaskr'))
+
+import serializers  # noqa: E402
+from f_one import aggregate  # noqa: E402
+from api import qual_report_to_xml_et  # noqa: E402
+
+
+def synthetic_report(rows: int) -> list:
+    return [(i, f'Driver {i}', f'TEAM {i % 10}',
+             aggregate.format_lap_time(70_000 + i)) for i in range(1, rows + 1)]
+
+
+def measure(func, repeat: int = 3) -> float:
+    """Return best time of func in seconds"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--rows', type=int, default=100_000)
+    args = arg_parser.parse_args()
+    report = synthetic_report(args.rows)
+    cases = {
+        'xml ElementTree': lambda: qual_report_to_xml_et(report),
+        'xml streaming': lambda: b''.join(
+            chunk.encode() for chunk in serializers.iter_xml(report, 'report')),
+        'json dumps': lambda: json.dumps(
+            {serializers.JSON_KEY: report}, sort_keys=True,
+            separators=(',', ':')).encode(),
+        'json streaming': lambda: b''.join(
+            chunk.encode() for chunk in serializers.iter_json(report)),
+        'ndjson streaming': lambda: b''.join(
+            chunk.encode()
+            for chunk in serializers.iter_ndjson(report, 'report')),
+        'csv streaming': lambda: b''.join(
+            chunk.encode() for chunk in serializers.iter_csv(report, 'report')),
+    }
+    print(f'rows: {args.rows}')
+    for name, func in cases.items():
+        seconds = measure(func)
+        print(f'{name:18} {seconds * 1000:9.1f} ms {args.rows / seconds:12,.0f}'
+              f' rows/sec')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""Throughput of pre-forked server with different number of workers
+Starts `python -m flaskr serve` with synthetic logs for every --workers
+value, waits for /ready and sends --requests requests to every endpoint from
+--clients threads over HTTP. Prints requests per second and p50/p99 latency,
+throughput should grow with workers up to the number of CPU cores.
+
+Example: python benchmarks/bench_serve.py --workers 1 2 4 --clients 16
+"""
+
+import argparse
+import http.client
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from bench_load import percentile
+from synthetic import generate_logs
+
+ROOT = Path(__file__).resolve().parents[1]
+ENDPOINTS = ('/report', '/api/v1/report/', '/api/v1/report/?limit=10')
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(port: int, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port,
+                                                    timeout=1)
+            connection.request('GET', '/ready')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError('Server is not ready')
+
+
+def load(port: int, url: str, requests: int, clients: int) -> dict:
+    """Send requests to url from clients threads, one connection per request
+    like the server (HTTP/1.0). Return rps and latency"""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def client():
+        own = []
+        for _ in range(max(1, requests // clients)):
+            started = time.perf_counter()
+            connection = http.client.HTTPConnection('127.0.0.1', port)
+            connection.request('GET', url)
+            resp = connection.getresponse()
+            resp.read()
+            connection.close()
+            own.append((time.perf_counter() - started) * 1000)
+            if resp.status != 200:
+                errors.append(resp.status)
+        with lock:
+            latencies.extend(own)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {'requests': len(latencies), 'errors': len(errors),
+            'rps': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p99_ms': round(percentile(latencies, 99), 3)}
+
+
+def run(laps_dir: str, workers: int, requests: int, clients: int) -> dict:
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'flaskr', 'serve', '--workers', str(workers),
+         '--bind', f'127.0.0.1:{port}'],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        env={**os.environ, 'FLASK_LAPS_DIR': laps_dir,
+             'FLASK_SWAGGER_ENABLED': 'false', 'FLASK_LIVE_TIMING': 'false'})
+    try:
+        wait_ready(port)
+        return {url: load(port, url, requests, clients) for url in ENDPOINTS}
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--drivers', type=int, default=20)
+    arg_parser.add_argument('--laps', type=int, default=50)
+    arg_parser.add_argument('--workers', type=int, nargs='+',
+                            default=[1, 2, 4])
+    arg_parser.add_argument('--requests', type=int, default=2000)
+    arg_parser.add_argument('--clients', type=int, default=16)
+    args = arg_parser.parse_args()
+    results = {'cpus': os.cpu_count()}
+    with tempfile.TemporaryDirectory() as folder:
+        laps_dir = str(generate_logs(Path(folder) / 'data', args.drivers,
+                                     args.laps))
+        for workers in args.workers:
+            results[f'{workers} workers'] = run(laps_dir, workers,
+                                                args.requests, args.clients)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
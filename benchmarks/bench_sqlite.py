@@ -0,0 +1,105 @@
+"""Concurrency benchmark of SQLite database layer
+Readers query report (SqlRepository) in --readers threads (every
+--interval seconds) while one thread stores laps of synthetic logs in one
+bulk transaction (db.store_laps_files).
+Runs with rollback journal (journal_mode=delete, synchronous=full) and with
+models.PRAGMAS (WAL, synchronous=NORMAL, mmap). Prints write time and
+number, latency and errors of reads done during the write.
+
+Example: python benchmarks/bench_sqlite.py --laps 200000 --readers 4
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'flaskr'))
+
+import db  # noqa: E402
+import models  # noqa: E402
+import repository  # noqa: E402
+from bench_load import percentile  # noqa: E402
+from synthetic import generate_logs  # noqa: E402
+
+MODES = {'rollback journal': {'journal_mode': 'delete', 'synchronous': 2,
+                              'mmap_size': 0, 'cache_size': -2000},
+         'wal': {}}
+
+
+def run_mode(folder: str, laps_dir: str, pragmas: dict, readers: int,
+             interval: float) -> dict:
+    db_path = Path(folder) / f'bench-{time.perf_counter_ns()}.sqlite3'
+    models.configure(db_path, **pragmas)
+    with models.connection():
+        db.create_tables()
+        db.ingest_drivers(Path(laps_dir) / 'abbreviations.txt')
+        laps = db.parse_laps_files(laps_dir)
+        # Half of laps are in database before readers start
+        db.store_laps_files(laps[:len(laps) // 2])
+    stop = threading.Event()
+    latencies = []
+    errors = []
+
+    def reader():
+        sql_repository = repository.SqlRepository()
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                sql_repository.get()
+            except models.OperationalError as error:
+                errors.append(str(error))
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+            stop.wait(interval)
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    started = time.perf_counter()
+    with models.connection():
+        db.store_laps_files(laps[len(laps) // 2:])
+    write_time = time.perf_counter() - started
+    stop.set()
+    for thread in threads:
+        thread.join()
+    models.configure()
+    return {'write_s': round(write_time, 3),
+            'reads': len(latencies),
+            'read_errors': len(errors),
+            'read_p50_ms': round(percentile(latencies, 50), 3)
+            if latencies else None,
+            'read_p99_ms': round(percentile(latencies, 99), 3)
+            if latencies else None}
+
+
+def run(drivers: int, laps: int, readers: int, interval: float) -> dict:
+    database = models.db.database
+    try:
+        with tempfile.TemporaryDirectory() as folder:
+            laps_dir = str(generate_logs(Path(folder) / 'data', drivers,
+                                         laps))
+            return {mode: run_mode(folder, laps_dir, pragmas, readers,
+                                   interval)
+                    for mode, pragmas in MODES.items()}
+    finally:
+        models.configure(database)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--drivers', type=int, default=20)
+    arg_parser.add_argument('--laps', type=int, default=10000)
+    arg_parser.add_argument('--readers', type=int, default=4)
+    arg_parser.add_argument('--interval', type=float, default=0.01,
+                            help='Seconds between reads of every reader')
+    args = arg_parser.parse_args()
+    print(json.dumps(run(args.drivers, args.laps, args.readers,
+                         args.interval), indent=2))
+
+
+if __name__ == '__main__':
+    main()
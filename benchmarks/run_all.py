@@ -0,0 +1,55 @@
+"""Run all benchmarks and write results as JSON
+Results of different releases can be compared to find regressions.
+
+Example: python benchmarks/run_all.py --output bench_output.json
+"""
+
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import sys
+from pathlib import Path
+
+import bench_pipeline
+import bench_load
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True,
+                              text=True, check=True,
+                              cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--output', help='JSON file, default stdout')
+    arg_parser.add_argument('--drivers', type=int, default=200)
+    arg_parser.add_argument('--laps', type=int, default=50)
+    arg_parser.add_argument('--requests', type=int, default=1000)
+    arg_parser.add_argument('--threads', type=int, default=4)
+    args = arg_parser.parse_args()
+    results = {
+        'meta': {'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                 'commit': git_commit(),
+                 'python': platform.python_version(),
+                 'platform': platform.platform(),
+                 'drivers': args.drivers,
+                 'laps': args.laps},
+        'pipeline': bench_pipeline.run(args.drivers, args.laps),
+        'http': bench_load.run(args.drivers, args.laps, args.requests,
+                              args.threads),
+    }
+    output = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + '\n')
+    else:
+        sys.stdout.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
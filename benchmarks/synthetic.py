@@ -0,0 +1,59 @@
+"""Synthetic Formula 1 log generator for benchmarks
+Writes abbreviations.txt, start.log and end.log in the same formats as
+flaskr/static/data, with any number of drivers and laps per driver.
+
+Functions:
+    generate_logs(folder, drivers: int, laps: int, seed: int = 0) -> Path:
+    Write synthetic log files to folder. Return Path to folder
+"""
+
+import datetime
+import random
+import string
+from pathlib import Path
+
+TEAMS = ['FERRARI', 'MERCEDES', 'RED BULL RACING TAG HEUER', 'MCLAREN RENAULT',
+         'RENAULT', 'WILLIAMS MERCEDES', 'HAAS FERRARI', 'SAUBER FERRARI',
+         'FORCE INDIA MERCEDES', 'SCUDERIA TORO ROSSO HONDA']
+SESSION_START = datetime.datetime(2018, 5, 24, 12, 0, 0)
+
+
+def driver_codes(count: int) -> list:
+    """Return list of unique 3 letter driver codes"""
+    letters = string.ascii_uppercase
+    codes = []
+    for a in letters:
+        for b in letters:
+            for c in letters:
+                codes.append(a + b + c)
+                if len(codes) == count:
+                    return codes
+    raise ValueError(f'Cannot generate more than {len(codes)} driver codes')
+
+
+def _timestamp(dt: datetime.datetime) -> str:
+    return dt.strftime('%Y-%m-%d_%H:%M:%S.') + f'{dt.microsecond // 1000:03d}'
+
+
+def generate_logs(folder, drivers: int, laps: int, seed: int = 0) -> Path:
+    """Write synthetic log files to folder. Every driver gets laps start and
+    end records, laps of a driver follow each other. Return Path to folder"""
+    rnd = random.Random(seed)
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    codes = driver_codes(drivers)
+    with open(folder / 'abbreviations.txt', 'w') as abbr:
+        for i, code in enumerate(codes):
+            abbr.write(f'{code}_Driver {code}_{TEAMS[i % len(TEAMS)]}\n')
+    with open(folder / 'start.log', 'w') as start, \
+            open(folder / 'end.log', 'w') as end:
+        for code in codes:
+            moment = SESSION_START + datetime.timedelta(
+                milliseconds=rnd.randrange(600_000))
+            for _ in range(laps):
+                lap = datetime.timedelta(milliseconds=rnd.randrange(70_000,
+                                                                    80_000))
+                start.write(f'{code}{_timestamp(moment)}\n')
+                end.write(f'{code}{_timestamp(moment + lap)}\n')
+                moment += lap
+    return folder
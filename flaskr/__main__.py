@@ -0,0 +1,35 @@
+"""Command line entry point of flaskr package
+Modules of the app import each other by top-level names, so flaskr directory
+is added to sys.path first.
+
+Example:
+    python -m flaskr serve --workers 4 --bind 0.0.0.0:8000
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(prog='python -m flaskr')
+    commands = arg_parser.add_subparsers(dest='command', required=True)
+    serve_parser = commands.add_parser(
+        'serve', help='serve web app and API with pre-forked workers')
+    serve_parser.add_argument('--bind', default='127.0.0.1:8000',
+                              help='host:port (default 127.0.0.1:8000)')
+    serve_parser.add_argument('--workers', type=int, default=None,
+                              help='worker processes (default CPU count)')
+    serve_parser.add_argument('--reload-interval', type=float, default=2.0,
+                              help='seconds between checks of data changes')
+    args = arg_parser.parse_args()
+    if args.command == 'serve':
+        import server
+        server.serve(args.bind, args.workers,
+                     reload_interval=args.reload_interval)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,13 +2,46 @@
     This API intended to get report of Monaco 2018 qualification (Q1)
     Call this api passing a version of api and type of report
     (report or pilots). You can also add format parameter
-    (?format=json or ?format=xml) JSON is default.
+    (?format=json, ?format=xml, ?format=ndjson or ?format=csv) JSON is
+    default, and order parameter (?order=asc or ?order=desc) ascending is
+    default.
     Example:
         /api/v1/report/?format=xml
-        /api/v1/report/?format=json
+        /api/v1/report/?format=json&order=desc
         or
         /api/v1/pilots/
 
+    Every combination of report type, format and order is serialized once
+    per data version and served from memory with strong ETag. Requests with
+    matching If-None-Match header get 304 Not Modified. Reports longer than
+    PRECOMPUTE_MAX_ROWS rows are not kept in memory, they are streamed with
+    serializers module row by row.
+
+    Rows can be selected and projected with query parameters, so clients
+    get only the part they show (for example top 10 with position and pilot):
+        /api/v1/report/?limit=10&fields=position_number,pilot
+        /api/v1/report/?team=FERRARI&min_pos=5&max_pos=15&format=csv
+        /api/v1/pilots/?offset=10&limit=5&fields=code
+    team selects rows from the hash index of the report by team, min_pos and
+    max_pos are found by binary search in rows ordered by position and
+    limit/offset take a slice of the result, so only selected rows are
+    touched. Selected responses are streamed with ETag of data version and
+    normalized query.
+
+    Result of one driver by driver code (json or xml):
+        /api/v1/drivers/SVF/?format=xml
+
+    Analytics of laps (gaps, team best and mean, percentiles, outliers,
+    cut-line margin), json or xml:
+        /api/v1/analytics/?format=xml
+
+    Diagnostics of log files (malformed lines, duplicates, unknown driver
+    codes, unmatched starts and ends, implausible lap times), json or xml:
+        /api/v1/diagnostics/
+
+    Live standings are pushed as Server-Sent Events while log files grow:
+        /api/v1/report/stream/
+
     To extract OpenAPI-Specification go to:
     apidocs/
 
@@ -18,18 +51,56 @@
 
         pilots_report_to_xml_et(report) -> str:
             Convert pilots report to XML. Return xml string
+
+        report_rows(cached_report, report_type: str, order: str) -> list:
+            Return rows of report type in order
+
+        build_response_variants(cached_report) -> dict:
+            Serialize report into every (report type, format, order) variant
+
+        check_report_request(api_version: str, report_type: str, fmt: str,
+                             order: str) -> str | None:
+            Return description of error in report request
+
+        parse_report_query(args, report_type: str) -> ReportQuery:
+            Return selection of rows from query parameters
+
+        select_rows(cached_report, report_type: str, query: ReportQuery)
+                    -> list:
+            Return rows of report type selected by query
+
+        driver_to_xml_et(driver: dict) -> bytes:
+            Convert driver result to XML. Return xml bytes
+
+        report_stream(api_version):
+            Push live standings to client as Server-Sent Events
+
+        analytics_to_xml_et(analytics: dict) -> bytes:
+            Convert analytics to XML. Return xml bytes
+
+        build_analytics_variants(cached_report, source) -> dict:
+            Analyze laps of repository and serialize result to JSON and XML
+
+        build_diagnostics_variants(diagnostics) -> dict:
+            Serialize diagnostics of log files to JSON and XML
+
+        init_app(app: Flask):
+            Register API resources and API docs on app
 """
 
-from flask import jsonify, make_response
+import bisect
+import hashlib
+import json
+from types import MappingProxyType
+from typing import NamedTuple
+from urllib.parse import urlencode
+from flask import Flask, Response, current_app, make_response
 from flask_restful import Resource, Api, abort, request
-from flasgger import Swagger
-from f_one import f_one
-from app import app
+import repository
+import serializers
+from f_one import live, metrics
 import xml.etree.ElementTree as ET
 
-api = Api(app)
-swagger = Swagger(app)
-
 
 def qual_report_to_xml_et(report) -> str:
     """Convert qualification report to XML. Return xml string"""
@@ -54,7 +125,7 @@ def qual_report_to_xml_et(report) -> str:
 
 def pilots_report_to_xml_et(report) -> str:
     """Convert pilots report to XML. Return xml string"""
-    root = ET.Element('MonacoPilotsQ1Report>')
+    root = ET.Element('MonacoPilotsQ1Report')
     for record in report:
         pilot = ET.SubElement(root, 'pilot')
 
@@ -104,26 +175,190 @@ def pilots_report_to_xml_et(report) -> str:
 #     return report_for_xml
 
 
-class FOneQReport(Resource):
-
-    laps_dir = 'static/data'
-    qualification_report, pilots, unreliable_data = f_one.build_report(laps_dir)
-    current_report = []
+REPORT_TYPES = ('report', 'pilots')
+FORMATS = tuple(serializers.MIMETYPES)
+ORDERS = ('asc', 'desc')
+
+
+class ResponseVariant:
+    """Serialized response body with its mimetype and strong ETag"""
+
+    __slots__ = ('body', 'mimetype', 'etag')
+
+    def __init__(self, body: bytes, mimetype: str):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = hashlib.sha1(body).hexdigest()
+
+
+def report_rows(cached_report, report_type: str, order: str) -> list:
+    """Return rows of report type in order. Pilots are sorted by code"""
+    if report_type == 'report':
+        rows = cached_report.qualification_report
+    else:
+        rows = cached_report.derive('sorted_pilots',
+                                    lambda report: sorted(report.pilots))
+    if order == 'desc':
+        rows = rows[::-1]
+    return rows
+
+
+def build_response_variants(cached_report) -> dict:
+    """Serialize report into every (report type, format, order) variant.
+    Return read-only dict with ResponseVariant values"""
+    variants = {}
+    with metrics.stage_timer('serialize'):
+        for report_type in REPORT_TYPES:
+            for order in ORDERS:
+                rows = report_rows(cached_report, report_type, order)
+                for fmt in FORMATS:
+                    body = ''.join(serializers.serialize(rows, report_type,
+                                                         fmt))
+                    variants[report_type, fmt, order] = ResponseVariant(
+                        body.encode(), serializers.MIMETYPES[fmt])
+    return MappingProxyType(variants)
+
+
+def check_report_request(api_version: str, report_type: str, fmt: str,
+                         order: str) -> str | None:
+    """Return description of error in report request, None if request is
+    valid"""
+    if "v1" != api_version:
+        return f"not supported api version: {api_version}"
+    if report_type not in REPORT_TYPES:
+        return f"not supported report type: {report_type}"
+    if fmt not in FORMATS:
+        return f"not supported format: {fmt}"
+    if order not in ORDERS:
+        return f"not supported order: {order}"
+    return None
+
+
+class ReportQuery(NamedTuple):
+    """Selection and projection of report rows"""
+    order: str = 'asc'
+    team: str | None = None
+    min_pos: int | None = None
+    max_pos: int | None = None
+    offset: int = 0
+    limit: int | None = None
+    fields: tuple | None = None  # None - all fields of schema
+
+    def is_default(self) -> bool:
+        """Return True if query selects all rows with all fields"""
+        return self._replace(order='asc') == ReportQuery()
+
+    def key(self) -> str:
+        """Return normalized query string, used in ETag"""
+        params = {name: value for name, value in self._asdict().items()
+                  if value is not None and name != 'fields'}
+        if self.fields is not None:
+            params['fields'] = ','.join(self.fields)
+        return urlencode(params)
+
+
+def _int_param(args, name: str, minimum: int) -> int | None:
+    value = args.get(name)
+    if value is None:
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        number = None
+    if number is None or number < minimum:
+        raise ValueError(f"{name} must be integer not less than {minimum}: "
+                         f"{value}")
+    return number
+
+
+def parse_report_query(args, report_type: str) -> ReportQuery:
+    """Return selection of rows from query parameters order, team, min_pos,
+    max_pos, offset, limit and fields (comma separated). Raise ValueError
+    with description of invalid parameter"""
+    fields = None
+    if args.get('fields'):
+        schema_fields = serializers.SCHEMAS[report_type][2]
+        fields = tuple(dict.fromkeys(args['fields'].split(',')))
+        for field in fields:
+            if field not in schema_fields:
+                raise ValueError(f"unknown field of {report_type}: {field}")
+    min_pos = _int_param(args, 'min_pos', 1)
+    max_pos = _int_param(args, 'max_pos', 1)
+    if report_type != 'report' and (min_pos or max_pos):
+        raise ValueError("min_pos and max_pos are supported only by report")
+    team = args.get('team')
+    return ReportQuery(args.get('order', 'asc'),
+                       team.upper() if team else None, min_pos, max_pos,
+                       _int_param(args, 'offset', 0) or 0,
+                       _int_param(args, 'limit', 0), fields)
+
+
+def _report_by_team(cached_report) -> dict:
+    by_team = {}
+    for row in cached_report.qualification_report:
+        by_team.setdefault(row[2].upper(), []).append(row)
+    return by_team
+
+
+def _pilots_by_team(cached_report) -> dict:
+    by_team = {}
+    for row in report_rows(cached_report, 'pilots', 'asc'):
+        by_team.setdefault(row[2].upper(), []).append(row)
+    return by_team
+
+
+def select_rows(cached_report, report_type: str, query: ReportQuery) -> list:
+    """Return rows of report type selected by query. Rows of team come from
+    index by team, positions are found by binary search, offset and limit
+    are applied as slice, so only selected rows are copied"""
+    if query.team is None:
+        rows = report_rows(cached_report, report_type, 'asc')
+    elif report_type == 'report':
+        rows = cached_report.derive('report_by_team', _report_by_team).get(
+            query.team, [])
+    else:
+        rows = cached_report.derive('pilots_by_team', _pilots_by_team).get(
+            query.team, [])
+    low, high = 0, len(rows)
+    if query.min_pos is not None:
+        low = bisect.bisect_left(rows, query.min_pos, key=lambda row: row[0])
+    if query.max_pos is not None:
+        high = bisect.bisect_right(rows, query.max_pos,
+                                   key=lambda row: row[0])
+    if query.order == 'asc':
+        start = low + query.offset
+        stop = high if query.limit is None else min(high, start + query.limit)
+        rows = rows[start:stop]
+    else:
+        stop = high - query.offset
+        start = low if query.limit is None else max(low, stop - query.limit)
+        rows = rows[start:stop][::-1] if start < stop else []
+    if query.fields is not None:
+        schema_fields = serializers.SCHEMAS[report_type][2]
+        indexes = [schema_fields.index(field) for field in query.fields]
+        rows = [[row[i] for i in indexes] for row in rows]
+    return rows
+
+
+def driver_to_xml_et(driver: dict) -> bytes:
+    """Convert driver result to XML. Return xml bytes"""
+    root = ET.Element('driver')
+    for key, value in driver.items():
+        element = ET.SubElement(root, key)
+        element.text = '' if value is None else str(value)
+    return ET.tostring(root, encoding="utf-8", method="xml")
+
+
+def driver_to_dict(record) -> dict:
+    """Return dict with code, name, car, position and time of driver"""
+    position = time = None
+    if record.result is not None:
+        position, time = record.result.position, record.result.time
+    return {'code': record.code, 'name': record.name, 'car': record.car,
+            'position': position, 'time': time}
 
-    def get_json_response(self):
-        json_report = jsonify({'Monaco Q1 Results': self.current_report})
-        resp = make_response(json_report, 200)
-        resp.mimetype = r'application\json'
-        return resp
 
-    def get_xml_response(self):
-        if self.current_report == self.qualification_report:
-            report_xml = qual_report_to_xml_et(self.current_report)
-        else:
-            report_xml = pilots_report_to_xml_et(self.current_report)
-        resp = make_response(report_xml, 200)
-        resp.mimetype = r'application\xml'
-        return resp
+class FOneQReport(Resource):
 
     def get(self, api_version, report_type):
         """This api intended to get report of Monaco 2018 qualification (Q1)
@@ -152,38 +387,402 @@ class FOneQReport(Resource):
       - name: format
         in: query
         type: string
-        description: format of retrieved data (xml or json)
+        description: format of retrieved data (json, xml, ndjson or csv)
+      - name: order
+        in: query
+        type: string
+        description: sorting order (asc or desc)
+      - name: limit
+        in: query
+        type: integer
+        minimum: 0
+        description: maximum number of rows, for example 10 for top 10
+      - name: offset
+        in: query
+        type: integer
+        minimum: 0
+        description: number of rows skipped before the first returned row
+      - name: team
+        in: query
+        type: string
+        description: only rows of team (car), case insensitive
+      - name: min_pos
+        in: query
+        type: integer
+        minimum: 1
+        description: first position of report (only report type)
+      - name: max_pos
+        in: query
+        type: integer
+        minimum: 1
+        description: last position of report (only report type)
+      - name: fields
+        in: query
+        type: string
+        description: comma separated fields of rows, for report
+          position_number, pilot, car, time and for pilots code, name, car
     produces:
       - application/json
       - application/xml
+      - application/x-ndjson
+      - text/csv
     responses:
       404:
-        description: wrong api or report type or format
+        description: wrong api or report type, format or query parameter
+      304:
+        description: data was not modified since ETag from If-None-Match
       200:
         description: requested data table"""
 
-        if not self.qualification_report:
-            self.qualification_report, self.pilots = f_one.build_report(
-                self.laps_dir)
+        resp_format = request.args.get("format", "json")
+        order = request.args.get("order", "asc")
+        error = check_report_request(api_version, report_type, resp_format,
+                                     order)
+        if error is not None:
+            abort(404, description=error)
+        try:
+            query = parse_report_query(request.args, report_type)
+        except ValueError as query_error:
+            abort(404, description=str(query_error))
+        cached_report = repository.get_report()
+        if cached_report is None:
+            abort(404, description="report data is not available")
+        if not query.is_default() or (
+                len(cached_report.qualification_report)
+                + len(cached_report.pilots)
+                > current_app.config['PRECOMPUTE_MAX_ROWS']):
+            rows = select_rows(cached_report, report_type, query)
+            chunks = serializers.serialize(rows, report_type, resp_format,
+                                           query.fields)
+            resp = Response((chunk.encode() for chunk in chunks),
+                            mimetype=serializers.MIMETYPES[resp_format])
+            resp.set_etag(f'{cached_report.version}-{report_type}-'
+                          f'{resp_format}-{query.key()}')
+            return resp.make_conditional(request)
+        variants = cached_report.derive('api_variants', build_response_variants)
+        variant = variants[report_type, resp_format, order]
+        resp = make_response(variant.body, 200)
+        resp.mimetype = variant.mimetype
+        resp.set_etag(variant.etag)
+        return resp.make_conditional(request)
+
+
+class FOneDriver(Resource):
+
+    def get(self, api_version, code):
+        """Result of one driver of Monaco 2018 qualification (Q1)
+    Driver is found by driver code in index of report
+    Example:
+        /api/v1/drivers/SVF/?format=xml
+    ---
+
+    tags:
+      - Api for retrieving data about F1 Monaco qualification 2018 (Q1)
+    parameters:
+      - name: api_version
+        in: path
+        type: string
+        required: true
+        description: Version of api. Current v1
+      - name: code
+        in: path
+        type: string
+        required: true
+        description: driver code, for example SVF
+      - name: format
+        in: query
+        type: string
+        description: format of retrieved data (xml or json)
+    produces:
+      - application/json
+      - application/xml
+    responses:
+      404:
+        description: wrong api version, format or unknown driver code
+      304:
+        description: data was not modified since ETag from If-None-Match
+      200:
+        description: driver with position and time"""
 
         if "v1" != api_version:
             abort(404, description=f"not supported api version: {api_version}")
-        if "report" == report_type:
-            self.current_report = self.qualification_report
-        elif "pilots" == report_type:
-            self.current_report = self.pilots
-        else:
-            abort(404, description=f"not supported report type: {report_type}")
-        resp_format = request.args.get("format")
-        if "json" == resp_format or resp_format is None:
-            return self.get_json_response()
-        elif "xml" == resp_format:
-            return self.get_xml_response()
+        resp_format = request.args.get("format", "json")
+        if resp_format not in ('json', 'xml'):
+            abort(404, description=f"not supported format: {resp_format}")
+        cached_report = repository.get_report()
+        if cached_report is None:
+            abort(404, description="report data is not available")
+        record = cached_report.index.by_code.get(code.upper())
+        if record is None:
+            abort(404, description=f"unknown driver code: {code}")
+        driver = driver_to_dict(record)
+        if resp_format == 'json':
+            variant = ResponseVariant(
+                (json.dumps({'driver': driver}, ensure_ascii=True,
+                            sort_keys=True, separators=(',', ':')) + '\n'
+                 ).encode(), 'application/json')
         else:
+            variant = ResponseVariant(driver_to_xml_et(driver),
+                                      'application/xml')
+        resp = make_response(variant.body, 200)
+        resp.mimetype = variant.mimetype
+        resp.set_etag(variant.etag)
+        return resp.make_conditional(request)
+
+
+SSE_KEEPALIVE = 15  # seconds between comments that keep connection open
+
+
+def report_stream(api_version):
+    """Push live standings to client as Server-Sent Events. Every event has
+    the whole ranking, first event is sent right after connection
+    ---
+    tags:
+      - Api for retrieving data about F1 Monaco qualification 2018 (Q1)
+    parameters:
+      - name: api_version
+        in: path
+        type: string
+        required: true
+        description: Version of api. Current v1
+    produces:
+      - text/event-stream
+    responses:
+      404:
+        description: wrong api version, log files are not available or
+          report is read from database
+      200:
+        description: stream of standings events"""
+    if "v1" != api_version:
+        abort(404, description=f"not supported api version: {api_version}")
+    if current_app.config.get('REPORT_BACKEND', 'file') != 'file':
+        # Live standings are built from log files, not from database
+        abort(404, description="live timing needs file report backend")
+    session = live.get_session(current_app.config['LAPS_DIR'])
+    if session is None:
+        abort(404, description="report data is not available")
+
+    def events():
+        version = 0
+        # Stream ends when session is closed (live.close_sessions on server
+        # shutdown), so workers do not wait for clients to disconnect
+        while not session.closed:
+            version, payload = session.wait(version, timeout=SSE_KEEPALIVE)
+            if session.closed:
+                return
+            if payload is None:
+                yield ': keep-alive\n\n'
+            else:
+                yield f'id: {version}\nevent: standings\ndata: {payload}\n\n'
+
+    resp = Response(events(), mimetype='text/event-stream')
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.headers['X-Accel-Buffering'] = 'no'
+    return resp
+
+
+XML_ITEMS = {'drivers': 'driver', 'teams': 'team', 'outliers': 'lap',
+             'unreliable': 'code', 'diagnostics': 'diagnostic'}
+
+
+def _to_xml_element(parent, key: str, value):
+    element = ET.SubElement(parent, key)
+    if isinstance(value, dict):
+        for child_key, child_value in value.items():
+            _to_xml_element(element, child_key, child_value)
+    elif isinstance(value, list):
+        for item in value:
+            _to_xml_element(element, XML_ITEMS.get(key, 'item'), item)
+    else:
+        element.text = '' if value is None else str(value)
+
+
+def analytics_to_xml_et(analytics: dict) -> bytes:
+    """Convert analytics to XML. Lists are elements with one child element
+    per item. Return xml bytes"""
+    root = ET.Element('analytics')
+    for key, value in analytics.items():
+        _to_xml_element(root, key, value)
+    return ET.tostring(root, encoding="utf-8", method="xml")
+
+
+def build_analytics_variants(cached_report, source) -> dict:
+    """Analyze laps of source repository and serialize result to JSON and
+    XML. Return read-only dict with ResponseVariant values"""
+    # NumPy is imported on first analytics request, not with the app
+    from f_one import analytics
+    laps = source.laps()
+    if laps is None:
+        return MappingProxyType({})
+    with metrics.stage_timer('analytics'):
+        result = analytics.analyze(laps, source.cut_line())
+    return MappingProxyType({
+        'json': ResponseVariant(
+            (json.dumps({'analytics': result}, ensure_ascii=True,
+                        sort_keys=True, separators=(',', ':')) + '\n'
+             ).encode(), 'application/json'),
+        'xml': ResponseVariant(analytics_to_xml_et(result), 'application/xml'),
+    })
+
+
+class FOneAnalytics(Resource):
+
+    def get(self, api_version):
+        """Lap analytics of Monaco 2018 qualification (Q1)
+    Best lap of every driver with gap to pole and to the car ahead, margin to
+    the cut line, percentile band, team best and mean lap, percentiles of lap
+    times and outlier laps. Laps with not positive time or modified z-score
+    more than 3.5 are outliers and are not used for best laps.
+    Example:
+        /api/v1/analytics/?format=xml
+    ---
+
+    tags:
+      - Api for retrieving data about F1 Monaco qualification 2018 (Q1)
+    parameters:
+      - name: api_version
+        in: path
+        type: string
+        required: true
+        description: Version of api. Current v1
+      - name: format
+        in: query
+        type: string
+        description: format of retrieved data (xml or json)
+    produces:
+      - application/json
+      - application/xml
+    responses:
+      404:
+        description: wrong api version, format or data is not available
+      304:
+        description: data was not modified since ETag from If-None-Match
+      200:
+        description: analytics of laps"""
+
+        if "v1" != api_version:
+            abort(404, description=f"not supported api version: {api_version}")
+        resp_format = request.args.get("format", "json")
+        if resp_format not in ('json', 'xml'):
             abort(404, description=f"not supported format: {resp_format}")
+        source = repository.get_repository(current_app.config)
+        cached_report = source.get()
+        if cached_report is None:
+            abort(404, description="report data is not available")
+        variants = cached_report.derive(
+            'analytics', lambda report: build_analytics_variants(report,
+                                                                 source))
+        if resp_format not in variants:
+            abort(404, description="report data is not available")
+        variant = variants[resp_format]
+        resp = make_response(variant.body, 200)
+        resp.mimetype = variant.mimetype
+        resp.set_etag(variant.etag)
+        return resp.make_conditional(request)
+
+
+def build_diagnostics_variants(diagnostics) -> dict:
+    """Serialize diagnostics of log files to JSON and XML. Return read-only
+    dict with ResponseVariant values"""
+    result = diagnostics.to_dict()
+    root = ET.Element('diagnostics')
+    for key, value in result.items():
+        _to_xml_element(root, key, value)
+    return MappingProxyType({
+        'json': ResponseVariant(
+            (json.dumps({'diagnostics': result}, ensure_ascii=True,
+                        sort_keys=True, separators=(',', ':')) + '\n'
+             ).encode(), 'application/json'),
+        'xml': ResponseVariant(ET.tostring(root, encoding="utf-8",
+                                           method="xml"), 'application/xml'),
+    })
+
+
+class FOneDiagnostics(Resource):
+
+    def get(self, api_version):
+        """Diagnostics of log files of Monaco 2018 qualification (Q1)
+    Problems found while log files are parsed: malformed lines, duplicate
+    driver codes or times, drivers without abbreviation, starts without end
+    and ends without start, implausible lap times and trailing whitespace.
+    Every kind is counted, at most 100 diagnostics of every kind are listed
+    (truncated is true if some are not listed).
+    Example:
+        /api/v1/diagnostics/?format=xml
+    ---
 
+    tags:
+      - Api for retrieving data about F1 Monaco qualification 2018 (Q1)
+    parameters:
+      - name: api_version
+        in: path
+        type: string
+        required: true
+        description: Version of api. Current v1
+      - name: format
+        in: query
+        type: string
+        description: format of retrieved data (xml or json)
+    produces:
+      - application/json
+      - application/xml
+    responses:
+      404:
+        description: wrong api version, format or diagnostics are not
+          available (database backend)
+      304:
+        description: data was not modified since ETag from If-None-Match
+      200:
+        description: diagnostics of log files"""
+
+        if "v1" != api_version:
+            abort(404, description=f"not supported api version: {api_version}")
+        resp_format = request.args.get("format", "json")
+        if resp_format not in ('json', 'xml'):
+            abort(404, description=f"not supported format: {resp_format}")
+        source = repository.get_repository(current_app.config)
+        cached_report = source.get()
+        if cached_report is None:
+            abort(404, description="report data is not available")
+        diagnostics = source.diagnostics()
+        if diagnostics is None:
+            abort(404, description="diagnostics are not available")
+        variants = cached_report.derive(
+            'diagnostics_variants',
+            lambda report: build_diagnostics_variants(diagnostics))
+        variant = variants[resp_format]
+        resp = make_response(variant.body, 200)
+        resp.mimetype = variant.mimetype
+        resp.set_etag(variant.etag)
+        return resp.make_conditional(request)
+
+
+def init_app(app: Flask):
+    """Register API resources and API docs on app. Flasgger (with jsonschema
+    and yaml) is imported only if SWAGGER_ENABLED config value is True"""
+    api = Api(app)
+    api.add_resource(FOneQReport,
+                     '/api/<string:api_version>/<string:report_type>/')
+    api.add_resource(FOneDriver,
+                     '/api/<string:api_version>/drivers/<string:code>/')
+    api.add_resource(FOneAnalytics, '/api/<string:api_version>/analytics/')
+    api.add_resource(FOneDiagnostics,
+                     '/api/<string:api_version>/diagnostics/')
+    app.add_url_rule('/api/<string:api_version>/report/stream/',
+                     view_func=report_stream)
+    if app.config.get('SWAGGER_ENABLED', True):
+        from flasgger import Swagger
+        Swagger(app)
+
+
+def __getattr__(name: str):
+    """Module attribute app is the default app of app module"""
+    if name == 'app':
+        import app
+        return app.get_app()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
-api.add_resource(FOneQReport, '/api/<string:api_version>/<string:report_type>/')
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    from app import create_app
+    create_app().run(debug=True)
@@ -4,74 +4,323 @@ Report is build in f_one module. Web interface provides whole report, that can b
 sorted ascending or descending, pilots info and report for particular pilot.
 
 Functions:
+    make_config(config: dict = None) -> Config:
+    Return config with defaults, FLASK_* environment variables and config
+
+    configure_database(config):
+    Point models.db to DATABASE file with SQLITE_PRAGMAS of config
+
+    live_timing(config) -> bool:
+    Return True if report page follows live standings (file backend only)
+
+    create_app(config: dict = None) -> Flask:
+    Create Flask app with web pages and API
+
+    get_app() -> Flask:
+    Return app created with default config, create it on first call
+
     pilots_info():
     Return a list with information about pilots to template
 
     report():
-    Call build_report function of f_one module and return render_template obj
+    Get cached report built by f_one module and return render_template obj
     with content dict. Content has qualification report
 
+    page_response(cached_report, key: tuple, render_page) -> Response:
+    Return page from page cache with ETag, Cache-Control and encoding
+
+    metrics_endpoint():
+    Return metrics in Prometheus text format
+
+    ready():
+    Return 200 with report version if report is loaded, 503 otherwise
+
+Reports are taken from repository module: log files (parsed again only when
+they change) or SQLite database, depending on REPORT_BACKEND config value.
+
+Duration of every request is observed per route, metrics are available on
+/metrics. Requests that raise are observed with status 500 by teardown hook,
+after request hooks are not called for them. If PROFILING_ENABLED config value is True, request with
+X-Profile header is profiled by sampling profiler; collapsed stacks are
+available on /metrics/profiles/<id> where id is sent in X-Profile-Id header.
+
+With db backend every request takes pooled SQLite connection in before
+request hook and returns it in teardown hook. DATABASE and SQLITE_PRAGMAS
+config values select database file and override models.PRAGMAS.
+
+Report and pilots pages are rendered once per data version and query
+(page_cache module, PAGE_CACHE_SIZE pages), compressed with
+PAGE_CACHE_ENCODINGS and sent with ETag and Cache-Control max-age of
+PAGE_MAX_AGE seconds (0 - browsers revalidate every time).
+
+Importing this module does not create the app: create_app() builds it, and
+module attribute app is created on first use for code that imports it.
+
 """
 
-from flask import Flask, render_template, request
+from flask import Blueprint, Config, Flask, Response, abort, current_app, g, \
+    render_template, request
+import collections
+import itertools
+import os
+from pathlib import Path
 import sys
-from f_one import f_one
+import threading
+import time
+import api
+import models
+import page_cache
+import repository
+from f_one import metrics
+
+DEFAULT_CONFIG = dict(
+    REPORT_BACKEND='file',  # 'file' - parse log files, 'db' - query f1.sqlite3
+    LAPS_DIR='static/data',
+    REPORT_EVENT=None,
+    REPORT_SESSION='Q1',
+    LIVE_TIMING=True,  # report page subscribes to /api/v1/report/stream/,
+    # only with file backend: live standings are built from log files
+    PRECOMPUTE_MAX_ROWS=10000,  # larger API responses are streamed
+    PROFILING_ENABLED=False,  # allow X-Profile header to profile request
+    PROFILES_KEPT=20,
+    SWAGGER_ENABLED=True,  # API docs on /apidocs
+    DATABASE=None,  # path to SQLite file, None - models.DATABASE_PATH
+    SQLITE_PRAGMAS={},  # override models.PRAGMAS, e.g. {"mmap_size": 0}
+    PAGE_CACHE_SIZE=64,  # rendered HTML pages kept, 0 - no page cache
+    PAGE_CACHE_ENCODINGS=['gzip'],  # 'gzip' and 'br' (needs brotli)
+    PAGE_MAX_AGE=0,  # Cache-Control max-age of pages in seconds
+)
+
+web = Blueprint('web', __name__)
+profiles = collections.OrderedDict()
+profile_ids = itertools.count(1)
+_app = None
+_app_lock = threading.Lock()
+
+
+def make_config(config: dict = None) -> Config:
+    """Return config with DEFAULT_CONFIG values, FLASK_* environment
+    variables and config argument"""
+    app_config = Config(Path(__file__).resolve().parent)
+    app_config.from_mapping(DEFAULT_CONFIG)
+    app_config.from_prefixed_env()
+    if config is not None:
+        app_config.update(config)
+    return app_config
+
+
+def live_timing(config) -> bool:
+    """Return True if report page follows live standings. Live standings
+    are built from log files in LAPS_DIR, so database reports are not
+    replaced by them"""
+    return config['LIVE_TIMING'] and config['REPORT_BACKEND'] == 'file'
+
+
+def configure_database(config):
+    """Point models.db to DATABASE file with SQLITE_PRAGMAS of config. Used
+    by create_app and by ASGI app, so both read the same database"""
+    if config['DATABASE'] is not None or config['SQLITE_PRAGMAS']:
+        models.configure(config['DATABASE'], **config['SQLITE_PRAGMAS'])
+
+
+def create_app(config: dict = None) -> Flask:
+    """Create Flask app with web pages and API. Config values are taken from
+    DEFAULT_CONFIG, FLASK_* environment variables and config argument.
+    Reports are not loaded here, they are built on first request"""
+    app = Flask(__name__)
+    app.config.update(make_config(config))
+    configure_database(app.config)
+    app.extensions['page_cache'] = page_cache.PageCache(
+        app.config['PAGE_CACHE_SIZE'], app.config['PAGE_CACHE_ENCODINGS'])
+    app.register_blueprint(web)
+    api.init_app(app)
+    return app
+
+
+def get_app() -> Flask:
+    """Return app created with default config, create it on first call"""
+    global _app
+    if _app is None:
+        with _app_lock:
+            if _app is None:
+                _app = create_app()
+    return _app
 
-app = Flask(__name__)
 
+def __getattr__(name: str):
+    """Module attribute app is created on first use (PEP 562), so importing
+    this module does not create the app"""
+    if name == 'app':
+        return get_app()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
-@app.route('/', methods=['GET'])
+
+@web.before_app_request
+def start_timer():
+    g.request_started = time.perf_counter()
+    if current_app.config['PROFILING_ENABLED'] and \
+            'X-Profile' in request.headers:
+        g.profiler = metrics.SamplingProfiler(threading.get_ident())
+        g.profiler.start()
+
+
+@web.before_app_request
+def open_db():
+    """Take pooled database connection for request of db backend"""
+    if current_app.config['REPORT_BACKEND'] == 'db':
+        models.db.connect(reuse_if_open=True)
+
+
+@web.teardown_app_request
+def close_db(exc):
+    """Return connection of request to the pool"""
+    if not models.db.is_closed():
+        models.db.close()
+
+
+def observe_duration(status: int):
+    """Observe duration of current request once, from after request or
+    teardown hook"""
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.http_duration.observe(time.perf_counter() - started, route,
+                                      request.method, status)
+
+
+@web.after_app_request
+def observe_request(response):
+    observe_duration(response.status_code)
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.stop()
+        profile_id = str(next(profile_ids))
+        profiles[profile_id] = profiler.collapsed()
+        while len(profiles) > current_app.config['PROFILES_KEPT']:
+            profiles.popitem(last=False)
+        response.headers['X-Profile-Id'] = profile_id
+    return response
+
+
+@web.teardown_app_request
+def observe_failed_request(exc):
+    """Observe request that raised, its response was not finalized"""
+    observe_duration(500)
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.stop()
+
+
+def render(template: str, **context) -> str:
+    """Render template and observe duration of render stage"""
+    with metrics.stage_timer('render'):
+        return render_template(template, **context)
+
+
+def page_response(cached_report, key: tuple, render_page) -> Response:
+    """Return page from page cache of app with ETag and Cache-Control.
+    Body is precompressed if client accepts one of cached encodings
+    Arguments:
+    cached_report -- Report the page is rendered from, its version
+    invalidates cached pages
+    key -- Route and normalized query arguments
+    render_page -- Function that renders page if it is not cached
+    """
+    page = current_app.extensions['page_cache'].get(cached_report.version,
+                                                    key, render_page)
+    encoding = request.accept_encodings.best_match(page.encoded)
+    resp = Response(page.encoded[encoding] if encoding else page.body,
+                    mimetype='text/html')
+    resp.set_etag(f'{page.etag}-{encoding}' if encoding else page.etag)
+    if encoding:
+        resp.content_encoding = encoding
+    if page.encoded:
+        resp.vary.add('Accept-Encoding')
+    resp.cache_control.public = True
+    resp.cache_control.max_age = current_app.config['PAGE_MAX_AGE']
+    return resp.make_conditional(request)
+
+
+@web.route('/', methods=['GET'])
 def index():
     return render_template('base.html')
 
 
-@app.route('/report/pilots', methods=['GET'])
+@web.route('/report/pilots', methods=['GET'])
 def pilots_info():
     """Return a list with information about pilots to template"""
-    laps_dir = 'static/data'
-    qualification_report, pilots, unreliable_data = f_one.build_report(laps_dir)
+    cached_report = repository.get_report()
     args = request.args
-    order = args.get('order')
+    order = 'desc' if args.get('order') == 'desc' else 'asc'
     pilot_id = args.get('pilot_id')
     if pilot_id:
-        pilot_name = next(p[1] for p in pilots if p[0] == pilot_id)
-        try:
-            pilot_result = next(r for r in qualification_report
-                                if r[1] == pilot_name)
-        except StopIteration:
-            pilot_result = next(r for r in unreliable_data
-                                if r[1] == pilot_name)
-        content = {'results': [pilot_result],
+        record = cached_report.index.by_code.get(pilot_id)
+        if record is None or record.result is None:
+            abort(404, description=f'Cannot find pilot {pilot_id}')
+        content = {'results': [record.result],
                    'reversed': False
                    }
-        return render_template('report.html', content=content)
-    pilots.sort()
-    if order == 'desc':
-        pilots.reverse()
-    return render_template('pilots.html', content=pilots)
+        return page_response(cached_report, ('pilot', pilot_id),
+                             lambda: render('report.html', content=content))
+    return page_response(
+        cached_report, ('pilots', order),
+        lambda: render('pilots.html', content=sorted(
+            cached_report.pilots, reverse=order == 'desc')))
 
 
-@app.route('/report')
+@web.route('/report')
 def report():
-    """Call build_report function of f_one module and return render_template obj
+    """Get cached report built by f_one module and return render_template obj
      with content dict. Content has qualification report"""
-    laps_dir = 'static/data'
-    qualification_report, pilots, unreliable_data = f_one.build_report(laps_dir)
-    results_reversed = False
-    args = request.args
-    order = args.get('order')
-    if order == 'desc':  # and not results_reversed:
-        qualification_report.reverse()
-        results_reversed = True
-    content = {'results': qualification_report,
-               'reversed': results_reversed}
+    cached_report = repository.get_report()
+    order = 'desc' if request.args.get('order') == 'desc' else 'asc'
+
+    def render_report():
+        qualification_report = cached_report.qualification_report
+        results_reversed = False
+        if order == 'desc':  # and not results_reversed:
+            # Cached report is shared between requests, do not reverse in place
+            qualification_report = qualification_report[::-1]
+            results_reversed = True
+        cut_line = repository.cut_line()
+        content = {'results': qualification_report,
+                   'reversed': results_reversed,
+                   'first_out': None if cut_line is None else cut_line + 1,
+                   'live': live_timing(current_app.config)}
+        return render('report.html', content=content)
+
+    return page_response(cached_report, ('report', order), render_report)
+
+
+@web.route('/metrics')
+def metrics_endpoint():
+    """Return metrics in Prometheus text format"""
+    return Response(metrics.render(),
+                    content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@web.route('/ready')
+def ready():
+    """Readiness of process: 200 with report version and pid if report is
+    loaded, 503 if report data is not available"""
+    cached_report = repository.get_report()
+    if cached_report is None:
+        return {'status': 'unavailable', 'pid': os.getpid()}, 503
+    return {'status': 'ready', 'version': cached_report.version,
+            'pid': os.getpid()}
+
 
-    return render_template('report.html', content=content)
+@web.route('/metrics/profiles/<profile_id>')
+def profile(profile_id):
+    """Return collapsed stacks of profiled request"""
+    if profile_id not in profiles:
+        abort(404, description=f'Cannot find profile {profile_id}')
+    return Response(profiles[profile_id], mimetype='text/plain')
 
 
 if __name__ == '__main__':
     if len(sys.argv) > 1:
         arg_host, arg_port = sys.argv[1].split(':')
-        app.run(host=arg_host, port=arg_port)
+        create_app().run(host=arg_host, port=arg_port)
     else:
-        app.run(debug=True)
+        create_app().run(debug=True)
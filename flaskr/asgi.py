@@ -0,0 +1,238 @@
+"""Async (ASGI) entry point of REST API
+Serves the same contract as api.py for /api/<version>/<report_type>/ and
+/api/<version>/drivers/<code>/ without a thread per request: the event loop
+handles all connections, blocking work runs in a bounded thread pool.
+
+- Reading and parsing log files (file backend) and SQLite queries (db backend)
+run in the pool of ASYNC_IO_THREADS threads, never on the event loop. With
+the db backend every pool thread keeps its own SQLite connection.
+- Concurrent requests are coalesced: while report is loaded (data version
+checked, report built or serialized), other requests wait for the same
+task instead of doing the same work again.
+
+Run with any ASGI server, for example:
+    uvicorn asgi:app --app-dir flaskr
+
+Classes:
+    AsyncApi(config: dict = None)
+    ASGI application with report API
+
+Functions:
+    create_asgi_app(config: dict = None) -> AsyncApi:
+    Return ASGI app with config like app.create_app
+
+Vars:
+    app - ASGI app with default config
+"""
+
+import asyncio
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+from werkzeug.http import parse_etags, quote_etag
+import api
+import repository
+import serializers
+from app import configure_database, make_config
+from f_one import metrics
+
+REPORT_ROUTE = re.compile(r'^/api/(?P<api_version>[^/]+)/'
+                          r'(?P<report_type>[^/]+)/$')
+DRIVER_ROUTE = re.compile(r'^/api/(?P<api_version>[^/]+)/drivers/'
+                          r'(?P<code>[^/]+)/$')
+DEFAULT_IO_THREADS = 4
+
+
+class AsyncApi:
+    """ASGI application with report API
+    Arguments:
+    config -- Config values, see app.DEFAULT_CONFIG. ASYNC_IO_THREADS sets
+    size of thread pool for file and database access (default 4)
+    """
+
+    def __init__(self, config: dict = None):
+        self.config = make_config(config)
+        configure_database(self.config)
+        self.repository = repository.get_repository(self.config)
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.config.get('ASYNC_IO_THREADS',
+                                        DEFAULT_IO_THREADS),
+            thread_name_prefix='f1-io')
+        self._inflight = {}
+
+    async def coalesce(self, key, func, *args):
+        """Run func(*args) in thread pool. Concurrent calls with the same key
+        share one call and get its result"""
+        future = self._inflight.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self.executor, func, *args)
+            self._inflight[key] = future
+            future.add_done_callback(
+                lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(future)
+
+    def load_report(self):
+        """Return current report and its response variants (None if report
+        is too big to keep serialized). Runs in thread pool"""
+        cached_report = self.repository.get()
+        if cached_report is None:
+            return None, None
+        if (len(cached_report.qualification_report) + len(cached_report.pilots)
+                > self.config['PRECOMPUTE_MAX_ROWS']):
+            return cached_report, None
+        return cached_report, cached_report.derive(
+            'api_variants', api.build_response_variants)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        started = time.perf_counter()
+        route, status = 'unmatched', 404
+        try:
+            if scope['method'] != 'GET':
+                status = 405
+                await self.send_error(send, status, 'method not allowed')
+                return
+            args = {key: values[0] for key, values in parse_qs(
+                scope['query_string'].decode()).items()}
+            headers = dict(scope['headers'])
+            if match := DRIVER_ROUTE.match(scope['path']):
+                route = '/api/<string:api_version>/drivers/<string:code>/'
+                status = await self.driver(send, args, headers,
+                                           **match.groupdict())
+            elif match := REPORT_ROUTE.match(scope['path']):
+                route = '/api/<string:api_version>/<string:report_type>/'
+                status = await self.report(send, args, headers,
+                                           **match.groupdict())
+            else:
+                await self.send_error(send, status, 'not found')
+        finally:
+            metrics.http_duration.observe(time.perf_counter() - started,
+                                          route, scope['method'], status)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def report(self, send, args: dict, headers: dict, api_version: str,
+                     report_type: str) -> int:
+        resp_format = args.get('format', 'json')
+        order = args.get('order', 'asc')
+        error = api.check_report_request(api_version, report_type,
+                                         resp_format, order)
+        if error is not None:
+            return await self.send_error(send, 404, error)
+        try:
+            query = api.parse_report_query(args, report_type)
+        except ValueError as query_error:
+            return await self.send_error(send, 404, str(query_error))
+        cached_report, variants = await self.coalesce('report',
+                                                      self.load_report)
+        if cached_report is None:
+            return await self.send_error(send, 404,
+                                         'report data is not available')
+        if variants is None or not query.is_default():
+            etag = (f'{cached_report.version}-{report_type}-{resp_format}-'
+                    f'{query.key()}')
+            if self.not_modified(headers, etag):
+                return await self.send_not_modified(send, etag)
+            rows = api.select_rows(cached_report, report_type, query)
+            chunks = serializers.serialize(rows, report_type, resp_format,
+                                           query.fields)
+            await self.start_response(send, 200,
+                                      serializers.MIMETYPES[resp_format],
+                                      etag)
+            for chunk in chunks:
+                await send({'type': 'http.response.body',
+                            'body': chunk.encode(), 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+            return 200
+        variant = variants[report_type, resp_format, order]
+        return await self.send_variant(send, headers, variant)
+
+    async def driver(self, send, args: dict, headers: dict, api_version: str,
+                     code: str) -> int:
+        if "v1" != api_version:
+            return await self.send_error(
+                send, 404, f"not supported api version: {api_version}")
+        resp_format = args.get('format', 'json')
+        if resp_format not in ('json', 'xml'):
+            return await self.send_error(
+                send, 404, f"not supported format: {resp_format}")
+        cached_report, _ = await self.coalesce('report', self.load_report)
+        if cached_report is None:
+            return await self.send_error(send, 404,
+                                         'report data is not available')
+        record = cached_report.index.by_code.get(code.upper())
+        if record is None:
+            return await self.send_error(send, 404,
+                                         f"unknown driver code: {code}")
+        driver = api.driver_to_dict(record)
+        if resp_format == 'json':
+            variant = api.ResponseVariant(
+                (json.dumps({'driver': driver}, ensure_ascii=True,
+                            sort_keys=True, separators=(',', ':')) + '\n'
+                 ).encode(), 'application/json')
+        else:
+            variant = api.ResponseVariant(api.driver_to_xml_et(driver),
+                                          'application/xml')
+        return await self.send_variant(send, headers, variant)
+
+    @staticmethod
+    def not_modified(headers: dict, etag: str) -> bool:
+        if_none_match = headers.get(b'if-none-match')
+        return if_none_match is not None and \
+            parse_etags(if_none_match.decode()).contains(etag)
+
+    @staticmethod
+    async def start_response(send, status: int, mimetype: str,
+                             etag: str = None, length: int = None):
+        headers = [(b'content-type', mimetype.encode())]
+        if etag is not None:
+            headers.append((b'etag', quote_etag(etag).encode()))
+        if length is not None:
+            headers.append((b'content-length', str(length).encode()))
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': headers})
+
+    async def send_variant(self, send, headers: dict, variant) -> int:
+        if self.not_modified(headers, variant.etag):
+            return await self.send_not_modified(send, variant.etag)
+        await self.start_response(send, 200, variant.mimetype, variant.etag,
+                                  len(variant.body))
+        await send({'type': 'http.response.body', 'body': variant.body})
+        return 200
+
+    async def send_not_modified(self, send, etag: str) -> int:
+        await send({'type': 'http.response.start', 'status': 304,
+                    'headers': [(b'etag', quote_etag(etag).encode())]})
+        await send({'type': 'http.response.body', 'body': b''})
+        return 304
+
+    async def send_error(self, send, status: int, description: str) -> int:
+        """Send error in format of flask_restful abort"""
+        body = (json.dumps({'description': description}) + '\n').encode()
+        await self.start_response(send, status, 'application/json',
+                                  length=len(body))
+        await send({'type': 'http.response.body', 'body': body})
+        return status
+
+
+def create_asgi_app(config: dict = None) -> AsyncApi:
+    """Return ASGI app with config like app.create_app"""
+    return AsyncApi(config)
+
+
+app = create_asgi_app()
@@ -1,64 +1,449 @@
+"""Store Formula 1 qualification data in f1.sqlite3
+Log files are ingested incrementally: for every file offset after the last
+stored line is kept in IngestWatermark table, so running main() again stores
+only lines appended since the previous run. Lines are inserted in batches of
+BATCH_SIZE rows inside one transaction per file. Laps are upserted by
+(event, session, driver, lap) and drivers by driver code, so ingesting the
+same lines twice does not create duplicates.
+
+If a log file was truncated or replaced (its size is less than the stored
+offset or data before the offset changed), laps of its session are removed
+and both logs of the session are ingested from the beginning.
+
+Whole archives are loaded by load_season() without watermarks: laps are
+streamed from parser generators in batches of batch_size rows, every
+transaction commits transaction_batches batches, so memory does not grow
+with the archive. Batches are stored with insert_many or, with fast=True,
+with one prepared upsert statement run by executemany of sqlite3 cursor,
+which skips building SQL for every batch. Progress and throughput are
+printed after every transaction. Laps of drivers missing from
+abbreviations.txt are skipped and printed like in ingest(), so foreign key
+of a lap does not fail after part of the session was committed.
+
+Ranked results of every stored session are materialized in Standings table:
+refresh_standings() replaces rows of the sessions touched by ingest() or
+load_season() in one transaction, so readers see either old or new
+standings and the web app reads them with an index range scan instead of
+aggregating laps.
+
+Every write transaction increments models.DataVersion, cached reports of the
+web app are built again when it changes.
+
+    python db.py --season archive/2018 --batch-size 5000 --fast
+
+Functions:
+    ingest(laps_dir: str = 'static/data') -> dict:
+    Store new lines of log files in directory. Return number of stored lines
+    of every file
+
+    iter_laps_files(laps_dir: str = 'static/data', event: str = None,
+                    session: str = None) -> Iterator[tuple]:
+    Yield (event, session, code, lap, start, stop, lap_time) of every lap
+
+    known_laps(laps, skipped: dict) -> Iterator[tuple]:
+    Yield laps of stored drivers, count laps of unknown codes in skipped
+
+    bulk_insert(model, fields: list, rows, conflict_target: list,
+                preserve: list, batch_size: int = BATCH_SIZE,
+                transaction_batches: int = TRANSACTION_BATCHES,
+                fast: bool = False, progress=None) -> int:
+    Upsert rows of iterable in batches and chunked transactions
+
+    load_season(root, batch_size: int = BATCH_SIZE, fast: bool = False,
+                progress=print_progress) -> int:
+    Store drivers and laps of every session of season archive
+
+    refresh_standings(sessions=None) -> int:
+    Replace materialized standings of (event, session) pairs
+
+    create_tables() -> bool:
+    Create tables if they are not exist, migrate existing tables
+"""
+
+import argparse
+import hashlib
+import time
+from typing import Iterator
+from peewee import chunked, fn
 from f_one.f_one import generate_file_paths
-from models import db, Driver, Qualification
-import datetime
+from f_one import aggregate, f_one, parser, season
+from playhouse.migrate import SqliteMigrator, migrate
+from models import (db, bump_data_version, ranked_query, DataVersion, Driver,
+                    Qualification, IngestWatermark, Standings)
 
+BATCH_SIZE = 100  # rows in one insert_many, SQLite limits variables per query
+TRANSACTION_BATCHES = 100  # batches committed together by bulk_insert
+CHECKSUM_WINDOW = 4096
+LAP_KEY = [Qualification.event, Qualification.session,
+           Qualification.driver_code, Qualification.lap]
+LAP_FIELDS = LAP_KEY + [Qualification.start, Qualification.stop,
+                        Qualification.lap_time]
+DRIVER_FIELDS = [Driver.driver_code, Driver.driver_name, Driver.car]
+STANDINGS_FIELDS = [Standings.event, Standings.session, Standings.position,
+                    Standings.driver_code, Standings.driver_name,
+                    Standings.car, Standings.best_lap_ms, Standings.time,
+                    Standings.reliable]
 
-def parse_drivers_files() -> list:
-    paths = generate_file_paths('static/data')
-    drivers = []
-    abbreviations_file_path = paths['abbreviations.txt']  # abbreviations.txt
-    with open(abbreviations_file_path, 'r') as abbr:
-        for line in abbr.readlines():
-            if line == '\n':
-                continue
-            data = line.rstrip().split('_')
-            drivers.append((data[0], data[1], data[2]))
-    return drivers
-
-
-def parse_laps_files() -> list:
-    paths = generate_file_paths('static/data')
-    laps_time = {}
-    start_file_path = paths['start.log']
-    with open(start_file_path, 'r') as start:
-        for line in start.readlines():
-            if line == '\n':
-                continue
-            name = line[0:3]
-            time = line[3:].rstrip()
-            dt = datetime.datetime.strptime(time, '%Y-%m-%d_%H:%M:%S.%f')
-            laps_time[name] = [dt]
-
-    end_file_path = paths['end.log']
-    with open(end_file_path, 'r') as stop:
-        for line in stop.readlines():
-            if line == '\n':
-                continue
-            name = line[0:3]
-            time = line[3:].rstrip()
-            dt = datetime.datetime.strptime(time, '%Y-%m-%d_%H:%M:%S.%f')
-            laps_time[name].append(dt)
-            lap_time = (dt - laps_time[name][0]).total_seconds()
-            laps_time[name].append(lap_time)
-    result = []
-    for code, times in laps_time.items():
-        result.append((code, times[0], times[1], times[2]))
-    return result
+
+def parse_drivers_files(laps_dir: str = 'static/data') -> list:
+    paths = generate_file_paths(laps_dir)
+    return list(parser.iter_abbreviations(paths['abbreviations.txt']))
+
+
+def iter_laps_files(laps_dir: str = 'static/data', event: str = None,
+                    session: str = None) -> Iterator[tuple]:
+    """Yield (event, session, code, lap, start, stop, lap_time) of every lap
+    in directory. Event and session are taken from directory by default"""
+    paths = generate_file_paths(laps_dir)
+    if event is None or session is None:
+        dir_event, dir_session = aggregate.session_of(
+            paths['start.log'].parent)
+        event = dir_event if event is None else event
+        session = dir_session if session is None else session
+    laps = aggregate.pair_laps(parser.iter_timings(paths['start.log']),
+                               parser.iter_timings(paths['end.log']))
+    for code, lap, start_ms, end_ms in laps:
+        yield (event, session, code, lap, parser.ms_to_datetime(start_ms),
+               parser.ms_to_datetime(end_ms), (end_ms - start_ms) / 1000)
+
+
+def known_drivers() -> set:
+    """Return codes of stored drivers"""
+    return {code for code, in Driver.select(Driver.driver_code).tuples()}
+
+
+def known_laps(laps, skipped: dict) -> Iterator[tuple]:
+    """Yield laps of iter_laps_files whose driver is stored in database.
+    Laps of other codes would fail foreign key of Qualification, they are
+    counted in skipped dict (code -> number of laps)"""
+    drivers = known_drivers()
+    for lap in laps:
+        code = lap[2]
+        if code in drivers:
+            yield lap
+        else:
+            skipped[code] = skipped.get(code, 0) + 1
+
+
+def parse_laps_files(laps_dir: str = 'static/data') -> list:
+    """Return (event, session, code, lap, start, stop, lap_time) of every lap
+    in directory"""
+    return list(iter_laps_files(laps_dir))
 
 
 def store_drivers(drivers):
-    fields = [Driver.driver_code, Driver.driver_name, Driver.car]
     with db.atomic():
-        Driver.insert_many(drivers, fields=fields).execute()
+        for batch in chunked(drivers, BATCH_SIZE):
+            (Driver
+             .insert_many(batch, fields=DRIVER_FIELDS)
+             .on_conflict(conflict_target=[Driver.driver_code],
+                          preserve=[Driver.driver_name, Driver.car])
+             .execute())
+        bump_data_version()
 
 
 def store_laps_files(laps_time):
-    fields = [Qualification.driver_code,
-              Qualification.start,
-              Qualification.stop,
-              Qualification.lap_time]
+    """Upsert laps of iterable in one transaction"""
+    with db.atomic():
+        for batch in chunked(laps_time, BATCH_SIZE):
+            (Qualification
+             .insert_many(batch, fields=LAP_FIELDS)
+             .on_conflict(conflict_target=LAP_KEY,
+                          preserve=LAP_FIELDS[len(LAP_KEY):])
+             .execute())
+        bump_data_version()
+
+
+def upsert_sql(model, fields: list, conflict_target: list,
+               preserve: list) -> str:
+    """Return INSERT ... ON CONFLICT DO UPDATE statement with one row of
+    parameters, the same upsert as insert_many().on_conflict()"""
+    def columns(column_fields):
+        return ', '.join(f'"{field.column_name}"' for field in column_fields)
+    updates = ', '.join(
+        f'"{field.column_name}" = excluded."{field.column_name}"'
+        for field in preserve)
+    return (f'INSERT INTO "{model._meta.table_name}" ({columns(fields)}) '
+            f'VALUES ({", ".join("?" * len(fields))}) '
+            f'ON CONFLICT ({columns(conflict_target)}) '
+            f'DO UPDATE SET {updates}')
+
+
+def print_progress(model, rows: int, elapsed: float):
+    """Print number of stored rows and throughput"""
+    print(f'{model._meta.table_name}: {rows} rows, '
+          f'{rows / elapsed if elapsed else 0:.0f} rows/s')
+
+
+def bulk_insert(model, fields: list, rows, conflict_target: list,
+                preserve: list, batch_size: int = BATCH_SIZE,
+                transaction_batches: int = TRANSACTION_BATCHES,
+                fast: bool = False, progress=None) -> int:
+    """Upsert rows of iterable in batches, transaction_batches batches are
+    committed together. Rows are read from iterable one batch at a time.
+    Return number of stored rows
+    Arguments:
+    model, fields -- Model and fields of row values
+    rows -- Iterable of row tuples
+    conflict_target, preserve -- Unique key and fields updated on conflict
+    batch_size -- Rows in one statement (default BATCH_SIZE). insert_many
+    binds all values of batch, so batch_size * len(fields) must not exceed
+    SQLite variable limit; fast path has no such limit
+    transaction_batches -- Batches in one transaction
+    fast -- Run prepared upsert with cursor executemany instead of
+    insert_many (default False)
+    progress -- Function (model, rows, elapsed seconds) called after every
+    transaction (default None)
+    """
+    sql = upsert_sql(model, fields, conflict_target, preserve) if fast \
+        else None
+    stored = 0
+    started = time.perf_counter()
+    for transaction in chunked(chunked(rows, batch_size), transaction_batches):
+        with db.atomic():
+            for batch in transaction:
+                if fast:
+                    db.cursor().executemany(sql, batch)
+                else:
+                    (model
+                     .insert_many(batch, fields=fields)
+                     .on_conflict(conflict_target=conflict_target,
+                                  preserve=preserve)
+                     .execute())
+                stored += len(batch)
+            bump_data_version()
+        if progress is not None:
+            progress(model, stored, time.perf_counter() - started)
+    return stored
+
+
+def refresh_standings(sessions=None) -> int:
+    """Replace materialized standings of sessions in one transaction. Ranking
+    is models.ranked_query, the same as of repository.SqlRepository: drivers
+    by best lap, drivers without reliable laps at the end. Return number of
+    stored rows
+    Arguments:
+    sessions -- Iterable of (event, session), default None - every session
+    with laps in database
+    """
+    if sessions is None:
+        sessions = (Qualification
+                    .select(Qualification.event, Qualification.session)
+                    .distinct()
+                    .tuples())
+    stored = 0
+    with db.atomic():
+        for event, session in list(sessions):
+            Standings.delete().where(Standings.event == event,
+                                     Standings.session == session).execute()
+            rows = []
+            ranked = ranked_query(session, event, f_one.FILTERING)
+            for code, name, car, best in ranked:
+                best_ms = None if best is None else round(best * 1000)
+                position = None if best is None else len(rows) + 1
+                rows.append((event, session, position, code, name, car,
+                             best_ms, 'Unreliable' if best is None
+                             else aggregate.format_lap_time(best_ms),
+                             best is not None))
+            for batch in chunked(rows, BATCH_SIZE):
+                Standings.insert_many(batch, fields=STANDINGS_FIELDS).execute()
+            stored += len(rows)
+        bump_data_version()
+    return stored
+
+
+def load_season(root, batch_size: int = BATCH_SIZE, fast: bool = False,
+                progress=print_progress) -> int:
+    """Store drivers and laps of every session of season archive (see
+    f_one.season), event is path of event directory relative to root.
+    Laps are upserted, so archive can be loaded again. Laps of drivers
+    missing from abbreviations.txt are skipped and printed. Return number of
+    stored laps
+    Arguments:
+    root -- Root directory of season archive
+    batch_size -- Rows in one batch (default BATCH_SIZE)
+    fast -- Use executemany fast path (default False)
+    progress -- Function (model, rows, elapsed seconds) called after every
+    transaction (default print_progress)
+    """
+    stored = 0
+    for dir_path in season.discover_sessions(root):
+        event, session = season.event_name(dir_path, root)
+        store_drivers(parse_drivers_files(str(dir_path)))
+        skipped = {}
+        laps = known_laps(iter_laps_files(str(dir_path), event, session),
+                          skipped)
+        stored += bulk_insert(Qualification, LAP_FIELDS, laps, LAP_KEY,
+                              LAP_FIELDS[len(LAP_KEY):],
+                              batch_size=batch_size, fast=fast,
+                              progress=progress)
+        for code, count in skipped.items():
+            print(f'Unknown driver {code} in {dir_path}, {count} laps skipped')
+        refresh_standings([(event, session)])
+    return stored
+
+
+def _checksum(file, offset: int) -> str:
+    """Return checksum of up to CHECKSUM_WINDOW bytes before offset"""
+    begin = max(0, offset - CHECKSUM_WINDOW)
+    file.seek(begin)
+    return hashlib.sha1(file.read(offset - begin)).hexdigest()
+
+
+def read_watermark(path) -> tuple[IngestWatermark, bool]:
+    """Return watermark of file and False if file was not ingested before or
+    was truncated or replaced since previous run (offset is 0 then)"""
+    watermark = IngestWatermark.get_or_none(IngestWatermark.path == str(path))
+    if watermark is None:
+        return IngestWatermark(path=str(path), offset=0, checksum=''), False
+    with open(path, 'rb') as file:
+        size = file.seek(0, 2)
+        if (size < watermark.offset
+                or _checksum(file, watermark.offset) != watermark.checksum):
+            watermark.offset = 0
+            return watermark, False
+    return watermark, True
+
+
+def save_watermark(watermark: IngestWatermark, offset: int):
+    with open(watermark.path, 'rb') as file:
+        checksum = _checksum(file, offset)
+    (IngestWatermark
+     .insert(path=watermark.path, offset=offset, checksum=checksum)
+     .on_conflict_replace()
+     .execute())
+
+
+def iter_new_lines(path, offset: int):
+    """Yield (line, offset after line) for complete not empty lines written
+    after offset. Last line without line break is left for the next run"""
+    with open(path, 'rb') as file:
+        file.seek(offset)
+        for raw in file:
+            if not raw.endswith(b'\n'):
+                break
+            offset += len(raw)
+            line = raw.decode().rstrip()
+            if line:
+                yield line, offset
+
+
+def ingest_drivers(path) -> int:
+    """Upsert drivers from lines of abbreviations file added since previous
+    run. Return number of stored lines"""
+    watermark, _ = read_watermark(path)
+    offset = watermark.offset
+    drivers = []
+    for line, offset in iter_new_lines(path, offset):
+        fields = line.split('_', 2)
+        if len(fields) != 3:
+            print(f'Malformed line {line!r} in {path}, line skipped')
+            continue
+        drivers.append(tuple(fields))
+    with db.atomic():
+        store_drivers(drivers)
+        save_watermark(watermark, offset)
+    return len(drivers)
+
+
+def _last_laps(event: str, session: str, field) -> dict:
+    """Return (number, time) of the last lap with field set for every
+    driver"""
+    query = (Qualification
+             .select(Qualification.driver_code, fn.MAX(Qualification.lap),
+                     field)  # SQLite takes field of the row with MAX(lap)
+             .where(Qualification.event == event,
+                    Qualification.session == session,
+                    field.is_null(False))
+             .group_by(Qualification.driver_code)
+             .tuples())
+    return {code: (lap, logged) for code, lap, logged in query}
+
+
+def ingest_timings(path, event: str, session: str, field) -> int:
+    """Store start or stop times from lines of log added since previous run.
+    n-th line of driver in log is stored as lap n, line that repeats the
+    previous time of driver is a duplicate and is skipped, like in
+    aggregate.pair_laps. Return number of stored lines"""
+    watermark, _ = read_watermark(path)
+    last_laps = _last_laps(event, session, field)
+    drivers = known_drivers()
+    end = {'offset': watermark.offset}
+
+    def rows():
+        # Lines are read while batches are stored, offset of the last line
+        # is saved with the rows in the same transaction
+        for line, end['offset'] in iter_new_lines(path, end['offset']):
+            try:
+                code, ms = parser.parse_timing(line)
+            except ValueError:
+                print(f'Malformed line {line!r} in {path}, line skipped')
+                continue
+            if code not in drivers:
+                print(f'Unknown driver {code} in {path}, line skipped')
+                continue
+            logged = parser.ms_to_datetime(ms)
+            lap, last_logged = last_laps.get(code, (0, None))
+            if logged == last_logged:
+                print(f'Duplicate line {line!r} in {path}, line skipped')
+                continue
+            last_laps[code] = (lap + 1, logged)
+            yield event, session, code, lap + 1, logged
+
+    stored = 0
+    fields = LAP_KEY + [field]
     with db.atomic():
-        Qualification.insert_many(laps_time, fields=fields).execute()
+        for batch in chunked(rows(), BATCH_SIZE):
+            (Qualification
+             .insert_many(batch, fields=fields)
+             .on_conflict(conflict_target=LAP_KEY, preserve=[field])
+             .execute())
+            stored += len(batch)
+        save_watermark(watermark, end['offset'])
+        bump_data_version()
+    return stored
+
+
+def update_lap_times(event: str, session: str) -> int:
+    """Calculate lap time of laps that got both start and stop. Return number
+    of updated laps"""
+    seconds = (fn.julianday(Qualification.stop)
+               - fn.julianday(Qualification.start)) * 86400
+    return (Qualification
+            .update(lap_time=fn.ROUND(seconds, 3))
+            .where(Qualification.event == event,
+                   Qualification.session == session,
+                   Qualification.lap_time.is_null(),
+                   Qualification.start.is_null(False),
+                   Qualification.stop.is_null(False))
+            .execute())
+
+
+def ingest(laps_dir: str = 'static/data') -> dict:
+    """Store new lines of log files in directory. Return number of stored
+    lines of every file"""
+    paths = generate_file_paths(laps_dir)
+    if paths is None:
+        return {}
+    event, session = aggregate.session_of(paths['start.log'].parent)
+    start_path, end_path = paths['start.log'], paths['end.log']
+    if not (read_watermark(start_path)[1] and read_watermark(end_path)[1]):
+        # One of the logs is new or was replaced: lap numbers are not valid
+        # anymore, session is ingested again from the beginning
+        with db.atomic():
+            Qualification.delete().where(
+                Qualification.event == event,
+                Qualification.session == session).execute()
+            IngestWatermark.delete().where(IngestWatermark.path.in_(
+                [str(start_path), str(end_path)])).execute()
+    stored = {'abbreviations.txt': ingest_drivers(paths['abbreviations.txt']),
+              'start.log': ingest_timings(start_path, event, session,
+                                          Qualification.start),
+              'end.log': ingest_timings(end_path, event, session,
+                                        Qualification.stop)}
+    update_lap_times(event, session)
+    refresh_standings([(event, session)])
+    return stored
 
 
 def retrieve_drivers_data():
@@ -68,7 +453,8 @@ def retrieve_drivers_data():
 
 def retrieve_laps_data():
     for dr in Qualification.select():
-        print(dr.driver_code, dr.start, dr.stop, dr.lap_time)
+        print(dr.event, dr.session, dr.driver_code, dr.lap, dr.start, dr.stop,
+              dr.lap_time)
 
 
 def create_tables() -> bool:
@@ -85,16 +471,61 @@ def create_tables() -> bool:
     if not db.table_exists(Qualification):
         db.create_tables([Qualification])
         tables_created = True
+    else:
+        migrate_tables()
+    db.create_tables([IngestWatermark, DataVersion])
+    if not db.table_exists(Standings):
+        db.create_tables([Standings])
+        refresh_standings()  # laps stored before standings were materialized
     return tables_created
 
 
+def migrate_tables():
+    """Add event, session and lap columns to Qualification table created
+    before multi-lap support, allow NULL start, stop and lap time of not
+    finished laps and create missing indexes. Existing rows become lap 1 of
+    Q1 session"""
+    table = Qualification._meta.table_name
+    columns = {column.name: column for column in db.get_columns(table)}
+    new_fields = [Qualification.event, Qualification.session,
+                  Qualification.lap]
+    nullable_fields = [Qualification.start, Qualification.stop,
+                       Qualification.lap_time]
+    migrator = SqliteMigrator(db)
+    operations = [migrator.add_column(table, field.column_name, field)
+                  for field in new_fields if field.column_name not in columns]
+    operations += [migrator.drop_not_null(table, field.column_name)
+                   for field in nullable_fields
+                   if not columns[field.column_name].null]
+    if operations:
+        migrate(*operations)
+    Qualification._schema.create_indexes(safe=True)
+
+
+def pars_args():
+    arg_parser = argparse.ArgumentParser(
+        description='Store Formula 1 qualification logs in f1.sqlite3')
+    arg_parser.add_argument('--season', type=str, default=None,
+                            help='load every session of season archive')
+    arg_parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help=f'rows in one insert (default {BATCH_SIZE})')
+    arg_parser.add_argument('--fast', action='store_true',
+                            help='insert batches with executemany')
+    return arg_parser.parse_args()
+
+
 @db.connection_context()
 def main():
-    if create_tables():
-        drivers = parse_drivers_files()
-        store_drivers(drivers)
-        lap_times = parse_laps_files()
-        store_laps_files(lap_times)
+    args = pars_args()
+    create_tables()
+    if args.season is not None:
+        started = time.perf_counter()
+        stored = load_season(args.season, args.batch_size, args.fast)
+        print(f'{stored} laps stored in {time.perf_counter() - started:.2f} s')
+        return
+    stored = ingest('static/data')
+    for file_name, lines in stored.items():
+        print(f'{file_name}: {lines} new lines stored')
     retrieve_laps_data()
     retrieve_drivers_data()
 
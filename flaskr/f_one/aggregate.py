@@ -0,0 +1,168 @@
+"""Aggregation of lap times into qualification standings
+Logs can contain any number of laps of every driver. n-th start of a driver
+is paired with n-th end of the same driver by (driver, lap) index, best lap of
+every driver is found in one pass over the laps, and only the best laps (one
+per driver) are sorted to get positions and gaps.
+
+Event and session are taken from the data directory: directory named Q1, Q2
+or Q3 is a session of event named as its parent directory, any other
+directory is Q1 session of event with directory name.
+
+Classes:
+    Standing(NamedTuple)
+    Position of driver in session with best lap and gaps in milliseconds
+
+    SessionResult(NamedTuple)
+    Standings of one session with pilots, laps count and problems of logs
+
+Functions:
+    session_of(folder) -> tuple[str, str]:
+    Return (event, session) names for data directory
+
+    pair_laps(starts, ends, diagnostics=None) -> Iterator[Lap]:
+    Pair starts and ends of laps. Yield Lap(code, lap, start_ms, end_ms)
+
+    best_laps(laps, filtering: bool = True) -> tuple[dict, dict]:
+    Return best (lap_ms, lap) and number of laps of every driver
+
+    rank(best: dict, top: int = None) -> list[Standing]:
+    Sort best laps and return standings with gaps, only top standings are
+    selected with heapq if top is set
+
+    format_lap_time(lap_ms: int) -> str:
+    Format milliseconds as m:ss.fff
+
+Global var:
+    CUT_LINES - last position that passes to the next session
+"""
+
+import heapq
+from pathlib import Path
+from typing import Iterator, NamedTuple
+from f_one.records import Lap
+
+SESSIONS = ('Q1', 'Q2', 'Q3')
+DEFAULT_SESSION = 'Q1'
+CUT_LINES = {'Q1': 15, 'Q2': 10, 'Q3': None}
+
+
+class Standing(NamedTuple):
+    """Position of driver in session with best lap and gaps in milliseconds"""
+    position: int
+    code: str
+    lap_ms: int
+    lap: int
+    gap_to_leader: int
+    gap_to_ahead: int
+
+
+class SessionResult(NamedTuple):
+    """Standings of one session with pilots, laps count and problems of log
+    files found while they were parsed"""
+    event: str
+    session: str
+    standings: list
+    pilots: dict  # code -> (name, car)
+    laps_count: dict  # code -> number of laps
+    unreliable: list  # codes of drivers without reliable laps
+    diagnostics: object = None  # validation.Diagnostics of log files
+
+
+def session_of(folder) -> tuple[str, str]:
+    """Return (event, session) names for data directory"""
+    folder = Path(folder)
+    if folder.name.upper() in SESSIONS:
+        return folder.parent.name, folder.name.upper()
+    return folder.name, DEFAULT_SESSION
+
+
+def pair_laps(starts, ends, diagnostics=None) -> Iterator[Lap]:
+    """Pair n-th start of driver with n-th end of the same driver.
+    Repeated time of driver is a duplicated line, it is skipped and does not
+    start or end a lap. Ends without start are skipped.
+    Arguments:
+    starts -- Iterable of (code, start_ms)
+    ends -- Iterable of (code, end_ms)
+    diagnostics -- Collector of problems (f_one.validation.Diagnostics),
+    if set, duplicates, ends without start and starts without end are
+    reported (default None)
+    Yield Lap(code, lap, start_ms, end_ms), lap numbers start from 1
+    """
+    started = {}  # (code, lap) -> start_ms
+    start_count = {}
+    last = {}  # code -> last time of driver, finds duplicated lines
+    for code, start_ms in starts:
+        if last.get(code) == start_ms:
+            if diagnostics is not None:
+                diagnostics.add('duplicate', 'start.log', None, code,
+                                f'start {start_ms} is logged twice')
+            continue
+        last[code] = start_ms
+        lap = start_count.get(code, 0) + 1
+        start_count[code] = lap
+        started[code, lap] = start_ms
+    end_count = {}
+    last.clear()
+    for code, end_ms in ends:
+        if last.get(code) == end_ms:
+            if diagnostics is not None:
+                diagnostics.add('duplicate', 'end.log', None, code,
+                                f'end {end_ms} is logged twice')
+            continue
+        last[code] = end_ms
+        lap = end_count.get(code, 0) + 1
+        end_count[code] = lap
+        start_ms = started.pop((code, lap), None)
+        if start_ms is not None:
+            yield Lap(code, lap, start_ms, end_ms)
+        elif diagnostics is not None:
+            diagnostics.add('unmatched_end', 'end.log', None, code,
+                            f'lap {lap} ended without start')
+    if diagnostics is not None:
+        for code, lap in started:
+            diagnostics.add('unmatched_start', 'start.log', None, code,
+                            f'lap {lap} started without end')
+
+
+def best_laps(laps, filtering: bool = True) -> tuple[dict, dict]:
+    """Return best (lap_ms, lap) and number of laps of every driver
+    Arguments:
+    laps -- Iterable of (code, lap, start_ms, end_ms)
+    filtering -- Skip unreliable laps with negative time (default True)
+    Drivers without reliable laps are present only in laps count dict
+    """
+    best = {}
+    laps_count = {}
+    for code, lap, start_ms, end_ms in laps:
+        laps_count[code] = laps_count.get(code, 0) + 1
+        lap_ms = end_ms - start_ms
+        if filtering and lap_ms < 0:
+            continue
+        current = best.get(code)
+        if current is None or lap_ms < current[0]:
+            best[code] = (lap_ms, lap)
+    return best, laps_count
+
+
+def rank(best: dict, top: int = None) -> list[Standing]:
+    """Sort best laps and return standings with gaps. If top is set, only
+    first top standings are selected with heapq instead of sorting all laps"""
+    standings = []
+    leader_ms = ahead_ms = None
+    if top is None:
+        ranked = sorted(best.items(), key=lambda kv: kv[1][0])
+    else:
+        ranked = heapq.nsmallest(top, best.items(), key=lambda kv: kv[1][0])
+    for position, (code, (lap_ms, lap)) in enumerate(ranked, start=1):
+        if leader_ms is None:
+            leader_ms = ahead_ms = lap_ms
+        standings.append(Standing(position, code, lap_ms, lap,
+                                  lap_ms - leader_ms, lap_ms - ahead_ms))
+        ahead_ms = lap_ms
+    return standings
+
+
+def format_lap_time(lap_ms: int) -> str:
+    """Format milliseconds as m:ss.fff"""
+    minutes, rest = divmod(lap_ms, 60_000)
+    return f'{minutes}:{rest / 1000:.3f}'
@@ -0,0 +1,187 @@
+"""Vectorized analytics of qualification laps
+Lap times of a session are loaded into NumPy arrays (driver index and lap
+milliseconds of every lap) and every statistic is computed with array
+operations, so cost does not grow with Python loops over laps.
+
+Outliers replace the lap_time < 0 rule of f_one.FILTERING: lap is an outlier
+if its time is not positive or its modified z-score (0.6745 * deviation from
+median / median absolute deviation of all positive laps) is more than
+OUTLIER_Z. Best laps, gaps and team aggregates use only laps that are not
+outliers; drivers without such laps are unreliable.
+
+Classes:
+    LapArrays(NamedTuple)
+    Lap times of session in NumPy arrays
+
+Functions:
+    from_compiled(laps: CompiledLaps) -> LapArrays:
+    Return arrays with zero-copy views of compiled lap columns
+
+    from_rows(rows, pilots) -> LapArrays:
+    Return arrays from (code, lap, lap_ms) rows
+
+    outlier_mask(lap_ms) -> numpy.ndarray:
+    Return True for outlier laps
+
+    analyze(laps: LapArrays, cut_line: int | None) -> dict:
+    Return standings with gaps, team aggregates, percentiles, outliers and
+    cut-line margin
+"""
+
+from typing import NamedTuple
+import numpy as np
+from f_one import aggregate
+
+OUTLIER_Z = 3.5
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+class LapArrays(NamedTuple):
+    """Lap times of session in NumPy arrays"""
+    codes: list  # driver code of every driver index
+    pilots: dict  # code -> (name, car)
+    driver: np.ndarray  # driver index of every lap
+    lap: np.ndarray  # lap number of every lap
+    lap_ms: np.ndarray  # lap time of every lap in milliseconds
+
+
+def from_compiled(laps) -> LapArrays:
+    """Return arrays with zero-copy views of compiled lap columns
+    (f_one.columnar.CompiledLaps)"""
+    return LapArrays(laps.codes,
+                     {code: (name, car) for code, name, car in laps.pilots},
+                     np.frombuffer(laps.driver, dtype=np.uint32),
+                     np.frombuffer(laps.lap, dtype=np.uint32),
+                     np.frombuffer(laps.lap_ms, dtype=np.int64))
+
+
+def from_rows(rows, pilots: dict) -> LapArrays:
+    """Return arrays from iterable of (code, lap, lap_ms) rows
+    Arguments:
+    rows -- Iterable of (code, lap, lap_ms)
+    pilots -- Dict code -> (name, car)
+    """
+    codes = list(pilots)
+    index = {code: i for i, code in enumerate(codes)}
+    driver, lap, lap_ms = [], [], []
+    for code, lap_number, time_ms in rows:
+        if code not in index:
+            index[code] = len(codes)
+            codes.append(code)
+        driver.append(index[code])
+        lap.append(lap_number)
+        lap_ms.append(time_ms)
+    return LapArrays(codes, pilots, np.array(driver, dtype=np.uint32),
+                     np.array(lap, dtype=np.uint32),
+                     np.array(lap_ms, dtype=np.int64))
+
+
+def outlier_mask(lap_ms: np.ndarray) -> np.ndarray:
+    """Return True for laps with not positive time or modified z-score more
+    than OUTLIER_Z"""
+    outliers = lap_ms <= 0
+    positive = lap_ms[~outliers]
+    if positive.size == 0:
+        return outliers
+    median = np.median(positive)
+    mad = np.median(np.abs(positive - median))
+    if mad == 0:
+        return outliers
+    z_score = 0.6745 * np.abs(lap_ms - median) / mad
+    return outliers | (z_score > OUTLIER_Z)
+
+
+def _best_laps(laps: LapArrays, valid: np.ndarray) -> tuple:
+    """Return driver index, lap number and lap_ms of best valid lap of every
+    driver, ordered by lap time. First lap wins if driver has equal laps"""
+    best = np.full(len(laps.codes), np.iinfo(np.int64).max)
+    np.minimum.at(best, laps.driver[valid], laps.lap_ms[valid])
+    candidates = np.flatnonzero(valid & (laps.lap_ms == best[laps.driver]))
+    _, first = np.unique(laps.driver[candidates], return_index=True)
+    chosen = candidates[first]
+    ranked = chosen[np.argsort(laps.lap_ms[chosen], kind='stable')]
+    return laps.driver[ranked], laps.lap[ranked], laps.lap_ms[ranked]
+
+
+def analyze(laps: LapArrays, cut_line: int | None) -> dict:
+    """Return standings with gaps, team aggregates, percentiles, outliers and
+    cut-line margin of session
+    Arguments:
+    laps -- Lap times of session
+    cut_line -- Last position that passes to the next session, None if
+    there is no cut line
+    """
+    outliers = outlier_mask(laps.lap_ms)
+    valid = ~outliers
+    driver, lap, best_ms = _best_laps(laps, valid)
+    laps_count = np.bincount(laps.driver, minlength=len(laps.codes))
+    outliers_count = np.bincount(laps.driver[outliers],
+                                 minlength=len(laps.codes))
+
+    gap_to_pole = best_ms - best_ms[0] if best_ms.size else best_ms
+    gap_to_ahead = np.diff(best_ms, prepend=best_ms[:1])
+
+    percentiles = np.percentile(laps.lap_ms[valid], PERCENTILES) \
+        if valid.any() else np.array([])
+    bands = np.searchsorted(percentiles, best_ms, side='right')
+    band_names = ([f'below_p{PERCENTILES[0]}']
+                  + [f'p{low}-p{high}' for low, high
+                     in zip(PERCENTILES, PERCENTILES[1:])]
+                  + [f'above_p{PERCENTILES[-1]}'])
+
+    cut = None
+    margin = np.zeros(best_ms.size, dtype=np.int64)
+    if cut_line is not None and best_ms.size > cut_line:
+        cut_ms = best_ms[cut_line - 1]
+        margin = best_ms - cut_ms
+        cut = {'position': cut_line, 'lap_ms': int(cut_ms),
+               'margin_ms': int(best_ms[cut_line] - cut_ms)}
+
+    cars = np.array([laps.pilots.get(laps.codes[i], ('', ''))[1]
+                     for i in driver], dtype=object)
+    teams = []
+    if best_ms.size:
+        team_names, team_index = np.unique(cars.astype(str),
+                                           return_inverse=True)
+        team_best = np.full(team_names.size, np.iinfo(np.int64).max)
+        np.minimum.at(team_best, team_index, best_ms)
+        team_drivers = np.bincount(team_index)
+        team_mean = np.bincount(team_index, weights=best_ms) / team_drivers
+        for i in np.argsort(team_best, kind='stable'):
+            teams.append({'car': str(team_names[i]),
+                          'best_lap_ms': int(team_best[i]),
+                          'mean_lap_ms': round(float(team_mean[i]), 1),
+                          'drivers': int(team_drivers[i])})
+
+    drivers = []
+    for position in range(best_ms.size):
+        code = laps.codes[driver[position]]
+        name, car = laps.pilots.get(code, (code, ''))
+        drivers.append({
+            'position': position + 1, 'code': code, 'name': name, 'car': car,
+            'best_lap': aggregate.format_lap_time(int(best_ms[position])),
+            'best_lap_ms': int(best_ms[position]),
+            'lap': int(lap[position]),
+            'laps': int(laps_count[driver[position]]),
+            'outliers': int(outliers_count[driver[position]]),
+            'gap_to_pole_ms': int(gap_to_pole[position]),
+            'gap_to_ahead_ms': int(gap_to_ahead[position]),
+            'cut_line_margin_ms': int(margin[position])
+            if cut is not None else None,
+            'band': band_names[bands[position]]})
+
+    ranked = set(driver.tolist())
+    unreliable = [laps.codes[i] for i in np.flatnonzero(laps_count)
+                  if i not in ranked]
+    outlier_laps = sorted(
+        ({'code': laps.codes[d], 'lap': int(n), 'lap_ms': int(ms)}
+         for d, n, ms in zip(laps.driver[outliers], laps.lap[outliers],
+                             laps.lap_ms[outliers])),
+        key=lambda outlier: (outlier['code'], outlier['lap']))
+    return {'drivers': drivers,
+            'teams': teams,
+            'percentiles': {f'p{p}': round(float(value), 1)
+                            for p, value in zip(PERCENTILES, percentiles)},
+            'cut_line': cut,
+            'outliers': outlier_laps,
+            'unreliable': unreliable}
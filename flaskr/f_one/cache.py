@@ -0,0 +1,161 @@
+"""In-process cache of built qualification reports
+Building a report opens the three log files and parses every line, which is
+wasted work when the files have not changed between requests. The cache keeps
+the result of build_report for every data directory and rebuilds it only when
+mtime or size of abbreviations.txt, start.log or end.log changes, when the
+optional TTL expires or when invalidate() is called.
+
+Cached reports are shared between requests, callers must not modify them in
+place (use sorted(), reversed() or slicing instead of sort() and reverse()).
+Artifacts computed from a report (serialized responses etc.) can be stored on
+it with CachedReport.derive(), so they are computed once per data version.
+Diagnostics of log files collected while the report was parsed are kept on
+CachedReport (None for reports that were not parsed from log files).
+
+Classes:
+    CachedReport
+    Result of build_report together with the version of the data it was
+    built from
+
+    ReportCache(ttl: float = None)
+    Thread-safe cache of CachedReport objects keyed on the data directory
+
+Functions:
+    get_report(dir_path: str) -> CachedReport | None:
+    Return cached report for directory using the default cache
+
+    invalidate(dir_path: str = None):
+    Drop cached report of directory (or all reports) from the default cache
+
+Vars:
+    report_cache - default ReportCache instance used by the web app and API
+"""
+
+import hashlib
+import threading
+import time
+
+from f_one import f_one, metrics
+
+
+class CachedReport:
+    """Result of build_report together with the version of the data it was
+    built from"""
+
+    __slots__ = ('qualification_report', 'pilots', 'unreliable_data',
+                 'signature', 'version', 'built_at', 'diagnostics',
+                 '_derived', '_lock')
+
+    def __init__(self, built, signature, built_at, diagnostics=None):
+        self.qualification_report, self.pilots, self.unreliable_data = built
+        self.diagnostics = diagnostics
+        self.signature = signature
+        self.version = hashlib.sha1(repr(signature).encode()).hexdigest()[:16]
+        self.built_at = built_at
+        self._derived = {}
+        self._lock = threading.RLock()  # factories may derive other artifacts
+
+    def derive(self, name: str, factory):
+        """Return artifact computed from this report by factory(report).
+        Factory is called only once for every name
+        """
+        try:
+            artifact = self._derived[name]
+            metrics.cache_requests.inc(name, 'hit')
+            return artifact
+        except KeyError:
+            metrics.cache_requests.inc(name, 'miss')
+        with self._lock:
+            if name not in self._derived:
+                self._derived[name] = factory(self)
+            return self._derived[name]
+
+    @property
+    def index(self) -> f_one.ReportIndex:
+        """Indexes of report by driver code, name and team"""
+        return self.derive('index', lambda report: f_one.ReportIndex(*report))
+
+    def __iter__(self):
+        """Allow unpacking like the tuple returned by build_report"""
+        return iter((self.qualification_report, self.pilots,
+                     self.unreliable_data))
+
+
+def files_signature(paths: dict) -> tuple:
+    """Return tuple with (file name, mtime, size) of every log file"""
+    signature = []
+    for name in sorted(paths):
+        stat = paths[name].stat()
+        signature.append((name, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+class ReportCache:
+    """Thread-safe cache of CachedReport objects keyed on the data directory
+    Arguments:
+    ttl -- Seconds after which report is rebuilt even if files did not
+    change. None means reports never expire (default None)
+    """
+
+    def __init__(self, ttl: float = None, clock=time.monotonic):
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, dir_path: str) -> CachedReport | None:
+        """Return report for directory, rebuild it if log files changed"""
+        paths = f_one.generate_file_paths(dir_path)
+        if paths is None:
+            return None
+        key = str(paths['start.log'].parent)
+        signature = files_signature(paths)
+        entry = self._entries.get(key)
+        if self._is_fresh(entry, signature):
+            metrics.cache_requests.inc('report', 'hit')
+            return entry
+        metrics.cache_requests.inc('report', 'miss')
+        with self._lock:
+            # Other thread could rebuild report while we were waiting
+            entry = self._entries.get(key)
+            if self._is_fresh(entry, signature):
+                return entry
+            result = f_one.build_session(dir_path)
+            if result is None:
+                return None
+            entry = CachedReport(f_one.session_report(result), signature,
+                                 self._clock(), result.diagnostics)
+            self._entries[key] = entry
+        return entry
+
+    def invalidate(self, dir_path: str = None):
+        """Drop cached report of directory. Drop all reports if dir_path is
+        None"""
+        with self._lock:
+            if dir_path is None:
+                self._entries.clear()
+                return
+            paths = f_one.generate_file_paths(dir_path)
+            if paths is not None:
+                self._entries.pop(str(paths['start.log'].parent), None)
+
+    def _is_fresh(self, entry, signature) -> bool:
+        if entry is None or entry.signature != signature:
+            return False
+        if self.ttl is not None and self._clock() - entry.built_at > self.ttl:
+            return False
+        return True
+
+
+report_cache = ReportCache()
+
+
+def get_report(dir_path: str) -> CachedReport | None:
+    """Return cached report for directory using the default cache"""
+    return report_cache.get(dir_path)
+
+
+def invalidate(dir_path: str = None):
+    """Drop cached report of directory (or all reports) from the default
+    cache"""
+    report_cache.invalidate(dir_path)
@@ -0,0 +1,212 @@
+"""Compiled columnar cache of parsed lap data
+Parsing text logs is the slowest part of building a report, and every process
+(every web server worker) used to parse them again. Parsed laps of a data
+directory are compiled into CACHE_FILE next to the logs and later loaded with
+mmap: columns are zero-copy memoryviews of the file, so workers share one copy
+in the page cache. The file is compiled again when size or mtime of any log
+file differs from the signature stored in its header.
+
+Problems of log files found while they are compiled (f_one.validation) are
+stored in the file too, so diagnostics of the report cost no extra parse.
+
+File format (header little-endian, columns in native byte order):
+    header -- HEADER struct: magic, format version, byte order, number of
+    laps, number of codes, number of pilots, size of string table, size of
+    diagnostics and (mtime_ns, size) of abbreviations.txt, start.log and
+    end.log
+    start_ms, end_ms, lap_ms -- int64 columns, epoch milliseconds
+    driver, lap -- uint32 columns, index in string table and lap number
+    strings -- UTF-8 lines: 'code_name_car' of every pilot of
+    abbreviations.txt, then codes of drivers present only in logs
+    diagnostics -- UTF-8 JSON of validation.Diagnostics.to_dict()
+
+If the cache file cannot be written (read-only data directory), the same
+format is built in memory.
+
+Classes:
+    CompiledLaps(buffer)
+    Columns of laps stored in compiled buffer
+
+Functions:
+    source_signature(paths: dict) -> tuple:
+    Return (mtime_ns, size) of every log file
+
+    compile_laps(paths: dict) -> bytes:
+    Parse and validate log files and return compiled data
+
+    load(path, signature: tuple) -> CompiledLaps | None:
+    Map compiled file, None if it is missing or stale
+
+    get_laps(paths: dict) -> CompiledLaps:
+    Return laps of directory from compiled file, compile it if needed
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from pathlib import Path
+from typing import Iterator
+from f_one import aggregate, parser, validation
+from f_one.records import Lap, LapTable, Pilot
+
+CACHE_FILE = 'laps.f1c'
+MAGIC = b'F1LAPS\x00\x00'
+FORMAT_VERSION = 2
+LOG_FILES = ('abbreviations.txt', 'start.log', 'end.log')
+HEADER = struct.Struct('<8s7I6q')
+BYTE_ORDER = 1 if sys.byteorder == 'little' else 0
+
+
+def source_signature(paths: dict) -> tuple:
+    """Return (mtime_ns, size) of every log file"""
+    signature = []
+    for name in LOG_FILES:
+        stat = paths[name].stat()
+        signature += [stat.st_mtime_ns, stat.st_size]
+    return tuple(signature)
+
+
+class CompiledLaps:
+    """Columns of laps stored in compiled buffer (mmap or bytes)
+    Attributes:
+    pilots -- List of Pilot from abbreviations.txt
+    codes -- Driver codes, index is value of driver column
+    start_ms, end_ms, lap_ms, driver, lap -- Columns (memoryview)
+    signature -- Signature of log files the data was compiled from
+    diagnostics -- Problems of log files (validation.Diagnostics)
+    """
+
+    def __init__(self, buffer):
+        self._buffer = buffer
+        (magic, version, byte_order, laps, codes, pilots, strings_size,
+         diagnostics_size, *signature) = HEADER.unpack_from(buffer)
+        if magic != MAGIC or version != FORMAT_VERSION or \
+                byte_order != BYTE_ORDER:
+            raise ValueError('Not a compiled laps file of this format')
+        self.signature = tuple(signature)
+        view = memoryview(buffer)
+        offset = HEADER.size
+        columns = []
+        for typecode, size in (('q', 8), ('q', 8), ('q', 8), ('I', 4),
+                               ('I', 4)):
+            columns.append(view[offset:offset + laps * size].cast(typecode))
+            offset += laps * size
+        self.start_ms, self.end_ms, self.lap_ms, self.driver, self.lap = \
+            columns
+        lines = bytes(view[offset:offset + strings_size]).decode().split('\n')
+        self.pilots = [Pilot(*line.split('_', 2)) for line in lines[:pilots]]
+        self.codes = [pilot.code for pilot in self.pilots] + \
+            lines[pilots:codes]
+        offset += strings_size
+        self._diagnostics = view[offset:offset + diagnostics_size]
+
+    @property
+    def diagnostics(self) -> validation.Diagnostics:
+        """Problems of log files, decoded on first access"""
+        if not isinstance(self._diagnostics, validation.Diagnostics):
+            self._diagnostics = validation.Diagnostics.from_dict(
+                json.loads(bytes(self._diagnostics)))
+        return self._diagnostics
+
+    def __len__(self) -> int:
+        return len(self.driver)
+
+    def __iter__(self) -> Iterator[Lap]:
+        codes = self.codes
+        for driver, lap, start_ms, end_ms in zip(self.driver, self.lap,
+                                                 self.start_ms, self.end_ms):
+            yield Lap(codes[driver], lap, start_ms, end_ms)
+
+    def best_laps(self, filtering: bool = True) -> tuple[dict, dict]:
+        """Return best (lap_ms, lap) and number of laps of every driver like
+        aggregate.best_laps, reading only driver, lap and lap_ms columns"""
+        best = {}
+        laps_count = {}
+        for driver, lap, lap_ms in zip(self.driver, self.lap, self.lap_ms):
+            laps_count[driver] = laps_count.get(driver, 0) + 1
+            if filtering and lap_ms < 0:
+                continue
+            current = best.get(driver)
+            if current is None or lap_ms < current[0]:
+                best[driver] = (lap_ms, lap)
+        codes = self.codes
+        return ({codes[driver]: value for driver, value in best.items()},
+                {codes[driver]: count for driver, count
+                 in laps_count.items()})
+
+
+def compile_laps(paths: dict) -> bytes:
+    """Parse log files and return compiled data. Problems of log files are
+    collected in the same pass and stored with the laps"""
+    signature = source_signature(paths)
+    diagnostics = validation.Diagnostics()
+    pilots = list(parser.iter_abbreviations(paths['abbreviations.txt'],
+                                            diagnostics))
+    table = LapTable()
+    for pilot in pilots:
+        table.code_index(pilot.code)
+    laps = aggregate.pair_laps(
+        parser.iter_timings(paths['start.log'], diagnostics),
+        parser.iter_timings(paths['end.log'], diagnostics), diagnostics)
+    codes = {pilot.code for pilot in pilots}
+    for lap in validation.check_laps(laps, codes, diagnostics):
+        table.append(*lap)
+    strings = '\n'.join(['_'.join(pilot) for pilot in pilots]
+                        + table.codes[len(pilots):]).encode()
+    problems = json.dumps(diagnostics.to_dict()).encode()
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, BYTE_ORDER, len(table),
+                         len(table.codes), len(pilots), len(strings),
+                         len(problems), *signature)
+    return b''.join([header, table.start_ms.tobytes(), table.end_ms.tobytes(),
+                     table.lap_times().tobytes(), table.driver.tobytes(),
+                     table.lap.tobytes(), strings, problems])
+
+
+def load(path, signature: tuple) -> CompiledLaps | None:
+    """Map compiled file, None if it is missing, broken or was compiled from
+    log files with other signature"""
+    try:
+        with open(path, 'rb') as file:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):  # missing or empty file
+        return None
+    try:
+        laps = CompiledLaps(buffer)
+    except (ValueError, struct.error):
+        return None
+    if laps.signature != signature:
+        return None
+    return laps
+
+
+def _write(path: Path, data: bytes):
+    """Replace file atomically, so other processes never map partial file"""
+    descriptor, temp_path = tempfile.mkstemp(dir=path.parent,
+                                             prefix=path.name)
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, path)
+    except OSError:
+        os.unlink(temp_path)
+        raise
+
+
+def get_laps(paths: dict) -> CompiledLaps:
+    """Return laps of directory from compiled file, compile it if it is
+    missing or log files changed"""
+    path = paths['start.log'].parent / CACHE_FILE
+    signature = source_signature(paths)
+    laps = load(path, signature)
+    if laps is not None:
+        return laps
+    data = compile_laps(paths)
+    try:
+        _write(path, data)
+    except OSError as error:
+        print(f'Cannot write {path}: {error}')
+        return CompiledLaps(data)
+    return load(path, signature) or CompiledLaps(data)
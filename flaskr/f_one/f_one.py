@@ -8,6 +8,22 @@ with the help of --desc or --asc key. --asc is default. Using
 
 Example: python --file data --desc
 
+Batch mode builds every event directory of an archive in parallel, writes
+report of every session with --output and prints season standings:
+python --season archive/2018 --workers 8 --output reports
+
+Several directories can be given to --files, or '-' to read directories from
+stdin (one per line). Report is written to stdout by one buffered writer as
+text table or, with --format csv, json or ndjson, as rows of f_one.output.
+--top N keeps first N positions (selected with heapq), --team keeps drivers
+of one team:
+find archive -name Q1 | python -m f_one.f_one -f - --format ndjson --top 10
+
+--diagnostics prints problems of log files instead of report (malformed
+lines, duplicates, unknown driver codes, unmatched starts and ends,
+implausible lap times, trailing whitespace), see f_one.validation. Report
+skips malformed lines and shows drivers without abbreviation by code.
+
 Format of abbreviations.txt:
 SVF_Sebastian Vettel_FERRARI
 LHM_Lewis Hamilton_MERCEDES
@@ -21,24 +37,51 @@ Functions:
     main()
     Collect and parse arguments: path to directory with files,
     driver (if needed), sorting order. Check that files exists. Send argument
-    values to build_report function
+    values to build_report function. With --season <root> builds all events
+    under root in --workers processes and prints season standings
 
     generate_file_paths(folder: str) -> dict | None:
     Check if folder and files exist. Returns dict with keys as file names and
     values as Path objects with file's path
 
+    build_session(dir_path: str, top: int = None)
+                  -> aggregate.SessionResult | None:
+    Return standings of session stored in directory with best lap and gaps of
+    each driver. Any number of laps per driver is supported
+
     build_report(dir_path: str) -> tuple[list, list, list] | None:
     Return list with record of best lap of each driver, list
     with pilots' codes abbreviations and meaning, list with unreliable negative
     results, that are not present in result list
 
-    print_report(report: list, reverse: bool = False, driver_name: str = None):
+    session_report(result: aggregate.SessionResult) -> tuple[list, list, list]:
+    Return report, pilots and unreliable results of session like build_report
+
+    print_report(report: list, reverse: bool = False, driver_name: str = None,
+                 cut_line: int | None = 15, index: ReportIndex = None,
+                 out=None):
     Print report in format POS.DRIVER|CAR|Q1
     If driver name is not None function will try to find driver and print only
     one result of this driver
 
+    iter_report_lines(report: list, reverse: bool = False,
+                      cut_line: int | None = 15) -> Iterator[str]:
+    Yield lines of report table with cut line
+
+    cut_line(dir_path: str) -> int | None:
+    Return last position that passes to the next session
+
+    print_diagnostics(data_folders: list, fmt: str = 'text'):
+    Print problems of log files of every folder
+
+Classes:
+    ReportIndex(report: list, pilots: list, unreliable_data: list = None)
+    Hash indexes of report by driver code, driver name and team
+
 Global var:
     FILTERING = True - Filter unreliable results with negative time
+    COMPILED_CACHE = True - Read laps from compiled file next to log files
+    (f_one.columnar), compile it when log files change
 
 Vars:
     file_start = "start.log"
@@ -46,45 +89,149 @@ Vars:
     file_abbreviations = "abbreviations.txt"
 """
 
-import datetime
 import argparse
+import sys
 from pathlib import Path
-from peewee import *
+from typing import Iterator, NamedTuple
+from f_one import (aggregate, columnar, metrics, output, parser,
+                   validation)
+from f_one.records import Pilot, ReportRow
 
 FILTERING = True
+COMPILED_CACHE = True
+
+
+class DriverRecord(NamedTuple):
+    """Driver with his result: row of report, row of unreliable results or
+    None if driver has no laps"""
+    code: str
+    name: str
+    car: str
+    result: ReportRow | None
+
+
+class ReportIndex:
+    """Hash indexes of report by driver code, driver name and team (car)
+    Arguments:
+    report -- Report with best lap results
+    pilots -- List of [code, name, car]
+    unreliable_data -- Unreliable results (default None)
+    """
+
+    def __init__(self, report: list, pilots: list, unreliable_data: list = None):
+        results = {rec[1]: rec for rec in unreliable_data or ()}
+        results.update((rec[1], rec) for rec in report)
+        self.by_code = {}
+        self.by_name = {}
+        self.by_team = {}
+        for code, name, car in pilots:
+            record = DriverRecord(code, name, car, results.get(name))
+            self.by_code[code] = record
+            self.by_name[name] = record
+            self.by_team.setdefault(car, []).append(record)
+
+    def find(self, driver: str) -> DriverRecord | None:
+        """Return driver by name or code"""
+        return self.by_name.get(driver) or self.by_code.get(driver.upper())
 
 
-def print_report(report: list, reverse: bool = False, driver_name: str = None):
+TEMPLATE = "{0:3}.{1:20}|{2:26}|{3:6}"  # column widths: 8, 10, 15, 7, 10
+
+
+def iter_report_lines(report: list, reverse: bool = False,
+                      cut_line: int | None = aggregate.CUT_LINES['Q1']
+                      ) -> Iterator[str]:
+    """Yield header and rows of report in format POS.DRIVER|CAR|Q1 with line
+    below the last position that passes to the next session. Report is not
+    changed, reversed order is read from the end"""
+    yield TEMPLATE.format("POS", "DRIVER", "CAR", "Q1")  # header
+    first_out = None if cut_line is None else cut_line + 1
+    for rec in reversed(report) if reverse else report:
+        if rec[0] == first_out and reverse:
+            # Draw the line below which pilots will not pass to Q2
+            yield TEMPLATE.format(*rec)
+            yield '-'*60
+        elif rec[0] == first_out:
+            yield '-'*60
+            yield TEMPLATE.format(*rec)
+        else:
+            yield TEMPLATE.format(*rec)
+
+
+def print_report(report: list, reverse: bool = False, driver_name: str = None,
+                 cut_line: int | None = aggregate.CUT_LINES['Q1'],
+                 index: ReportIndex = None, out=None):
     """Print report in format POS.DRIVER|CAR|Q1
     If driver name is not None function will try to find driver and print only
     one result of this driver.
     Arguments:
     report -- Report with best lap results
     reverse -- Ascending - False or descending - True (default False)
-    driver_name -- print only particular driver (default None)
+    driver_name -- print only particular driver, name or code (default None)
+    cut_line -- Last position that passes to the next session, None for no
+    line (default 15)
+    index -- Index of report used to find driver (default None - index is
+    built from report)
+    out -- Text stream (default None - sys.stdout)
     """
-    template = "{0:3}.{1:20}|{2:26}|{3:6}"  # column widths: 8, 10, 15, 7, 10
-    print(template.format("POS", "DRIVER", "CAR", "Q1"))  # header
-
     if driver_name:  # Print report only for 1 driver
-        record = [rec for rec in report if rec[1] == driver_name]
-        if not record:
-            print('Cannot find driver. Please check driver name')
+        if index is None:
+            index = ReportIndex(report, [Pilot(None, rec[1], rec[2])
+                                         for rec in report])
+        record = index.find(driver_name)
+        if record is None or record.result is None:
+            output.write_lines([TEMPLATE.format("POS", "DRIVER", "CAR", "Q1"),
+                                'Cannot find driver. Please check driver '
+                                'name'], out)
             return None
-        print(template.format(*record[0]))
+        output.write_lines([TEMPLATE.format("POS", "DRIVER", "CAR", "Q1"),
+                            TEMPLATE.format(*record.result)], out)
     else:  # All drivers
-        if reverse:
-            report.reverse()
-        for rec in report:
-            if rec[0] == 16 and reverse:
-                # Draw the line below which pilots will not pass to Q2
-                print(template.format(*rec))
-                print('-'*60)
-            elif rec[0] == 16:
-                print('-'*60)
-                print(template.format(*rec))
-            else:
-                print(template.format(*rec))
+        output.write_lines(iter_report_lines(report, reverse, cut_line), out)
+
+
+def build_session(dir_path: str,
+                  top: int = None) -> aggregate.SessionResult | None:
+    """Return standings of session stored in directory with best lap of each
+    driver, pilots dict, number of laps of each driver, codes of drivers
+    without reliable laps and diagnostics of log files, collected while they
+    are parsed (f_one.validation)
+    Argument:
+    dir_path -- Path to directory with log files
+    top -- Number of first standings, selected without sorting all drivers
+    (default None - all standings)
+    """
+    paths = generate_file_paths(dir_path)
+    if paths is None:
+        return None
+    pilots = {}
+    with metrics.stage_timer('parse'):
+        if COMPILED_CACHE:
+            laps = columnar.get_laps(paths)
+            for code, name, car in laps.pilots:
+                pilots[code] = (name, car)
+            best, laps_count = laps.best_laps(filtering=FILTERING)
+            diagnostics = laps.diagnostics  # stored by compile_laps
+        else:
+            # Parsing, pairing and validation are lazy, laps are parsed while
+            # best laps are searched
+            diagnostics = validation.Diagnostics()
+            for code, name, car in parser.iter_abbreviations(
+                    paths['abbreviations.txt'], diagnostics):
+                pilots[code] = (name, car)
+            laps = aggregate.pair_laps(
+                parser.iter_timings(paths['start.log'], diagnostics),
+                parser.iter_timings(paths['end.log'], diagnostics),
+                diagnostics)
+            best, laps_count = aggregate.best_laps(
+                validation.check_laps(laps, pilots, diagnostics),
+                filtering=FILTERING)
+    with metrics.stage_timer('aggregate'):
+        standings = aggregate.rank(best, top)
+    unreliable = [code for code in laps_count if code not in best]
+    event, session = aggregate.session_of(paths['start.log'].parent)
+    return aggregate.SessionResult(event, session, standings, pilots,
+                                   laps_count, unreliable, diagnostics)
 
 
 def build_report(dir_path: str) -> tuple[list, list, list] | None:
@@ -94,64 +241,36 @@ def build_report(dir_path: str) -> tuple[list, list, list] | None:
     Argument:
     dir_path -- Path to directory with log files
     """
-    pilots = {}
-    qualification_report = {}
-    paths = generate_file_paths(dir_path)
-    unreliable_data = []
-    if paths is None:
+    result = build_session(dir_path)
+    if result is None:
         return None
-    abbreviations_file_path = paths['abbreviations.txt']  # abbreviations.txt
-    with open(abbreviations_file_path, 'r') as abbr:
-        for line in abbr.readlines():
-            if line == '\n':
-                continue
-            data = line.rstrip().split('_')
-            pilots[data[0]] = (data[1], data[2])
-
-    start_file_path = paths['start.log']
-    with open(start_file_path, 'r') as start:
-        for line in start.readlines():
-            if line == '\n':
-                continue
-            name = line[0:3]
-            time = line[3:].rstrip()
-            dt = datetime.datetime.strptime(time, '%Y-%m-%d_%H:%M:%S.%f')
-            qualification_report[name] = [dt]
-
-    end_file_path = paths['end.log']
-    with open(end_file_path, 'r') as stop:
-        for line in stop.readlines():
-            if line == '\n':
-                continue
-            name = line[0:3]
-            time = line[3:].rstrip()
-            dt = datetime.datetime.strptime(time, '%Y-%m-%d_%H:%M:%S.%f')
-            lap_time = (dt - qualification_report[name][0]).total_seconds()
-            qualification_report[name].append(lap_time)
-
-    results_raw = {}
-    for name_abbr, lap_time in qualification_report.items():
-        name, car = pilots[name_abbr]
-        results_raw[name] = [car, lap_time[1]]
-
-    results = dict(sorted(results_raw.items(), key=lambda kv: kv[1][1]))
+    return session_report(result)
+
+
+def session_report(result: aggregate.SessionResult) -> tuple[list, list, list]:
+    """Return report, pilots and unreliable results of session like
+    build_report"""
+    pilots = result.pilots
     report = []
-    i = 1
-    for pilot in results.keys():
-        car, lap_time = results[pilot]
-        if lap_time < 0 and FILTERING:
-            unreliable_data.append(('Unknown', pilot, car, 'Unreliable'))
-            continue
-        minutes = int(lap_time // 60)
-        seconds = lap_time - minutes * 60
-        lap_time_formatted = f'{minutes}:{seconds:.3f}'
-        report.append((i, pilot, car, lap_time_formatted))
-        i += 1
-    pilots_list = [[code, value[0], value[1]]
-                   for code, value in pilots.items()]
+    for standing in result.standings:
+        # Driver without abbreviation is shown by code
+        name, car = pilots.get(standing.code, (standing.code, ''))
+        report.append(ReportRow(standing.position, name, car,
+                                aggregate.format_lap_time(standing.lap_ms)))
+    unreliable_data = [ReportRow('Unknown', *pilots.get(code, (code, '')),
+                                 'Unreliable')
+                       for code in result.unreliable]
+    pilots_list = [Pilot(code, *value) for code, value in pilots.items()]
     return report, pilots_list, unreliable_data
 
 
+def cut_line(dir_path: str) -> int | None:
+    """Return last position that passes to the next session for session
+    stored in directory"""
+    event, session = aggregate.session_of(dir_path)
+    return aggregate.CUT_LINES[session]
+
+
 def generate_file_paths(folder: str) -> dict | None:
     """Check if folder and files exist. Returns dict with keys as file names and
      values as Path objects with file's path"""
@@ -182,31 +301,113 @@ def pars_args(dir_path):
     qualification results. User needs to enter path to folder with 3 files:
     abbreviations, start and stop lap times. It prints a sorted report"""
     parser = argparse.ArgumentParser(description=description)
-    parser.add_argument("-f", "--files", help="Path to folder with log files")
+    parser.add_argument("-f", "--files", nargs='+',
+                        help="Paths to folders with log files, - reads "
+                             "paths from stdin (one per line)")
     parser.add_argument("--asc", action="store_true", default=True,
                         help="Sorting order: ascending. Default ascending")
     parser.add_argument("--desc", action="store_true",
                         help="Sorting order: descending. Default ascending")
     parser.add_argument("-d", "--driver", default=None, nargs='+',
                         help="Statistic about particular driver")
+    parser.add_argument("--format", choices=output.FORMATS, default='text',
+                        help="Output format. Default text table")
+    parser.add_argument("--top", type=int, default=None,
+                        help="Only first N positions of every session")
+    parser.add_argument("--team", default=None,
+                        help="Only drivers of team (car)")
+    parser.add_argument("--diagnostics", action="store_true",
+                        help="Print problems of log files instead of report")
+    parser.add_argument("--season", default=None,
+                        help="Root of archive with directories of events. "
+                             "Prints season standings")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes for --season. Default number "
+                             "of CPUs")
+    parser.add_argument("--output", default=None,
+                        help="Directory for report of every session of "
+                             "--season")
     args = parser.parse_args()
-    if args.files is not None:
-        data_folder = args.files
+    if args.season is not None:
+        # Process pool is imported only for batch mode
+        from f_one import season
+        result = season.build_season(args.season, workers=args.workers,
+                                     output_dir=args.output)
+        season.print_standings(result.standings)
+        return
+    if args.files is None:
+        data_folders = [dir_path]
+    elif args.files == ['-']:
+        data_folders = [line.strip() for line in sys.stdin if line.strip()]
     else:
-        data_folder = dir_path
+        data_folders = args.files
     if args.driver:
         driver_name = ' '.join(args.driver)
     else:
         driver_name = None
     desc_order = args.desc
-    q1_report = build_report(data_folder)[0]
-    # Index 0 for qualification report, 1 for pilots list,
-    # 2 for unreliable results
-    print_report(q1_report, reverse=desc_order, driver_name=driver_name)
+    if args.diagnostics:
+        print_diagnostics(data_folders, args.format)
+        return
+    # With team filter positions are known only after ranking all drivers
+    top = args.top if args.team is None else None
+    sessions = ((data_folder, build_session(data_folder, top))
+                for data_folder in data_folders)
+    if args.format != 'text':
+        rows = (row for _, result in sessions if result is not None
+                for row in ordered(output.session_rows(
+                    result, args.team, args.top, driver_name), desc_order))
+        output.write_lines(output.iter_rows(rows, args.format))
+        return
+    for data_folder, result in sessions:
+        if result is None:
+            continue
+        if len(data_folders) > 1:
+            output.write_lines([f'{result.event} {result.session}'])
+        if driver_name:
+            q1_report, pilots, unreliable_data = session_report(result)
+            index = ReportIndex(q1_report, pilots, unreliable_data)
+            print_report(q1_report, driver_name=driver_name, index=index)
+            continue
+        q1_report = [ReportRow(row.position, row.name, row.car, row.time)
+                     for row in output.session_rows(result, args.team,
+                                                    args.top)]
+        print_report(q1_report, reverse=desc_order,
+                     cut_line=cut_line(data_folder))
+
+
+def print_diagnostics(data_folders: list, fmt: str = 'text'):
+    """Print problems of log files of every folder as text lines or rows of
+    f_one.output in fmt. Problems are collected by build_session while the
+    report is built, log files are not parsed again"""
+    sessions = (build_session(folder) for folder in data_folders)
+    checked = ((result.event, result.session, result.diagnostics)
+               for result in sessions if result is not None)
+    if fmt != 'text':
+        rows = (row for event, session, diagnostics in checked
+                for row in output.diagnostic_rows(event, session,
+                                                  diagnostics))
+        output.write_lines(output.iter_rows(rows, fmt,
+                                            output.DIAGNOSTIC_FIELDS))
+        return
+    for event, session, diagnostics in checked:
+        if len(data_folders) > 1:
+            output.write_lines([f'{event} {session}'])
+        output.write_lines(output.iter_diagnostic_lines(diagnostics))
+
+
+def ordered(rows: list, reverse: bool) -> list:
+    """Return rows in descending order if reverse is True"""
+    return rows[::-1] if reverse else rows
 
 
 def main():
-    pars_args('static/data')
+    try:
+        pars_args('static/data')
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # Reader of piped output (e.g. head) exited, rest of output is dropped
+        sys.stdout = None
 
 
 if __name__ == '__main__':
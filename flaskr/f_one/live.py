@@ -0,0 +1,258 @@
+"""Live timing of qualification session
+Log files are followed as they grow (polling tail, complete lines only) and
+standings are updated incrementally: finished lap changes best lap of one
+driver, which is moved in sorted ranking with bisect instead of sorting whole
+report again. Every change of ranking gets new version number; subscribers
+wait for version newer than the one they have seen.
+
+Classes:
+    LiveStandings(filtering: bool = True)
+    Best laps of drivers kept in sorted ranking
+
+    LogTail(path)
+    Reader of lines appended to file since previous read
+
+    LiveSession(laps_dir: str, interval: float = 1.0)
+    Standings of session updated from log files by background thread
+
+Functions:
+    get_session(laps_dir: str) -> LiveSession | None:
+    Return started live session for directory
+
+    close_sessions():
+    Stop all live sessions and wake their subscribers, so streams end
+"""
+
+import bisect
+import json
+import threading
+
+from f_one import aggregate, f_one, parser
+from f_one.records import ReportRow
+
+
+class LiveStandings:
+    """Best laps of drivers kept in sorted ranking
+    Arguments:
+    filtering -- Skip unreliable laps with negative time (default True)
+    """
+
+    def __init__(self, filtering: bool = True):
+        self.filtering = filtering
+        self._starts = {}  # (code, lap) -> start_ms
+        self._start_count = {}
+        self._end_count = {}
+        self._last = {}  # (log, code) -> last time, finds duplicated lines
+        self._best = {}  # code -> best lap_ms
+        self._ranking = []  # sorted (lap_ms, code), one entry of driver
+
+    def _duplicate(self, log: str, code: str, ms: int) -> bool:
+        """Return True if time repeats the previous time of driver in log,
+        such line is skipped like in aggregate.pair_laps"""
+        if self._last.get((log, code)) == ms:
+            return True
+        self._last[log, code] = ms
+        return False
+
+    def add_start(self, code: str, start_ms: int):
+        if self._duplicate('start', code, start_ms):
+            return
+        lap = self._start_count.get(code, 0) + 1
+        self._start_count[code] = lap
+        self._starts[code, lap] = start_ms
+
+    def add_end(self, code: str, end_ms: int) -> bool:
+        """Pair end with start of the same lap. Return True if ranking
+        changed"""
+        if self._duplicate('end', code, end_ms):
+            return False
+        lap = self._end_count.get(code, 0) + 1
+        self._end_count[code] = lap
+        start_ms = self._starts.pop((code, lap), None)
+        if start_ms is None:
+            return False
+        lap_ms = end_ms - start_ms
+        if self.filtering and lap_ms < 0:
+            return False
+        best = self._best.get(code)
+        if best is not None:
+            if lap_ms >= best:
+                return False
+            self._remove(best, code)
+        self._best[code] = lap_ms
+        bisect.insort(self._ranking, (lap_ms, code))
+        return True
+
+    def _remove(self, lap_ms: int, code: str):
+        """Remove previous best lap of driver from ranking, so every driver
+        is ranked once"""
+        index = bisect.bisect_left(self._ranking, (lap_ms, code))
+        if index < len(self._ranking) and \
+                self._ranking[index] == (lap_ms, code):
+            del self._ranking[index]
+
+    def ranking(self) -> list[tuple[int, str]]:
+        """Return (lap_ms, code) of every driver ordered by best lap"""
+        return list(self._ranking)
+
+
+class LogTail:
+    """Reader of lines appended to file since previous read"""
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self._partial = b''
+
+    def read_lines(self) -> tuple[list[str], bool]:
+        """Return new complete not empty lines and True if file was truncated
+        (lines are read from the beginning of file then)"""
+        truncated = False
+        with open(self.path, 'rb') as file:
+            if file.seek(0, 2) < self.offset:
+                self.offset = 0
+                self._partial = b''
+                truncated = True
+            file.seek(self.offset)
+            data = file.read()
+        self.offset += len(data)
+        data = self._partial + data
+        data, _, self._partial = data.rpartition(b'\n')
+        lines = [line.rstrip() for line in data.decode().split('\n')]
+        return [line for line in lines if line], truncated
+
+
+class LiveSession:
+    """Standings of session updated from log files by background thread
+    Arguments:
+    laps_dir -- Path to directory with log files
+    interval -- Seconds between polls of log files (default 1.0)
+    """
+
+    def __init__(self, laps_dir: str, interval: float = 1.0):
+        self.paths = f_one.generate_file_paths(laps_dir)
+        self.interval = interval
+        self.cut_line = f_one.cut_line(laps_dir)
+        self.version = 0
+        self.payload = None
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._reset()
+
+    def _reset(self):
+        self.pilots = {}
+        self.standings = LiveStandings(filtering=f_one.FILTERING)
+        self._tails = {name: LogTail(path) for name, path in self.paths.items()}
+
+    def poll(self) -> bool:
+        """Read new lines of log files and update standings. Return True if
+        ranking changed"""
+        changed = False
+        lines = {}
+        for name, tail in self._tails.items():
+            lines[name], truncated = tail.read_lines()
+            if truncated:
+                self._reset()
+                return self.poll() or True
+        for line in lines['abbreviations.txt']:
+            fields = line.split('_', 2)
+            if len(fields) == 3:  # malformed lines are skipped
+                code, name, car = fields
+                self.pilots[code] = (name, car)
+                changed = True
+        for line in lines['start.log']:
+            try:
+                self.standings.add_start(*parser.parse_timing(line))
+            except ValueError:
+                continue
+        for line in lines['end.log']:
+            try:
+                changed |= self.standings.add_end(*parser.parse_timing(line))
+            except ValueError:
+                continue
+        if changed or self.payload is None:
+            self._publish()
+        return changed
+
+    def report(self) -> list[tuple]:
+        """Return standings in format of f_one.build_report"""
+        report = []
+        for position, (lap_ms, code) in enumerate(self.standings.ranking(), 1):
+            name, car = self.pilots.get(code, (code, ''))
+            report.append(ReportRow(position, name, car,
+                                    aggregate.format_lap_time(lap_ms)))
+        return report
+
+    def _publish(self):
+        cut_line = self.cut_line
+        payload = json.dumps({'results': self.report(),
+                              'first_out': None if cut_line is None
+                              else cut_line + 1})
+        with self._condition:
+            self.version += 1
+            self.payload = payload
+            self._condition.notify_all()
+
+    @property
+    def closed(self) -> bool:
+        return self._stopped.is_set()
+
+    def wait(self, version: int, timeout: float = None) -> tuple[int, str]:
+        """Wait until version of standings is newer than version or session
+        is stopped. Return (version, JSON payload), payload is None on
+        timeout or stop"""
+        with self._condition:
+            if not self._condition.wait_for(
+                    lambda: self.version > version or self.closed, timeout) \
+                    or self.closed:
+                return version, None
+            return self.version, self.payload
+
+    def start(self):
+        self.poll()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop polling and wake subscribers waiting for new version"""
+        self._stopped.set()
+        with self._condition:
+            self._condition.notify_all()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.poll()
+            except (OSError, ValueError) as error:
+                print(f'Live timing poll failed: {error}')
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(laps_dir: str) -> LiveSession | None:
+    """Return started live session for directory. Sessions are shared by all
+    subscribers"""
+    paths = f_one.generate_file_paths(laps_dir)
+    if paths is None:
+        return None
+    key = str(paths['start.log'].parent)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = LiveSession(laps_dir)
+            session.start()
+            _sessions[key] = session
+    return session
+
+
+def close_sessions():
+    """Stop all live sessions and wake their subscribers, so streams of
+    standings end (server shuts down). Next get_session starts new session"""
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.stop()
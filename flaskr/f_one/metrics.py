@@ -0,0 +1,201 @@
+"""Lightweight instrumentation of report pipeline
+Counters and histograms are kept in memory and rendered in Prometheus text
+format. Stages of the pipeline (parse, aggregate, serialize, render) are
+timed with stage_timer(), report caches count hits and misses.
+
+SamplingProfiler samples the stack of one thread from a background thread
+and returns collapsed stacks (flame graph format). It costs nothing while it
+is not started.
+
+Classes:
+    Counter(name: str, documentation: str, labels: tuple = ())
+    Monotonic counter with labels
+
+    Histogram(name: str, documentation: str, labels: tuple = (),
+              buckets: tuple = BUCKETS)
+    Distribution of observed values with labels
+
+    SamplingProfiler(thread_id: int, interval: float = 0.001)
+    Sampling profiler of one thread
+
+Functions:
+    stage_timer(stage: str):
+    Context manager that observes duration of pipeline stage
+
+    render() -> str:
+    Return all metrics in Prometheus text format
+
+Vars:
+    stage_duration - histogram of pipeline stages duration
+    cache_requests - counter of report cache hits and misses
+    http_duration - histogram of HTTP requests duration
+"""
+
+import bisect
+import collections
+import contextlib
+import sys
+import threading
+import time
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0, 10.0)
+
+REGISTRY = []
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')
+
+
+def _labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """Monotonic counter with labels"""
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values,
+                                                          0) + amount
+
+    def value(self, *label_values) -> float:
+        return self._values.get(label_values, 0)
+
+    def collect(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} counter']
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f'{self.name}'
+                             f'{_labels(self.labels, label_values)} {value}')
+        return lines
+
+
+class Histogram:
+    """Distribution of observed values with labels"""
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (),
+                 buckets: tuple = BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (
+                        len(self.buckets) + 3)
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, *label_values) -> int:
+        series = self._series.get(label_values)
+        return 0 if series is None else series[-1]
+
+    @contextlib.contextmanager
+    def time(self, *label_values):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def collect(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} histogram']
+        with self._lock:
+            series_items = sorted((k, list(v)) for k, v in self._series.items())
+        for label_values, series in series_items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f'{self.name}_bucket'
+                             f'{_labels(self.labels, label_values, le)} '
+                             f'{cumulative}')
+            labels = _labels(self.labels, label_values)
+            lines.append(f'{self.name}_sum{labels} {series[-2]}')
+            lines.append(f'{self.name}_count{labels} {series[-1]}')
+        return lines
+
+
+stage_duration = Histogram('f1_stage_duration_seconds',
+                           'Duration of report pipeline stages', ('stage',))
+cache_requests = Counter('f1_report_cache_requests_total',
+                         'Requests of cached reports', ('cache', 'result'))
+http_duration = Histogram('f1_http_request_duration_seconds',
+                          'Duration of HTTP requests',
+                          ('route', 'method', 'status'))
+
+
+def stage_timer(stage: str):
+    """Context manager that observes duration of pipeline stage"""
+    return stage_duration.time(stage)
+
+
+def render() -> str:
+    """Return all metrics in Prometheus text format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.collect())
+    return '\n'.join(lines) + '\n'
+
+
+class SamplingProfiler:
+    """Sampling profiler of one thread
+    Arguments:
+    thread_id -- Identifier of profiled thread (threading.get_ident())
+    interval -- Seconds between samples (default 0.001)
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = collections.Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> collections.Counter:
+        self._stopped.set()
+        self._thread.join()
+        return self.samples
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_filename}:{code.co_name}')
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        """Return samples as collapsed stacks: 'frame;frame;frame count'"""
+        return ''.join(f'{stack} {count}\n'
+                       for stack, count in self.samples.most_common())
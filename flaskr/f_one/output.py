@@ -0,0 +1,166 @@
+"""Streaming output of command line reports
+Lines are written to one text stream in chunks of CHUNK_LINES lines, so
+large reports are not written with a print call per line. Machine-readable
+formats have one row per driver of every session with FIELDS columns:
+
+    csv -- header row and one row per driver
+    json -- one array of objects, written while rows are produced
+    ndjson -- one JSON object per line
+
+With --diagnostics rows are DiagnosticRow: problems of log files of every
+session (f_one.validation).
+
+Classes:
+    OutputRow(NamedTuple)
+    Result of driver in session
+
+    DiagnosticRow(NamedTuple)
+    Problem of log file of session
+
+Functions:
+    session_rows(result: SessionResult, team: str = None, top: int = None,
+                 driver: str = None) -> list[OutputRow]:
+    Return rows of session standings, filtered by team and driver
+
+    diagnostic_rows(event: str, session: str, diagnostics)
+                    -> Iterator[DiagnosticRow]:
+    Yield rows of diagnostics of session
+
+    iter_diagnostic_lines(diagnostics) -> Iterator[str]:
+    Yield text lines of diagnostics with count of every kind
+
+    iter_rows(rows, fmt: str, fields: tuple = FIELDS) -> Iterator[str]:
+    Yield lines of rows in format csv, json or ndjson
+
+    write_lines(lines, out=None):
+    Write lines to out (default sys.stdout) in chunks
+"""
+
+import csv
+import io
+import json
+import sys
+from itertools import islice
+from typing import Iterator, NamedTuple
+from f_one import aggregate
+
+FORMATS = ('text', 'csv', 'json', 'ndjson')
+CHUNK_LINES = 1000
+
+
+class OutputRow(NamedTuple):
+    """Result of driver in session"""
+    event: str
+    session: str
+    position: int
+    code: str
+    name: str
+    car: str
+    time: str
+    lap_ms: int
+    gap_to_leader_ms: int
+
+
+FIELDS = OutputRow._fields
+
+
+class DiagnosticRow(NamedTuple):
+    """Problem of log file of session"""
+    event: str
+    session: str
+    kind: str
+    file: str
+    line: int | None
+    code: str | None
+    message: str
+
+
+DIAGNOSTIC_FIELDS = DiagnosticRow._fields
+
+
+def session_rows(result: aggregate.SessionResult, team: str = None,
+                 top: int = None, driver: str = None) -> list[OutputRow]:
+    """Return rows of session standings in order of position
+    Arguments:
+    result -- Session built by f_one.build_session
+    team -- Only drivers of team (car), case insensitive (default None)
+    top -- Only first top rows after team filter (default None - all rows)
+    driver -- Only driver with this name or code (default None)
+    """
+    rows = []
+    team = team.upper() if team else None
+    for standing in result.standings:
+        name, car = result.pilots.get(standing.code, (standing.code, ''))
+        if team is not None and car.upper() != team:
+            continue
+        if driver is not None and driver not in (name, standing.code) and \
+                driver.upper() != standing.code:
+            continue
+        rows.append(OutputRow(result.event, result.session, standing.position,
+                              standing.code, name, car,
+                              aggregate.format_lap_time(standing.lap_ms),
+                              standing.lap_ms, standing.gap_to_leader))
+        if top is not None and len(rows) == top:
+            break
+    return rows
+
+
+def diagnostic_rows(event: str, session: str,
+                    diagnostics) -> Iterator[DiagnosticRow]:
+    """Yield rows of diagnostics (f_one.validation.Diagnostics) of
+    session"""
+    for diagnostic in diagnostics:
+        yield DiagnosticRow(event, session, *diagnostic)
+
+
+def iter_diagnostic_lines(diagnostics) -> Iterator[str]:
+    """Yield line file:line kind code message for every diagnostic and
+    summary line with count of every kind"""
+    for kind, file, line, code, message in diagnostics:
+        place = file if line is None else f'{file}:{line}'
+        yield f'{place} {kind} {code or "-"} {message}'
+    counts = ', '.join(f'{kind} {count}' for kind, count
+                       in sorted(diagnostics.counts.items()))
+    yield f'{len(diagnostics)} problems' + (f': {counts}' if counts else '')
+
+
+def _iter_csv(rows) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='')
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def iter_rows(rows, fmt: str, fields: tuple = FIELDS) -> Iterator[str]:
+    """Yield lines of rows in format csv, json or ndjson. Fields are header
+    of csv"""
+    if fmt == 'csv':
+        yield ','.join(fields)
+        yield from _iter_csv(rows)
+    elif fmt == 'ndjson':
+        for row in rows:
+            yield json.dumps(row._asdict())
+    elif fmt == 'json':
+        yield '['
+        previous = None
+        for row in rows:
+            if previous is not None:
+                yield previous + ','
+            previous = json.dumps(row._asdict())
+        if previous is not None:
+            yield previous
+        yield ']'
+    else:
+        raise ValueError(f'Unknown format: {fmt}')
+
+
+def write_lines(lines, out=None):
+    """Write lines to out (default sys.stdout) in chunks of CHUNK_LINES
+    lines, every line is ended with line break"""
+    out = out or sys.stdout
+    lines = iter(lines)
+    while chunk := list(islice(lines, CHUNK_LINES)):
+        out.write('\n'.join(chunk) + '\n')
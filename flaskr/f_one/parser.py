@@ -0,0 +1,166 @@
+"""Streaming parser of Formula 1 log files
+Files are read line by line, so memory does not grow with the size of the
+log. Timestamps have fixed width and are parsed with slicing and integer
+arithmetic instead of datetime.strptime.
+
+Malformed lines are skipped instead of stopping the whole report. Every
+iterator takes optional diagnostics collector (f_one.validation.Diagnostics)
+that gets malformed lines, duplicate driver codes and lines with trailing
+whitespace during the same pass over the file.
+
+Format of abbreviations.txt:
+SVF_Sebastian Vettel_FERRARI
+
+Format of start.log and end.log:
+SVF2018-05-24_12:02:58.917
+positions: 0-2 code, 3-12 date, 14-15 hours, 17-18 minutes, 20-21 seconds,
+23-25 milliseconds
+
+Functions:
+    iter_lines(path, diagnostics=None) -> Iterator[str]:
+    Yield not empty lines of file without trailing whitespace
+
+    iter_numbered_lines(path, diagnostics=None) -> Iterator[tuple[int, str]]:
+    Yield (line number, line) for not empty lines of file
+
+    iter_abbreviations(path, diagnostics=None) -> Iterator[Pilot]:
+    Yield Pilot(code, name, car) for every valid line of abbreviations file
+
+    iter_timings(path, diagnostics=None) -> Iterator[tuple[str, int]]:
+    Yield (code, epoch milliseconds) for every valid line of start or end log
+
+    parse_timing(line: str) -> tuple[str, int]:
+    Return (code, epoch milliseconds) for one line of start or end log
+
+    parse_timestamp(time: str) -> int:
+    Convert YYYY-MM-DD_HH:MM:SS.mmm string to epoch milliseconds
+
+    ms_to_datetime(ms: int) -> datetime.datetime:
+    Convert epoch milliseconds to naive datetime
+"""
+
+import datetime
+from typing import Iterator
+from f_one.records import Pilot
+
+EPOCH = datetime.datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+MS_PER_DAY = 86_400_000
+TIMING_LENGTH = 26  # SVF2018-05-24_12:02:58.917
+
+_days_cache = {}
+
+
+def _days_since_epoch(date: str) -> int:
+    """Return number of days from 1970-01-01 to YYYY-MM-DD date. Logs have
+    only a few distinct dates, so results are cached"""
+    try:
+        return _days_cache[date]
+    except KeyError:
+        days = datetime.date(int(date[0:4]), int(date[5:7]),
+                             int(date[8:10])).toordinal() - EPOCH_ORDINAL
+        _days_cache[date] = days
+        return days
+
+
+def parse_timestamp(time: str) -> int:
+    """Convert YYYY-MM-DD_HH:MM:SS.mmm string to epoch milliseconds"""
+    return (_days_since_epoch(time[0:10]) * MS_PER_DAY
+            + int(time[11:13]) * 3_600_000
+            + int(time[14:16]) * 60_000
+            + int(time[17:19]) * 1000
+            + int(time[20:23]))
+
+
+def parse_timing(line: str) -> tuple[str, int]:
+    """Return (code, epoch milliseconds) for one line of start or end log.
+    Raise ValueError for malformed line"""
+    if len(line) != TIMING_LENGTH:
+        raise ValueError(f'expected {TIMING_LENGTH} characters: {line!r}')
+    return line[0:3], parse_timestamp(line[3:])
+
+
+def ms_to_datetime(ms: int) -> datetime.datetime:
+    """Convert epoch milliseconds to naive datetime"""
+    return EPOCH + datetime.timedelta(milliseconds=ms)
+
+
+def iter_numbered_lines(path, diagnostics=None) -> Iterator[tuple[int, str]]:
+    """Yield (line number, line without trailing whitespace) for not empty
+    lines of file. Lines with spaces or tabs before line break are reported
+    to diagnostics"""
+    with open(path, 'r') as file:
+        for number, raw in enumerate(file, 1):
+            line = raw.rstrip()
+            if not line:
+                continue
+            if diagnostics is not None and len(line) != len(raw.rstrip('\r\n')):
+                diagnostics.add('trailing_whitespace', path, number,
+                                line[0:3], 'whitespace at the end of line')
+            yield number, line
+
+
+def iter_lines(path, diagnostics=None) -> Iterator[str]:
+    """Yield not empty lines of file without trailing whitespace"""
+    for _, line in iter_numbered_lines(path, diagnostics):
+        yield line
+
+
+def iter_abbreviations(path, diagnostics=None) -> Iterator[Pilot]:
+    """Yield Pilot(code, name, car) for every line of abbreviations file.
+    Lines without code, name and car are skipped, lines with code that was
+    already seen are reported to diagnostics and skipped"""
+    codes = set()
+    for number, line in iter_numbered_lines(path, diagnostics):
+        fields = line.split('_', 2)
+        if len(fields) != 3 or len(fields[0]) != 3:
+            if diagnostics is not None:
+                diagnostics.add('malformed', path, number, line[0:3],
+                                f'expected CODE_Name_Car: {line!r}')
+            continue
+        if fields[0] in codes:
+            if diagnostics is not None:
+                diagnostics.add('duplicate', path, number, fields[0],
+                                'driver code is already defined')
+            continue
+        codes.add(fields[0])
+        yield Pilot(*fields)
+
+
+def iter_timings(path, diagnostics=None) -> Iterator[tuple[str, int]]:
+    """Yield (code, epoch milliseconds) for every line of start or end log.
+    Malformed lines are skipped and reported to diagnostics"""
+    days_cache = _days_cache
+    # Lines are read here and not with iter_numbered_lines: one generator
+    # less per line in the hottest loop of parsing
+    with open(path, 'r') as file:
+        for number, raw in enumerate(file, 1):
+            line = raw.rstrip()
+            if not line:
+                continue
+            if diagnostics is not None and \
+                    len(line) != len(raw.rstrip('\r\n')):
+                diagnostics.add('trailing_whitespace', path, number,
+                                line[0:3], 'whitespace at the end of line')
+            if len(line) != TIMING_LENGTH:
+                if diagnostics is not None:
+                    diagnostics.add('malformed', path, number, line[0:3],
+                                    f'expected {TIMING_LENGTH} characters: '
+                                    f'{line!r}')
+                continue
+            try:
+                date = line[3:13]
+                days = days_cache.get(date)
+                if days is None:
+                    days = _days_since_epoch(date)
+                ms = (days * MS_PER_DAY
+                      + int(line[14:16]) * 3_600_000
+                      + int(line[17:19]) * 60_000
+                      + int(line[20:22]) * 1000
+                      + int(line[23:26]))
+            except ValueError as error:
+                if diagnostics is not None:
+                    diagnostics.add('malformed', path, number, line[0:3],
+                                    f'{error}: {line!r}')
+                continue
+            yield line[0:3], ms
@@ -0,0 +1,111 @@
+"""Record types shared by f_one, db, web app and API
+Rows are NamedTuples: they take as much memory as plain tuples, still can be
+unpacked and indexed like the lists and tuples used before, and serialize to
+the same JSON arrays.
+
+For big datasets laps are kept in LapTable: columns of fixed-width arrays
+(driver index, lap number, start and end epoch milliseconds) with a string
+table of driver codes, about 24 bytes per lap instead of a tuple with four
+Python objects.
+
+Classes:
+    Pilot(NamedTuple)
+    Driver code, name and car
+
+    Lap(NamedTuple)
+    Lap of driver with start and end in epoch milliseconds
+
+    ReportRow(NamedTuple)
+    Row of qualification report: position, pilot, car, formatted time
+
+    LapTable()
+    Columnar storage of laps
+"""
+
+from array import array
+from typing import Iterator, NamedTuple
+
+
+class Pilot(NamedTuple):
+    """Driver code, name and car"""
+    code: str
+    name: str
+    car: str
+
+
+class Lap(NamedTuple):
+    """Lap of driver with start and end in epoch milliseconds"""
+    code: str
+    lap: int
+    start_ms: int
+    end_ms: int
+
+    @property
+    def lap_ms(self) -> int:
+        return self.end_ms - self.start_ms
+
+
+class ReportRow(NamedTuple):
+    """Row of qualification report. Position is 'Unknown' and time is
+    'Unreliable' for drivers without reliable laps"""
+    position: int | str
+    pilot: str
+    car: str
+    time: str
+
+
+class LapTable:
+    """Columnar storage of laps
+    Columns:
+    driver -- index of driver code in codes list
+    lap -- lap number
+    start_ms, end_ms -- epoch milliseconds
+    """
+
+    __slots__ = ('codes', '_code_index', 'driver', 'lap', 'start_ms',
+                 'end_ms')
+
+    def __init__(self):
+        self.codes = []
+        self._code_index = {}
+        self.driver = array('I')
+        self.lap = array('I')
+        self.start_ms = array('q')
+        self.end_ms = array('q')
+
+    @classmethod
+    def from_laps(cls, laps) -> 'LapTable':
+        """Return table with laps from iterable of (code, lap, start_ms,
+        end_ms)"""
+        table = cls()
+        for code, lap, start_ms, end_ms in laps:
+            table.append(code, lap, start_ms, end_ms)
+        return table
+
+    def code_index(self, code: str) -> int:
+        """Return index of driver code in string table, add new codes"""
+        index = self._code_index.get(code)
+        if index is None:
+            index = self._code_index[code] = len(self.codes)
+            self.codes.append(code)
+        return index
+
+    def append(self, code: str, lap: int, start_ms: int, end_ms: int):
+        self.driver.append(self.code_index(code))
+        self.lap.append(lap)
+        self.start_ms.append(start_ms)
+        self.end_ms.append(end_ms)
+
+    def __len__(self) -> int:
+        return len(self.driver)
+
+    def __iter__(self) -> Iterator[Lap]:
+        codes = self.codes
+        for driver, lap, start_ms, end_ms in zip(self.driver, self.lap,
+                                                 self.start_ms, self.end_ms):
+            yield Lap(codes[driver], lap, start_ms, end_ms)
+
+    def lap_times(self) -> array:
+        """Return column of lap times in milliseconds"""
+        return array('q', (end - start for start, end in zip(self.start_ms,
+                                                             self.end_ms)))
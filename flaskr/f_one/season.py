@@ -0,0 +1,200 @@
+"""Reports of all events of a season archive
+Archive is a root directory with one directory per event and session (any
+depth), every one with abbreviations.txt, start.log and end.log. Sessions are
+parsed and aggregated in parallel by ProcessPoolExecutor workers, results are
+merged in the parent process into classification of every event and season
+standings.
+
+Classification of event follows qualification rules: drivers of the last
+session (Q3) first, then the rest of Q2 and the rest of Q1. Season standings
+rank drivers by average event position, then by number of poles.
+
+Classes:
+    SeasonStanding(NamedTuple)
+    Season result of driver
+
+    SeasonResult(NamedTuple)
+    Sessions, event classifications and season standings
+
+Functions:
+    discover_sessions(root) -> list[Path]:
+    Return sorted directories with log files under root
+
+    event_name(dir_path, root) -> tuple[str, str]:
+    Return (event, session) of directory, event is path relative to root
+
+    build_sessions(dirs: list, workers: int = None) -> list:
+    Build SessionResult of every directory in process pool
+
+    classify_event(sessions: list) -> list[str]:
+    Return driver codes in order of event classification
+
+    season_standings(classifications: dict, pilots: dict) -> list:
+    Merge event classifications into season standings
+
+    build_season(root, workers: int = None, output_dir=None) -> SeasonResult:
+    Build reports of all sessions under root and season standings
+
+    write_session(result: SessionResult, output_dir) -> Path:
+    Write report of session to output_dir/<event>/<session>.json
+
+    print_standings(standings: list):
+    Print season standings in format POS.DRIVER|CAR|EVENTS|POLES|AVG
+"""
+
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import NamedTuple
+from f_one import aggregate, f_one
+
+LOG_FILES = ('abbreviations.txt', 'start.log', 'end.log')
+
+
+class SeasonStanding(NamedTuple):
+    """Season result of driver"""
+    position: int
+    code: str
+    name: str
+    car: str
+    events: int
+    poles: int
+    best_position: int
+    average_position: float
+
+
+class SeasonResult(NamedTuple):
+    """Sessions, event classifications and season standings"""
+    sessions: list  # SessionResult with event relative to root
+    classifications: dict  # event -> driver codes
+    standings: list  # SeasonStanding
+
+
+def discover_sessions(root) -> list[Path]:
+    """Return sorted directories with log files under root. Relative root is
+    resolved from flaskr directory like in f_one.generate_file_paths"""
+    root = Path(__file__).resolve().parents[1].joinpath(root)
+    if not root.is_dir():
+        print(f'Cannot open {root} folder')
+        return []
+    return sorted(path.parent for path in root.rglob(LOG_FILES[1])
+                  if all((path.parent / name).is_file() for name in LOG_FILES))
+
+
+def event_name(dir_path, root) -> tuple[str, str]:
+    """Return (event, session) of directory, event is path of event directory
+    relative to root, so events of different seasons do not clash"""
+    dir_path = Path(dir_path)
+    root = Path(__file__).resolve().parents[1].joinpath(root)
+    event, session = aggregate.session_of(dir_path)
+    event_dir = dir_path.parent if dir_path.name.upper() in \
+        aggregate.SESSIONS else dir_path
+    if event_dir != root and event_dir.is_relative_to(root):
+        event = event_dir.relative_to(root).as_posix()
+    return event, session
+
+
+def build_sessions(dirs: list, workers: int = None) -> list:
+    """Build SessionResult of every directory in process pool. Directories
+    are built in this process if workers is 1 or there is one directory
+    Arguments:
+    dirs -- List of directories with log files
+    workers -- Number of worker processes (default None - number of CPUs)
+    """
+    dirs = [str(dir_path) for dir_path in dirs]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(dirs) < 2:
+        return [f_one.build_session(dir_path) for dir_path in dirs]
+    workers = min(workers, len(dirs))
+    chunksize = max(1, len(dirs) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(f_one.build_session, dirs,
+                                 chunksize=chunksize))
+
+
+def classify_event(sessions: list) -> list[str]:
+    """Return driver codes in order of event classification: standings of
+    the latest session first, then drivers eliminated in earlier sessions"""
+    order = {session: index for index, session in
+             enumerate(aggregate.SESSIONS)}
+    classification = []
+    classified = set()
+    for result in sorted(sessions, key=lambda result: order[result.session],
+                         reverse=True):
+        for standing in result.standings:
+            if standing.code not in classified:
+                classified.add(standing.code)
+                classification.append(standing.code)
+    return classification
+
+
+def season_standings(classifications: dict, pilots: dict) -> list:
+    """Merge event classifications into season standings
+    Arguments:
+    classifications -- Dict event -> driver codes in order of classification
+    pilots -- Dict code -> (name, car)
+    """
+    positions = {}
+    for codes in classifications.values():
+        for position, code in enumerate(codes, 1):
+            positions.setdefault(code, []).append(position)
+    ranked = sorted(positions.items(), key=lambda item: (
+        sum(item[1]) / len(item[1]), -item[1].count(1), item[0]))
+    standings = []
+    for position, (code, driver_positions) in enumerate(ranked, 1):
+        name, car = pilots.get(code, (code, ''))
+        standings.append(SeasonStanding(
+            position, code, name, car, len(driver_positions),
+            driver_positions.count(1), min(driver_positions),
+            round(sum(driver_positions) / len(driver_positions), 2)))
+    return standings
+
+
+def build_season(root, workers: int = None, output_dir=None) -> SeasonResult:
+    """Build reports of all sessions under root and season standings
+    Arguments:
+    root -- Root directory of season archive
+    workers -- Number of worker processes (default None - number of CPUs)
+    output_dir -- Directory for per-session reports (default None - reports
+    are not written)
+    """
+    dirs = discover_sessions(root)
+    sessions = []
+    events = {}
+    pilots = {}
+    for dir_path, result in zip(dirs, build_sessions(dirs, workers)):
+        if result is None:
+            continue
+        event, session = event_name(dir_path, root)
+        result = result._replace(event=event, session=session)
+        sessions.append(result)
+        events.setdefault(event, []).append(result)
+        pilots.update(result.pilots)
+        if output_dir is not None:
+            write_session(result, output_dir)
+    classifications = {event: classify_event(event_sessions)
+                       for event, event_sessions in events.items()}
+    return SeasonResult(sessions, classifications,
+                        season_standings(classifications, pilots))
+
+
+def write_session(result: aggregate.SessionResult, output_dir) -> Path:
+    """Write report of session to output_dir/<event>/<session>.json"""
+    report, pilots, unreliable_data = f_one.session_report(result)
+    path = Path(output_dir) / result.event / f'{result.session}.json'
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as file:
+        json.dump({'event': result.event, 'session': result.session,
+                   'results': report, 'unreliable': unreliable_data}, file)
+    return path
+
+
+def print_standings(standings: list):
+    """Print season standings in format POS.DRIVER|CAR|EVENTS|POLES|AVG"""
+    template = "{0:3}.{1:20}|{2:26}|{3:6}|{4:5}|{5:6}"
+    print(template.format("POS", "DRIVER", "CAR", "EVENTS", "POLES", "AVG"))
+    for standing in standings:
+        print(template.format(standing.position, standing.name, standing.car,
+                              standing.events, standing.poles,
+                              standing.average_position))
@@ -0,0 +1,118 @@
+"""Validation of log files with structured diagnostics
+Problems of log files are collected while the files are parsed for the
+report: parser, aggregate.pair_laps and check_laps take Diagnostics
+collector, columnar.compile_laps stores the diagnostics in the compiled file
+and f_one.build_session returns them with the session. Validation does not
+read log files again and never stops the report:
+
+    malformed -- line that cannot be parsed, it is skipped
+    duplicate -- driver code defined twice in abbreviations.txt or the same
+    start or end time of driver logged twice, the copy is skipped
+    unknown_code -- driver in start.log or end.log without abbreviation
+    unmatched_start -- lap started but never ended
+    unmatched_end -- lap ended without start, it is skipped
+    implausible_lap -- lap time not in PLAUSIBLE_LAP_MS range (negative laps
+    are unreliable and filtered by f_one.FILTERING)
+    trailing_whitespace -- spaces or tabs before line break
+
+Cost is bounded: every kind is counted, but only MAX_PER_KIND diagnostics of
+every kind are kept.
+
+Classes:
+    Diagnostic(NamedTuple)
+    One problem of log file
+
+    Diagnostics(max_per_kind: int = MAX_PER_KIND)
+    Collector of diagnostics with count of every kind
+
+Functions:
+    check_laps(laps, codes, diagnostics: Diagnostics) -> Iterator[Lap]:
+    Yield laps, report unknown driver codes and implausible lap times
+"""
+
+from pathlib import Path
+from typing import Iterator, NamedTuple
+from f_one.records import Lap
+
+PLAUSIBLE_LAP_MS = (30_000, 600_000)
+MAX_PER_KIND = 100
+
+
+class Diagnostic(NamedTuple):
+    """One problem of log file. Line is None for problems of laps found
+    after pairing starts and ends"""
+    kind: str
+    file: str
+    line: int | None
+    code: str | None
+    message: str
+
+
+class Diagnostics:
+    """Collector of diagnostics with count of every kind
+    Arguments:
+    max_per_kind -- Diagnostics of one kind kept, the rest are only counted
+    (default MAX_PER_KIND)
+    """
+
+    def __init__(self, max_per_kind: int = MAX_PER_KIND):
+        self.max_per_kind = max_per_kind
+        self.counts = {}
+        self.items = []
+
+    def add(self, kind: str, file, line: int = None, code: str = None,
+            message: str = ''):
+        """Count diagnostic, keep it if there are less than max_per_kind
+        diagnostics of its kind"""
+        count = self.counts.get(kind, 0) + 1
+        self.counts[kind] = count
+        if count <= self.max_per_kind:
+            self.items.append(Diagnostic(kind, Path(file).name, line, code,
+                                         message))
+
+    def __len__(self) -> int:
+        return sum(self.counts.values())
+
+    def __iter__(self) -> Iterator[Diagnostic]:
+        return iter(self.items)
+
+    def to_dict(self) -> dict:
+        """Return total, count of every kind, truncated flag and kept
+        diagnostics"""
+        return {'total': len(self),
+                'counts': dict(sorted(self.counts.items())),
+                'truncated': len(self.items) < len(self),
+                'diagnostics': [item._asdict() for item in self.items]}
+
+    @classmethod
+    def from_dict(cls, data: dict,
+                  max_per_kind: int = MAX_PER_KIND) -> 'Diagnostics':
+        """Return diagnostics from result of to_dict"""
+        diagnostics = cls(max_per_kind)
+        diagnostics.counts = dict(data['counts'])
+        diagnostics.items = [Diagnostic(**item)
+                             for item in data['diagnostics']]
+        return diagnostics
+
+
+def check_laps(laps, codes, diagnostics: Diagnostics) -> Iterator[Lap]:
+    """Yield laps, report laps of drivers without abbreviation (once per
+    driver) and lap times out of PLAUSIBLE_LAP_MS range
+    Arguments:
+    laps -- Iterable of Lap from aggregate.pair_laps
+    codes -- Codes of drivers of abbreviations.txt
+    diagnostics -- Collector of problems
+    """
+    low, high = PLAUSIBLE_LAP_MS
+    unknown = set()
+    for lap in laps:
+        code = lap.code
+        if code not in codes and code not in unknown:
+            unknown.add(code)
+            diagnostics.add('unknown_code', 'abbreviations.txt', None, code,
+                            'driver has laps but no abbreviation')
+        lap_ms = lap.end_ms - lap.start_ms
+        if not low <= lap_ms <= high:
+            diagnostics.add('implausible_lap', 'end.log', None, code,
+                            f'lap {lap.lap} time {lap_ms} ms')
+        yield lap
@@ -1,7 +1,70 @@
+"""Database models of Formula 1 qualification data
+Database file has absolute path (f1.sqlite3 next to this module by default),
+so it does not depend on working directory. Connections are pooled and every
+new connection gets PRAGMAS: WAL journal lets readers work while db.py
+ingests laps, synchronous=NORMAL is safe with WAL and makes commits cheaper,
+cache_size and mmap_size keep hot pages in memory.
+
+Functions:
+    configure(path=None, **pragmas):
+    Point db to database file, pragmas override PRAGMAS
+
+    connection():
+    Context manager that opens connection of current thread if it is closed
+    and closes only the connection it opened
+
+    lap_filters(session: str, event: str = None) -> list:
+    Return conditions of finished laps of session
+
+    ranked_query(session: str, event: str = None, filtering: bool = True):
+    Return (code, name, car, best lap time) of drivers ordered by best lap
+
+    bump_data_version():
+    Increment version of data, called by every write of db.py
+
+    data_version() -> int:
+    Return version of data, 0 if it was never written
+"""
+
+import contextlib
+from pathlib import Path
 from peewee import *
+from playhouse.pool import PooledSqliteDatabase
+
+DATABASE_PATH = Path(__file__).resolve().parent / 'f1.sqlite3'
+PRAGMAS = {
+    'foreign_keys': 1,
+    'journal_mode': 'wal',
+    'synchronous': 1,  # NORMAL
+    'cache_size': -64 * 1024,  # negative value is size in KiB: 64 MiB
+    'mmap_size': 256 * 1024 * 1024,
+}
+MAX_CONNECTIONS = 32
+
+# Pooled connection can be taken by any thread, but only one at a time
+db = PooledSqliteDatabase(str(DATABASE_PATH), pragmas=PRAGMAS,
+                          max_connections=MAX_CONNECTIONS, stale_timeout=300,
+                          timeout=10, check_same_thread=False)
+
 
+def configure(path=None, **pragmas):
+    """Point db to database file (default DATABASE_PATH), pragmas override
+    PRAGMAS. Pooled connections to previous file are closed"""
+    db.close_all()
+    db.init(str(path or DATABASE_PATH), pragmas={**PRAGMAS, **pragmas},
+            check_same_thread=False)
 
-db = SqliteDatabase('f1.sqlite3', pragmas={'foreign_keys': 1})
+
+@contextlib.contextmanager
+def connection():
+    """Open connection of current thread if it is closed, close only the
+    connection opened here. Connection opened by request hook is reused"""
+    opened = db.connect(reuse_if_open=True)
+    try:
+        yield db
+    finally:
+        if opened:
+            db.close()
 
 
 class Driver(Model):
@@ -14,10 +77,111 @@ class Driver(Model):
 
 
 class Qualification(Model):
+    event = CharField(default='')
+    session = CharField(default='Q1')
     driver_code = ForeignKeyField(Driver, on_delete='CASCADE')
-    start = DateTimeField()
-    stop = DateTimeField()
-    lap_time = FloatField()
+    lap = IntegerField(default=1)
+    start = DateTimeField(null=True)
+    stop = DateTimeField(null=True)
+    lap_time = FloatField(null=True, index=True)  # NULL until lap is finished
+
+    class Meta:
+        database = db
+        indexes = (
+            (('event', 'session', 'driver_code', 'lap'), True),
+        )
+
+
+class Standings(Model):
+    """Materialized ranked results of event session, refreshed by db.py in
+    one transaction after laps of the session are stored. Unreliable drivers
+    (no laps with positive time) have NULL position and best_lap_ms"""
+    event = CharField()
+    session = CharField()
+    position = IntegerField(null=True)
+    driver_code = ForeignKeyField(Driver, on_delete='CASCADE')
+    driver_name = CharField()
+    car = CharField()
+    best_lap_ms = IntegerField(null=True)
+    time = CharField()  # formatted best lap or 'Unreliable'
+    reliable = BooleanField()
 
     class Meta:
         database = db
+        indexes = (
+            (('event', 'session', 'position'), False),
+            (('event', 'session', 'driver_code'), True),
+        )
+
+
+def lap_filters(session: str, event: str = None) -> list:
+    """Return conditions of finished laps of session, of every event if
+    event is None"""
+    filters = [Qualification.session == session,
+               Qualification.lap_time.is_null(False)]
+    if event is not None:
+        filters.append(Qualification.event == event)
+    return filters
+
+
+def ranked_query(session: str, event: str = None, filtering: bool = True):
+    """Return query with (code, name, car, best lap time) of every driver of
+    session, ordered by best lap. Best lap is NULL if driver has no reliable
+    laps. Shared by db.py (to materialize Standings) and repository.py
+    Arguments:
+    session -- Name of session
+    event -- Name of event, None for all events (default None)
+    filtering -- Laps with negative time are not reliable (default True)
+    """
+    if filtering:
+        lap_time = Case(None, [(Qualification.lap_time >= 0,
+                                Qualification.lap_time)])
+    else:
+        lap_time = Qualification.lap_time
+    best = fn.MIN(lap_time).alias('best')
+    return (Qualification
+            .select(Driver.driver_code, Driver.driver_name, Driver.car, best)
+            .join(Driver)
+            .where(*lap_filters(session, event))
+            .group_by(Driver.driver_code)
+            .order_by(SQL('best IS NULL'), SQL('best'))
+            .tuples())
+
+
+class IngestWatermark(Model):
+    """Part of log file that is already stored in database: offset after the
+    last ingested line and checksum of up to 4 KiB of data before it"""
+    path = CharField(primary_key=True)
+    offset = IntegerField(default=0)
+    checksum = CharField(default='')
+
+    class Meta:
+        database = db
+
+
+class DataVersion(Model):
+    """Counter incremented in every write transaction of db.py. Reports are
+    cached until it changes, so upserts that keep count and ids of rows (new
+    name or car of driver, replaced laps) are noticed too"""
+    version = IntegerField(default=0)
+
+    class Meta:
+        database = db
+
+
+def bump_data_version():
+    """Increment version of data, call it inside the write transaction"""
+    (DataVersion
+     .insert(id=1, version=1)
+     .on_conflict(conflict_target=[DataVersion.id],
+                  update={DataVersion.version: DataVersion.version + 1})
+     .execute())
+
+
+def data_version() -> int:
+    """Return version of data, 0 if it was never written or database was
+    created before DataVersion table"""
+    try:
+        return DataVersion.select(DataVersion.version).scalar() or 0
+    except OperationalError:
+        return 0
@@ -0,0 +1,102 @@
+"""LRU cache of rendered HTML pages
+Report and pilots pages have only a handful of distinct outputs (order,
+pilot), but rendering the Jinja template is most of their latency. Rendered
+pages are kept in a bounded LRU cache keyed on route and normalized query
+arguments. Pages of one data version are cached at a time: when version of
+the report changes, all pages are dropped.
+
+Every page has strong ETag of its body and can be compressed once when it is
+cached (gzip with standard library, br if optional brotli package is
+installed), so requests with Accept-Encoding get precompressed bytes.
+
+Classes:
+    Page(body: bytes, encodings=())
+    Rendered page with ETag and compressed bodies
+
+    PageCache(max_entries: int = 64, encodings=())
+    Thread-safe LRU cache of pages of one data version
+
+Functions:
+    compress(body: bytes, encoding: str) -> bytes | None:
+    Return body compressed with gzip or br, None if encoder is not installed
+"""
+
+import collections
+import gzip
+import hashlib
+import threading
+from f_one import metrics
+
+ENCODINGS = ('br', 'gzip')  # preferred first if client accepts both
+
+
+def compress(body: bytes, encoding: str) -> bytes | None:
+    """Return body compressed with gzip or br, None if encoder of br (brotli
+    package) is not installed"""
+    if encoding == 'gzip':
+        return gzip.compress(body, mtime=0)
+    if encoding == 'br':
+        try:
+            import brotli
+        except ImportError:
+            return None
+        return brotli.compress(body)
+    raise ValueError(f'Unknown encoding: {encoding}')
+
+
+class Page:
+    """Rendered page with strong ETag and bodies compressed with encodings"""
+
+    __slots__ = ('body', 'etag', 'encoded')
+
+    def __init__(self, body: bytes, encodings=()):
+        self.body = body
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.encoded = {}
+        for encoding in ENCODINGS:
+            if encoding in encodings:
+                encoded = compress(body, encoding)
+                if encoded is not None:
+                    self.encoded[encoding] = encoded
+
+
+class PageCache:
+    """Thread-safe LRU cache of pages of one data version
+    Arguments:
+    max_entries -- Number of pages kept, 0 disables cache (default 64)
+    encodings -- Encodings of precompressed bodies, 'gzip' and 'br'
+    (default () - pages are not compressed)
+    """
+
+    def __init__(self, max_entries: int = 64, encodings=()):
+        self.max_entries = max_entries
+        self.encodings = tuple(encodings)
+        self._pages = collections.OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def get(self, version: str, key: tuple, render) -> Page:
+        """Return cached page of data version, render() returns str of page
+        if it is not cached"""
+        with self._lock:
+            if version != self._version:
+                self._pages.clear()
+                self._version = version
+            page = self._pages.get(key)
+            if page is not None:
+                self._pages.move_to_end(key)
+        if page is not None:
+            metrics.cache_requests.inc('page', 'hit')
+            return page
+        metrics.cache_requests.inc('page', 'miss')
+        # Rendered outside of lock, concurrent misses may render twice
+        page = Page(render().encode(), self.encodings)
+        with self._lock:
+            if version == self._version and self.max_entries > 0:
+                self._pages[key] = page
+                while len(self._pages) > self.max_entries:
+                    self._pages.popitem(last=False)
+        return page
+
+    def __len__(self) -> int:
+        return len(self._pages)
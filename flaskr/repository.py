@@ -0,0 +1,293 @@
+"""Source of qualification reports for web app and API
+Report can be built from log files (file backend) or read from SQLite
+database filled by db.py (db backend). Backend is selected with REPORT_BACKEND
+config value of Flask app ('file' or 'db', FLASK_REPORT_BACKEND environment
+variable). Both backends return f_one.cache.CachedReport, so web app and API
+do not depend on the backend.
+
+Database backend reads report of event from Standings table materialized by
+db.py on ingest: rows of event session in order of (event, session, position)
+index, so reads do not aggregate laps. Report of all events (REPORT_EVENT is
+None, the default) ranks the best of materialized best laps of every driver,
+one Standings row per driver and event. Report of session without standings
+is built with one query: Qualification joined with Driver, grouped by driver
+and ordered by best lap time. Drivers without laps with positive time are
+returned as unreliable. Report is queried again only when count or last id
+of standings rows (or finished laps) or version of data (models.DataVersion,
+incremented by every write of db.py) changes. On first connection missing
+tables are created and tables of databases made by older versions are
+migrated (db.create_tables).
+
+Classes:
+    FileRepository(laps_dir: str)
+    Report built from log files in directory
+
+    SqlRepository(event: str = None, session: str = 'Q1')
+    Report queried from database
+
+Both repositories return lap times of every lap in NumPy arrays with laps()
+for f_one.analytics (imported by laps(), so NumPy is loaded only when
+analytics are requested). File repository also returns diagnostics of log
+files (f_one.validation) collected while the report is parsed with
+diagnostics(), database repository returns None: malformed lines are skipped
+by db.py on ingest.
+
+Functions:
+    get_repository(config) -> FileRepository | SqlRepository:
+    Return repository for Flask config
+
+    get_report() -> CachedReport | None:
+    Return report from backend of current Flask app
+
+    cut_line() -> int | None:
+    Return last position that passes to the next session for current app
+"""
+
+import threading
+import time
+
+from flask import current_app
+from peewee import SQL, fn
+from f_one import aggregate, cache, columnar, f_one, metrics, validation
+from f_one.records import Pilot, ReportRow
+import db
+import models
+from models import Driver, Qualification, Standings
+
+BACKENDS = ('file', 'db')
+
+
+class FileRepository:
+    """Report built from log files in directory"""
+
+    def __init__(self, laps_dir: str, report_cache: cache.ReportCache = None):
+        self.laps_dir = laps_dir
+        self.report_cache = report_cache or cache.report_cache
+
+    def get(self) -> cache.CachedReport | None:
+        return self.report_cache.get(self.laps_dir)
+
+    def cut_line(self) -> int | None:
+        return f_one.cut_line(self.laps_dir)
+
+    def laps(self) -> 'analytics.LapArrays | None':
+        """Return lap times of every lap from compiled lap file"""
+        from f_one import analytics
+        paths = f_one.generate_file_paths(self.laps_dir)
+        if paths is None:
+            return None
+        return analytics.from_compiled(columnar.get_laps(paths))
+
+    def diagnostics(self) -> validation.Diagnostics | None:
+        """Return diagnostics of log files collected while the cached report
+        was parsed"""
+        cached_report = self.get()
+        if cached_report is None:
+            return None
+        return cached_report.diagnostics
+
+
+class SqlRepository:
+    """Report queried from database
+    Arguments:
+    event -- Name of event, None for all events (default None)
+    session -- Name of session (default 'Q1')
+    """
+
+    def __init__(self, event: str = None, session: str = 'Q1'):
+        self.event = event
+        self.session = session
+        self._entry = None
+        self._lock = threading.Lock()
+        self._schema_ready = False
+
+    def _ensure_schema(self):
+        """Create missing tables and migrate database created by older
+        version (db.create_tables) on first connection, so reads do not
+        fail on tables that db.py had not created yet"""
+        if self._schema_ready:
+            return
+        with self._lock:
+            if not self._schema_ready:
+                db.create_tables()
+                self._schema_ready = True
+
+    def _filters(self) -> list:
+        return models.lap_filters(self.session, self.event)
+
+    def _standings_filters(self) -> list:
+        filters = [Standings.session == self.session]
+        if self.event is not None:
+            filters.insert(0, Standings.event == self.event)
+        return filters
+
+    def _standings_signature(self) -> tuple:
+        """Return count and last id of materialized standings of session,
+        (0, None) if there are no standings"""
+        return (Standings
+                .select(fn.COUNT(Standings.id), fn.MAX(Standings.id))
+                .where(*self._standings_filters())
+                .tuples()
+                .get())
+
+    def signature(self) -> tuple:
+        """Return count and last id of materialized standings or, if event
+        has no standings, of finished session laps, count of drivers and
+        version of data"""
+        version = (Driver.select().count(), models.data_version())
+        standings = self._standings_signature()
+        if standings[0]:
+            return ('standings',) + standings + version
+        laps = (Qualification
+                .select(fn.COUNT(Qualification.id), fn.MAX(Qualification.id))
+                .where(*self._filters())
+                .tuples()
+                .get())
+        return laps + version
+
+    def ranked_query(self):
+        """Return query with (code, name, car, best lap time) of every driver,
+        ordered by best lap. Best lap is NULL if driver has no reliable laps"""
+        return models.ranked_query(self.session, self.event, f_one.FILTERING)
+
+    def standings_query(self):
+        """Return query with (position, name, car, time) of materialized
+        standings of event session in position order, unreliable rows (NULL
+        position) first. Name and car are read from Driver, so upserted
+        drivers do not wait for refresh of standings"""
+        return (Standings
+                .select(Standings.position, Driver.driver_name, Driver.car,
+                        Standings.time)
+                .join(Driver)
+                .where(*self._standings_filters())
+                .order_by(Standings.position)
+                .tuples())
+
+    def all_events_query(self):
+        """Return query with (name, car, best lap ms) of every driver of
+        session in all events, ordered by the best of materialized best laps.
+        Best lap is NULL if driver has no reliable laps in any event"""
+        best = fn.MIN(Standings.best_lap_ms).alias('best')
+        return (Standings
+                .select(Driver.driver_name, Driver.car, best)
+                .join(Driver)
+                .where(*self._standings_filters())
+                .group_by(Standings.driver_code)
+                .order_by(SQL('best IS NULL'), SQL('best'))
+                .tuples())
+
+    def build(self, materialized: bool = False) -> tuple[list, list, list]:
+        """Return report, pilots and unreliable results like
+        f_one.build_report
+        Arguments:
+        materialized -- Read Standings table instead of aggregating laps,
+        rows of event or best rows of every driver in all events (default
+        False)
+        """
+        report = []
+        unreliable_data = []
+        if materialized and self.event is not None:
+            for position, name, car, lap_time in self.standings_query():
+                if position is None:
+                    unreliable_data.append(ReportRow('Unknown', name, car,
+                                                     'Unreliable'))
+                else:
+                    report.append(ReportRow(position, name, car, lap_time))
+        else:
+            if materialized:
+                ranked = self.all_events_query()
+            else:
+                ranked = ((name, car, None if best is None
+                           else round(best * 1000))
+                          for _, name, car, best in self.ranked_query())
+            for name, car, best_ms in ranked:
+                if best_ms is None:
+                    unreliable_data.append(ReportRow('Unknown', name, car,
+                                                     'Unreliable'))
+                    continue
+                lap_time = aggregate.format_lap_time(best_ms)
+                report.append(ReportRow(len(report) + 1, name, car, lap_time))
+        pilots = [Pilot(*row) for row in Driver.select(
+            Driver.driver_code, Driver.driver_name, Driver.car).tuples()]
+        return report, pilots, unreliable_data
+
+    def get(self) -> cache.CachedReport | None:
+        with models.connection():
+            self._ensure_schema()
+            signature = self.signature()
+            entry = self._entry
+            if entry is not None and entry.signature == signature:
+                metrics.cache_requests.inc('db_report', 'hit')
+                return entry
+            metrics.cache_requests.inc('db_report', 'miss')
+            with self._lock:
+                entry = self._entry
+                if entry is None or entry.signature != signature:
+                    with metrics.stage_timer('aggregate'):
+                        built = self.build(signature[0] == 'standings')
+                    entry = cache.CachedReport(built, signature,
+                                               time.monotonic())
+                    self._entry = entry
+        return entry
+
+    def cut_line(self) -> int | None:
+        return aggregate.CUT_LINES[self.session]
+
+    def laps(self) -> 'analytics.LapArrays':
+        """Return lap times of every finished lap of session"""
+        from f_one import analytics
+        with models.connection():
+            self._ensure_schema()
+            pilots = {code: (name, car) for code, name, car in Driver.select(
+                Driver.driver_code, Driver.driver_name, Driver.car).tuples()}
+            rows = (Qualification
+                    .select(Qualification.driver_code, Qualification.lap,
+                            fn.ROUND(Qualification.lap_time * 1000))
+                    .where(*self._filters())
+                    .order_by(Qualification.id)
+                    .tuples())
+            return analytics.from_rows(rows, pilots)
+
+    def diagnostics(self) -> None:
+        """Log files are validated by db.py on ingest, database has no
+        diagnostics"""
+        return None
+
+
+_repositories = {}
+_repositories_lock = threading.Lock()
+
+
+def get_repository(config) -> FileRepository | SqlRepository:
+    """Return repository for Flask config. Repositories are reused between
+    requests, so every backend keeps its cached report. Database
+    repositories are separate for every DATABASE file"""
+    backend = config.get('REPORT_BACKEND', 'file')
+    if backend not in BACKENDS:
+        raise ValueError(f'Unknown report backend: {backend}')
+    if backend == 'file':
+        key = (backend, config.get('LAPS_DIR', 'static/data'))
+    else:
+        key = (backend, config.get('DATABASE'), config.get('REPORT_EVENT'),
+               config.get('REPORT_SESSION', 'Q1'))
+    repository = _repositories.get(key)
+    if repository is None:
+        with _repositories_lock:
+            repository = _repositories.get(key)
+            if repository is None:
+                if backend == 'file':
+                    repository = FileRepository(*key[1:])
+                else:
+                    repository = SqlRepository(*key[2:])
+                _repositories[key] = repository
+    return repository
+
+
+def get_report() -> cache.CachedReport | None:
+    """Return report from backend of current Flask app"""
+    return get_repository(current_app.config).get()
+
+
+def cut_line() -> int | None:
+    """Return last position that passes to the next session for current app"""
+    return get_repository(current_app.config).cut_line()
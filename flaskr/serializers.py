@@ -0,0 +1,123 @@
+"""Streaming serializers of qualification reports
+Every serializer is a generator that yields str chunks of CHUNK_ROWS rows, so
+a response can be sent before the whole report is serialized. JSON and XML
+output is byte-identical to jsonify and xml.etree.ElementTree.tostring used
+by the API before.
+
+Schemas:
+    report -- root MonacoQ1Report, rows <position> with position_number,
+    pilot, car, time
+    pilots -- root MonacoPilotsQ1Report, rows <pilot> with code, name, car
+
+Functions:
+    iter_json(rows, key: str = 'Monaco Q1 Results') -> Iterator[str]:
+    Yield {"key":[row,...]} JSON document
+
+    iter_xml(rows, report_type: str, fields=None) -> Iterator[str]:
+    Yield XML document with report schema
+
+    iter_ndjson(rows, report_type: str, fields=None) -> Iterator[str]:
+    Yield one JSON object per line
+
+    iter_csv(rows, report_type: str, fields=None) -> Iterator[str]:
+    Yield CSV with header row
+
+    serialize(rows, report_type: str, fmt: str, fields=None) -> Iterator[str]:
+    Yield report in format json, xml, ndjson or csv
+
+Fields argument names the columns of projected rows (subset of schema
+fields), all schema fields by default.
+"""
+
+import csv
+import io
+import json
+from itertools import islice
+from typing import Iterator
+from xml.sax.saxutils import escape
+
+SCHEMAS = {
+    'report': ('MonacoQ1Report', 'position',
+               ('position_number', 'pilot', 'car', 'time')),
+    'pilots': ('MonacoPilotsQ1Report', 'pilot', ('code', 'name', 'car')),
+}
+MIMETYPES = {'json': 'application/json',
+             'xml': 'application/xml',
+             'ndjson': 'application/x-ndjson',
+             'csv': 'text/csv'}
+JSON_KEY = 'Monaco Q1 Results'
+CHUNK_ROWS = 1000  # rows serialized together in one chunk
+
+_dumps = json.JSONEncoder(ensure_ascii=True, sort_keys=True,
+                          separators=(',', ':')).encode
+
+
+def _chunks(rows) -> Iterator[list]:
+    rows = iter(rows)
+    while chunk := list(islice(rows, CHUNK_ROWS)):
+        yield chunk
+
+
+def iter_json(rows, key: str = JSON_KEY) -> Iterator[str]:
+    """Yield {"key":[row,...]} JSON document"""
+    yield '{' + _dumps(key) + ':['
+    separator = ''
+    for chunk in _chunks(rows):
+        # Whole chunk is encoded as one array without brackets
+        yield separator + _dumps(chunk)[1:-1]
+        separator = ','
+    yield ']}\n'
+
+
+def _xml_element(tag: str, value) -> str:
+    text = escape(str(value))
+    if not text:
+        return f'<{tag} />'
+    return f'<{tag}>{text}</{tag}>'
+
+
+def iter_xml(rows, report_type: str, fields=None) -> Iterator[str]:
+    """Yield XML document with report schema"""
+    root, item, schema_fields = SCHEMAS[report_type]
+    fields = fields or schema_fields
+    yield f'<{root}>'
+    for chunk in _chunks(rows):
+        yield ''.join(f'<{item}>'
+                      + ''.join([_xml_element(field, value)
+                                 for field, value in zip(fields, row)])
+                      + f'</{item}>' for row in chunk)
+    yield f'</{root}>'
+
+
+def iter_ndjson(rows, report_type: str, fields=None) -> Iterator[str]:
+    """Yield one JSON object per line"""
+    fields = fields or SCHEMAS[report_type][2]
+    for chunk in _chunks(rows):
+        yield ''.join([_dumps(dict(zip(fields, row))) + '\n' for row in chunk])
+
+
+def iter_csv(rows, report_type: str, fields=None) -> Iterator[str]:
+    """Yield CSV with header row"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(fields or SCHEMAS[report_type][2])
+    for chunk in _chunks(rows):
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def serialize(rows, report_type: str, fmt: str,
+              fields=None) -> Iterator[str]:
+    """Yield report in format json, xml, ndjson or csv"""
+    if fmt == 'json':
+        return iter_json(rows)
+    if fmt == 'xml':
+        return iter_xml(rows, report_type, fields)
+    if fmt == 'ndjson':
+        return iter_ndjson(rows, report_type, fields)
+    if fmt == 'csv':
+        return iter_csv(rows, report_type, fields)
+    raise ValueError(f'Unknown format: {fmt}')
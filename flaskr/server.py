@@ -0,0 +1,217 @@
+"""Pre-forking production server of web app and API
+Master process creates the app with web pages and API, binds the listening
+socket and warms caches: report is built and pages and API responses of
+WARM_URLS are rendered and serialized. Then it forks worker processes, which
+get warm caches copy-on-write and serve the shared socket with threaded
+werkzeug server, so all CPU cores serve requests without parsing logs again.
+
+Master checks version of report every reload_interval seconds (and on
+SIGHUP). When data changes, caches are warmed again in master, new workers
+are forked and old workers stop gracefully: they stop accepting connections,
+close live standings streams (f_one.live.close_sessions), finish requests in
+progress and exit (killed after GRACEFUL_TIMEOUT seconds). Master does not
+wait for them: old workers are reaped in the master loop, which keeps
+replacing dead workers and checking data version. SIGTERM or SIGINT stops
+all workers and master. Readiness of worker is reported by /ready endpoint
+of app.
+
+On platforms without os.fork the app is served by one threaded process.
+
+Run from repository root:
+    python -m flaskr serve --workers 4 --bind 0.0.0.0:8000
+
+Functions:
+    warm(app: Flask) -> str | None:
+    Build report and fill caches of app, return version of report
+
+    serve(bind: str = '127.0.0.1:8000', workers: int = None,
+          config: dict = None, reload_interval: float = 2.0):
+    Serve app with pre-forked worker processes
+"""
+
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+from flask import Flask
+from werkzeug.serving import WSGIRequestHandler, make_server
+import models
+import repository
+from app import create_app
+from f_one import live
+
+WARM_URLS = ('/report', '/report?order=desc', '/report/pilots',
+             '/report/pilots?order=desc', '/api/v1/report/',
+             '/api/v1/analytics/')
+GRACEFUL_TIMEOUT = 30  # seconds for old worker to finish its requests
+BACKLOG = 1024
+
+
+class RequestHandler(WSGIRequestHandler):
+    # One request per connection: stopping worker does not wait for idle
+    # keep-alive connections
+    protocol_version = 'HTTP/1.0'
+
+
+def warm(app: Flask) -> str | None:
+    """Build report and fill caches of app by requesting WARM_URLS. Return
+    version of report, None if report data is not available"""
+    cached_report = repository.get_repository(app.config).get()
+    if cached_report is None:
+        return None
+    with app.test_client() as client:
+        for url in WARM_URLS:
+            client.get(url)
+    # SQLite connections must not be shared with forked workers
+    models.db.close_all()
+    return cached_report.version
+
+
+def data_version(app: Flask) -> str | None:
+    """Return version of report data, report is built again if data
+    changed"""
+    cached_report = repository.get_repository(app.config).get()
+    models.db.close_all()
+    return None if cached_report is None else cached_report.version
+
+
+def run_worker(app: Flask, listener: socket.socket):
+    """Serve app on listening socket until SIGTERM, then finish requests in
+    progress and exit"""
+    host, port = listener.getsockname()[:2]
+    server = make_server(host, port, app, threaded=True,
+                         request_handler=RequestHandler,
+                         fd=listener.fileno())
+    server.daemon_threads = False  # server_close() waits for requests
+
+    def shutdown():
+        live.close_sessions()  # streams of standings never end by themselves
+        server.shutdown()
+
+    def stop(signum, frame):
+        threading.Thread(target=shutdown).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    server.serve_forever()
+    server.server_close()
+
+
+def spawn(app: Flask, listener: socket.socket, workers: int) -> set:
+    """Fork workers, return their pids"""
+    pids = set()
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            # Master handles Ctrl+C and SIGHUP of process group
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            try:
+                run_worker(app, listener)
+            except BaseException:
+                traceback.print_exc()
+                status = 1
+            finally:
+                os._exit(status)
+        pids.add(pid)
+    return pids
+
+
+def terminate(pids):
+    """Send SIGTERM to workers"""
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+
+def reap(pids) -> set:
+    """Return pids of workers that exited, without waiting for the others"""
+    exited = set()
+    for pid in pids:
+        try:
+            done, _ = os.waitpid(pid, os.WNOHANG)
+        except ChildProcessError:
+            done = pid
+        if done:
+            exited.add(pid)
+    return exited
+
+
+def stop_workers(pids: set, timeout: float = GRACEFUL_TIMEOUT):
+    """Send SIGTERM to workers and wait for them, kill workers that do not
+    exit in timeout seconds"""
+    terminate(pids)
+    deadline = time.monotonic() + timeout
+    waiting = set(pids)
+    while waiting:
+        waiting -= reap(waiting)
+        if waiting and time.monotonic() > deadline:
+            for pid in waiting:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            return
+        time.sleep(0.05)
+
+
+def serve(bind: str = '127.0.0.1:8000', workers: int = None,
+          config: dict = None, reload_interval: float = 2.0):
+    """Serve app with pre-forked worker processes
+    Arguments:
+    bind -- host:port of listening socket (default '127.0.0.1:8000')
+    workers -- Number of worker processes (default None - number of CPUs)
+    config -- Config values of app, see app.DEFAULT_CONFIG
+    reload_interval -- Seconds between checks of data version
+    """
+    host, port = bind.rsplit(':', 1)
+    workers = workers or os.cpu_count() or 1
+    app = create_app(config)
+    listener = socket.create_server((host, int(port)), backlog=BACKLOG)
+    version = warm(app)
+    print(f'Serving on {host}:{listener.getsockname()[1]} with {workers} '
+          f'workers, report version {version}', flush=True)
+    if not hasattr(os, 'fork'):
+        run_worker(app, listener)
+        return
+
+    events = {'stop': False, 'reload': False}
+
+    def on_stop(signum, frame):
+        events['stop'] = True
+
+    def on_reload(signum, frame):
+        events['reload'] = True
+
+    signal.signal(signal.SIGTERM, on_stop)
+    signal.signal(signal.SIGINT, on_stop)
+    signal.signal(signal.SIGHUP, on_reload)
+    pids = spawn(app, listener, workers)
+    stopping = {}  # pid of old worker -> time when it is killed
+    try:
+        while not events['stop']:
+            time.sleep(reload_interval)
+            pids -= reap(pids)
+            for pid in reap(stopping):
+                del stopping[pid]
+            for pid, deadline in stopping.items():
+                if time.monotonic() > deadline:
+                    os.kill(pid, signal.SIGKILL)  # reaped in next loop
+            if events['stop']:
+                break
+            new_version = data_version(app)
+            if events['reload'] or new_version != version:
+                events['reload'] = False
+                version = warm(app)
+                old_pids, pids = pids, spawn(app, listener, workers)
+                print(f'Reloaded report version {version}', flush=True)
+                terminate(old_pids)
+                stopping.update(dict.fromkeys(
+                    old_pids, time.monotonic() + GRACEFUL_TIMEOUT))
+            elif len(pids) < workers:
+                pids |= spawn(app, listener, workers - len(pids))
+    finally:
+        stop_workers(pids | set(stopping))
+        listener.close()
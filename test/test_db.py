@@ -0,0 +1,248 @@
+import shutil
+import threading
+import pytest
+from pathlib import Path
+import db
+import models
+import repository
+from f_one import analytics, f_one
+
+
+@pytest.fixture
+def sqlite_db(tmp_path):
+    database = models.db.database
+    models.configure(str(tmp_path / 'f1.sqlite3'))
+    with models.db.connection_context():
+        db.create_tables()
+        db.ingest('static/data')
+    yield models.db
+    models.configure(database)
+
+
+def test_sql_report_matches_file_report(sqlite_db):
+    report, pilots, unreliable_data = f_one.build_report('static/data')
+    sql_report = repository.SqlRepository(event='data').get()
+    assert sql_report.qualification_report == report
+    assert sorted(sql_report.unreliable_data) == sorted(unreliable_data)
+    assert sorted(sql_report.pilots) == sorted(pilots)
+
+
+def test_sql_laps_match_file_laps(sqlite_db):
+    sql_laps = repository.SqlRepository(event='data').laps()
+    file_laps = repository.FileRepository('static/data').laps()
+    assert analytics.analyze(sql_laps, 15) == analytics.analyze(file_laps, 15)
+
+
+def test_sql_report_rebuilt_only_when_laps_change(sqlite_db):
+    sql_repository = repository.get_repository({'REPORT_BACKEND': 'db'})
+    first = sql_repository.get()
+    assert sql_repository.get() is first
+    # Default config (all events) is read from materialized standings
+    assert first.signature[0] == 'standings'
+    assert first.qualification_report == sql_repository.build()[0]
+    with sqlite_db.connection_context():
+        models.Qualification.delete().where(
+            models.Qualification.driver_code == 'SVF').execute()
+        db.refresh_standings()
+    second = sql_repository.get()
+    assert second is not first
+    assert len(second.qualification_report) == 15
+
+
+def test_sql_report_rebuilt_when_driver_changes(sqlite_db):
+    sql_repository = repository.SqlRepository(event='data')
+    first = sql_repository.get()
+    with sqlite_db.connection_context():
+        # Upsert keeps count and ids of rows, only data version changes
+        db.store_drivers([('SVF', 'Sebastian Vettel', 'SCUDERIA FERRARI')])
+    second = sql_repository.get()
+    assert second is not first
+    assert second.qualification_report[0][2] == 'SCUDERIA FERRARI'
+    config = {'REPORT_BACKEND': 'db', 'DATABASE': 'one.sqlite3'}
+    assert repository.get_repository(config) is not repository.get_repository(
+        {**config, 'DATABASE': 'two.sqlite3'})
+
+
+def test_app_db_backend(sqlite_db):
+    from flaskr import app
+    app.app.config['REPORT_BACKEND'] = 'db'
+    try:
+        with app.app.test_client() as tc:
+            resp = tc.get('/report')
+            assert resp.status_code == 200
+            assert b'Sebastian Vettel' in resp.data
+            # Live standings come from log files, not from the database
+            assert b'EventSource' not in resp.data
+            assert tc.get('/api/v1/report/stream/').status_code == 404
+    finally:
+        app.app.config['REPORT_BACKEND'] = 'file'
+
+
+@pytest.fixture
+def laps_dir(tmp_path):
+    data_dir = Path(__file__).resolve().parents[1] / 'flaskr' / 'static' / 'data'
+    laps_dir = tmp_path / 'monaco'
+    shutil.copytree(data_dir, laps_dir)
+    return laps_dir
+
+
+def test_ingest_is_incremental(sqlite_db, laps_dir):
+    with sqlite_db.connection_context():
+        assert db.ingest(str(laps_dir)) == {'abbreviations.txt': 19,
+                                            'start.log': 19, 'end.log': 19}
+        assert db.ingest(str(laps_dir)) == {'abbreviations.txt': 0,
+                                            'start.log': 0, 'end.log': 0}
+        with open(laps_dir / 'start.log', 'a') as start:
+            start.write('SVF2018-05-24_12:20:00.000\n')
+        with open(laps_dir / 'end.log', 'a') as end:
+            end.write('SVF2018-05-24_12:21:10.001\nSVF2018-05-24_12:2')
+        assert db.ingest(str(laps_dir))['end.log'] == 1
+        lap = models.Qualification.get(event='monaco', driver_code='SVF', lap=2)
+        assert lap.lap_time == 70.001
+        assert models.Qualification.select().where(
+            models.Qualification.event == 'monaco').count() == 20
+
+
+def test_ingest_replaced_log(sqlite_db, laps_dir):
+    with sqlite_db.connection_context():
+        db.ingest(str(laps_dir))
+        (laps_dir / 'start.log').write_text('SVF2018-05-24_12:02:58.917\n')
+        (laps_dir / 'end.log').write_text('SVF2018-05-24_12:04:11.332\n')
+        db.ingest(str(laps_dir))
+        laps = models.Qualification.select().where(
+            models.Qualification.event == 'monaco')
+        assert [(q.driver_code_id, q.lap_time) for q in laps] == [
+            ('SVF', 72.415)]
+
+
+def test_readers_not_blocked_by_ingest(sqlite_db):
+    with models.connection():
+        assert sqlite_db.execute_sql('PRAGMA journal_mode').fetchone()[0] \
+            == 'wal'
+    writing = threading.Event()
+    done = threading.Event()
+
+    def writer():
+        with models.connection(), sqlite_db.atomic():
+            models.Qualification.delete().where(
+                models.Qualification.driver_code == 'SVF').execute()
+            writing.set()
+            done.wait(5)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        assert writing.wait(5)
+        # Uncommitted delete is not visible and does not block the reader
+        report = repository.SqlRepository(event='data').get()
+        assert len(report.qualification_report) == 16
+    finally:
+        done.set()
+        thread.join()
+
+
+def test_app_returns_request_connection_to_pool(sqlite_db):
+    from flaskr import app
+    test_app = app.create_app({'REPORT_BACKEND': 'db',
+                               'SWAGGER_ENABLED': False})
+    with test_app.test_client() as tc:
+        assert tc.get('/api/v1/report/').status_code == 200
+    assert sqlite_db.is_closed()
+
+
+def test_load_season_fast_path_matches_insert_many(sqlite_db, tmp_path):
+    data_dir = Path(__file__).resolve().parents[1] / 'flaskr' / 'static' / 'data'
+    for session in ('Q1', 'Q2'):
+        shutil.copytree(data_dir, tmp_path / 'season' / 'monaco' / session)
+    progress = []
+    tables = []
+    with sqlite_db.connection_context():
+        for fast in (False, True):
+            models.Qualification.delete().execute()
+            stored = db.load_season(
+                tmp_path / 'season', batch_size=4, fast=fast,
+                progress=lambda model, rows, elapsed: progress.append(rows))
+            tables.append([(q.event, q.session, q.driver_code_id, q.lap,
+                            q.start, q.stop, q.lap_time) for q in
+                           models.Qualification.select().order_by(
+                               models.Qualification.id)])
+            assert stored == 38
+    assert tables[0] == tables[1]
+    assert tables[0][0][:2] == ('monaco', 'Q1')
+    assert progress[:2] == [19, 19]  # 5 batches in one transaction
+
+
+def test_report_read_from_materialized_standings(sqlite_db, laps_dir):
+    sql_repository = repository.SqlRepository(event='monaco')
+    with sqlite_db.connection_context():
+        db.ingest(str(laps_dir))
+        query = sql_repository.standings_query().sql()
+        plan = sqlite_db.execute_sql('EXPLAIN QUERY PLAN ' + query[0],
+                                     query[1]).fetchall()
+        assert 'USING INDEX standings_event_session_position' in plan[0][-1]
+    report = sql_repository.get()
+    assert report.signature[0] == 'standings'
+    all_events = repository.SqlRepository()
+    assert all_events.get().qualification_report == all_events.build()[0]
+    assert report.qualification_report == \
+        repository.SqlRepository(event='data').build()[0]
+    with sqlite_db.connection_context():
+        # Laps are changed outside of ingest: standings are refreshed only
+        # for the touched session
+        models.Qualification.delete().where(
+            models.Qualification.event == 'monaco',
+            models.Qualification.driver_code == 'SVF').execute()
+        assert sql_repository.get() is report
+        assert db.refresh_standings([('monaco', 'Q1')]) == 18
+    assert len(sql_repository.get().qualification_report) == 15
+    assert len(repository.SqlRepository(event='data').get()
+               .qualification_report) == 16
+
+
+def test_load_season_skips_unknown_drivers(sqlite_db, tmp_path, capsys):
+    data_dir = Path(__file__).resolve().parents[1] / 'flaskr' / 'static' / 'data'
+    session = tmp_path / 'season' / 'monaco' / 'Q1'
+    shutil.copytree(data_dir, session)
+    with open(session / 'start.log', 'a') as start:
+        start.write('XXX2018-05-24_12:20:00.000\n')
+    with open(session / 'end.log', 'a') as end:
+        end.write('XXX2018-05-24_12:21:10.000\n')
+    with sqlite_db.connection_context():
+        for fast in (False, True):
+            models.Qualification.delete().execute()
+            assert db.load_season(tmp_path / 'season', batch_size=4,
+                                  fast=fast, progress=None) == 19
+            assert not models.Qualification.select().where(
+                models.Qualification.driver_code == 'XXX').exists()
+    assert 'Unknown driver XXX' in capsys.readouterr().out
+
+
+def test_duplicated_lines_paired_like_file_report(sqlite_db, laps_dir):
+    with sqlite_db.connection_context():
+        db.ingest(str(laps_dir))
+    # Repeated lines are appended after the stored ones
+    with open(laps_dir / 'start.log', 'a') as start:
+        start.write('SVF2018-05-24_12:02:58.917\nSVF2018-05-24_12:20:00.000\n')
+    with open(laps_dir / 'end.log', 'a') as end:
+        end.write('SVF2018-05-24_12:21:10.000\n')
+    with sqlite_db.connection_context():
+        db.ingest(str(laps_dir))
+    report = f_one.build_report(str(laps_dir))[0]
+    assert report[0][1:] == ('Sebastian Vettel', 'FERRARI', '1:10.000')
+    assert repository.SqlRepository(event='monaco').get() \
+        .qualification_report == report
+
+
+def test_app_migrates_old_database(sqlite_db, tmp_path):
+    # f1.sqlite3 shipped with the app has no event, session and Standings
+    database = tmp_path / 'old.sqlite3'
+    shutil.copy(Path(__file__).resolve().parents[1] / 'flaskr' / 'f1.sqlite3',
+                database)
+    from flaskr import app
+    test_app = app.create_app({'REPORT_BACKEND': 'db',
+                               'DATABASE': str(database),
+                               'SWAGGER_ENABLED': False})
+    with test_app.test_client() as tc:
+        resp = tc.get('/report')
+        assert resp.status_code == 200
+        assert b'Sebastian Vettel' in resp.data
@@ -0,0 +1,305 @@
+import shutil
+import pytest
+from pathlib import Path
+import datetime
+import io
+import json
+import sys
+from f_one import aggregate, analytics, cache, columnar, f_one, live, metrics, \
+    output, parser, records, season, validation
+
+DATA_DIR = Path(__file__).resolve().parents[1] / 'flaskr' / 'static' / 'data'
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    for file in DATA_DIR.iterdir():
+        shutil.copy(file, tmp_path / file.name)
+    return tmp_path
+
+
+def test_cache_reuses_report(data_dir):
+    report_cache = cache.ReportCache()
+    first = report_cache.get(str(data_dir))
+    assert report_cache.get(str(data_dir)) is first
+    assert len(first.qualification_report) == 16
+
+
+def test_cache_rebuilds_when_file_changes(data_dir):
+    report_cache = cache.ReportCache()
+    first = report_cache.get(str(data_dir))
+    with open(data_dir / 'abbreviations.txt', 'a') as abbr:
+        abbr.write('\n')
+    second = report_cache.get(str(data_dir))
+    assert second is not first
+    assert second.version != first.version
+
+
+def test_cache_ttl_and_invalidate(data_dir):
+    now = [0.0]
+    report_cache = cache.ReportCache(ttl=10, clock=lambda: now[0])
+    first = report_cache.get(str(data_dir))
+    now[0] = 5
+    assert report_cache.get(str(data_dir)) is first
+    now[0] = 11
+    second = report_cache.get(str(data_dir))
+    assert second is not first
+    report_cache.invalidate(str(data_dir))
+    assert report_cache.get(str(data_dir)) is not second
+
+
+def test_parse_timestamp_matches_strptime():
+    time = '2018-05-24_12:02:58.917'
+    dt = datetime.datetime.strptime(time, '%Y-%m-%d_%H:%M:%S.%f')
+    assert parser.ms_to_datetime(parser.parse_timestamp(time)) == dt
+
+
+def test_iter_timings_skips_empty_lines(tmp_path):
+    log = tmp_path / 'start.log'
+    log.write_text('SVF2018-05-24_12:02:58.917 \n\nNHR2018-05-24_12:02:49.914\n')
+    timings = list(parser.iter_timings(log))
+    assert [code for code, _ in timings] == ['SVF', 'NHR']
+    assert timings[0][1] - timings[1][1] == 9003
+
+
+def test_pair_laps_by_driver_and_lap():
+    starts = [('AAA', 0), ('BBB', 10), ('AAA', 100), ('AAA', 300)]
+    ends = [('BBB', 90), ('AAA', 70), ('CCC', 5), ('AAA', 190)]
+    laps = list(aggregate.pair_laps(starts, ends))
+    assert laps == [('BBB', 1, 10, 90), ('AAA', 1, 0, 70), ('AAA', 2, 100, 190)]
+
+
+def test_lap_table_round_trip():
+    laps = [records.Lap('AAA', 1, 0, 70), records.Lap('BBB', 1, 10, 90),
+            records.Lap('AAA', 2, 100, 190)]
+    table = records.LapTable.from_laps(laps)
+    assert len(table) == 3
+    assert table.codes == ['AAA', 'BBB']
+    assert list(table) == laps
+    assert list(table.lap_times()) == [lap.lap_ms for lap in laps]
+
+
+def test_compiled_laps_match_parsed_logs(data_dir, monkeypatch):
+    compiled = f_one.build_report(str(data_dir))
+    assert (data_dir / columnar.CACHE_FILE).is_file()
+    monkeypatch.setattr(f_one, 'COMPILED_CACHE', False)
+    assert f_one.build_report(str(data_dir)) == compiled
+    paths = f_one.generate_file_paths(str(data_dir))
+    laps = columnar.get_laps(paths)
+    assert list(laps) == list(aggregate.pair_laps(
+        parser.iter_timings(paths['start.log']),
+        parser.iter_timings(paths['end.log'])))
+
+
+def test_compiled_laps_rebuilt_when_logs_change(data_dir):
+    paths = f_one.generate_file_paths(str(data_dir))
+    count = len(columnar.get_laps(paths))
+    with open(data_dir / 'end.log', 'a') as file:
+        file.write('SVF2018-05-24_12:04:03.332\n')
+    with open(data_dir / 'start.log', 'a') as file:
+        file.write('SVF2018-05-24_12:03:00.000\n')
+    assert columnar.load(data_dir / columnar.CACHE_FILE,
+                         columnar.source_signature(paths)) is None
+    assert len(columnar.get_laps(paths)) == count + 1
+
+
+def test_analytics_outliers_gaps_and_teams():
+    pilots = {'AAA': ('Driver A', 'TEAM A'), 'BBB': ('Driver B', 'TEAM A'),
+              'CCC': ('Driver C', 'TEAM C'), 'DDD': ('Driver D', 'TEAM D')}
+    rows = [('AAA', 1, 72000), ('AAA', 2, 71500), ('BBB', 1, 72100),
+            ('CCC', 1, 72300), ('CCC', 2, 20000), ('BBB', 2, 71900),
+            ('DDD', 1, -5000), ('CCC', 3, 72200)]
+    result = analytics.analyze(analytics.from_rows(rows, pilots), cut_line=2)
+    assert [(d['code'], d['best_lap_ms'], d['gap_to_pole_ms'],
+             d['gap_to_ahead_ms'], d['cut_line_margin_ms'])
+            for d in result['drivers']] == [('AAA', 71500, 0, 0, -400),
+                                             ('BBB', 71900, 400, 400, 0),
+                                             ('CCC', 72200, 700, 300, 300)]
+    assert [(lap['code'], lap['lap']) for lap in result['outliers']] == [
+        ('CCC', 2), ('DDD', 1)]
+    assert result['unreliable'] == ['DDD']
+    assert result['teams'][0] == {'car': 'TEAM A', 'best_lap_ms': 71500,
+                                  'mean_lap_ms': 71700.0, 'drivers': 2}
+    assert result['cut_line'] == {'position': 2, 'lap_ms': 71900,
+                                  'margin_ms': 300}
+
+
+def test_analytics_matches_report(data_dir):
+    paths = f_one.generate_file_paths(str(data_dir))
+    laps = analytics.from_compiled(columnar.get_laps(paths))
+    result = analytics.analyze(laps, cut_line=15)
+    report = f_one.build_report(str(data_dir))[0]
+    assert [(d['position'], d['name'], d['car'], d['best_lap'])
+            for d in result['drivers']] == report
+
+
+def test_best_laps_and_gaps():
+    laps = [('AAA', 1, 0, 70), ('AAA', 2, 100, 160), ('BBB', 1, 0, 65),
+            ('CCC', 1, 50, 10), ('DDD', 1, 0, 80)]
+    best, laps_count = aggregate.best_laps(laps)
+    assert best == {'AAA': (60, 2), 'BBB': (65, 1), 'DDD': (80, 1)}
+    assert laps_count['AAA'] == 2 and 'CCC' in laps_count
+    standings = aggregate.rank(best)
+    assert [s.code for s in standings] == ['AAA', 'BBB', 'DDD']
+    assert [s.gap_to_leader for s in standings] == [0, 5, 20]
+    assert [s.gap_to_ahead for s in standings] == [0, 5, 15]
+
+
+def test_rank_top_matches_full_sort():
+    best = {f'D{i:02d}': ((i * 7919) % 100, 1) for i in range(50)}
+    assert aggregate.rank(best, top=5) == aggregate.rank(best)[:5]
+
+
+def test_cli_formats_top_team_and_stdin(data_dir, monkeypatch, capsys):
+    monkeypatch.setattr(sys, 'argv', ['f_one', '-f', '-', '--format',
+                                      'ndjson', '--top', '2'])
+    monkeypatch.setattr(sys, 'stdin', io.StringIO(f'{data_dir}\n'
+                                                  f'{data_dir}\n'))
+    f_one.main()
+    rows = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [row['position'] for row in rows] == [1, 2, 1, 2]
+    assert rows[0]['code'] == 'SVF'
+    monkeypatch.setattr(sys, 'argv', ['f_one', '-f', str(data_dir), '--format',
+                                      'json', '--team', 'ferrari', '--desc'])
+    f_one.main()
+    rows = json.loads(capsys.readouterr().out)
+    assert [row['code'] for row in rows] == ['KRF', 'SVF']
+    monkeypatch.setattr(sys, 'argv', ['f_one', '-f', str(data_dir), '--format',
+                                      'csv', '--top', '1'])
+    f_one.main()
+    assert capsys.readouterr().out.splitlines() == [
+        ','.join(output.FIELDS), f'{data_dir.name},Q1,1,SVF,Sebastian Vettel,'
+        'FERRARI,1:12.415,72415,0']
+
+
+def test_validation_reports_problems_without_aborting(data_dir, monkeypatch,
+                                                     capsys):
+    with open(data_dir / 'abbreviations.txt', 'a') as abbr:
+        abbr.write('\nSVF_Sebastian Vettel_FERRARI\nbroken line\n')
+    with open(data_dir / 'start.log', 'a') as start:
+        start.write('\nXXX2018-05-24_12:00:00.000\nYYY2018-05-24_12:00:00.000'
+                    '\nZZZ2018-05-24_12:0\nAAA2018-05-24_ab:00:00.000\n')
+    with open(data_dir / 'end.log', 'a') as end:
+        end.write('\nXXX2018-05-24_12:01:10.000\nWWW2018-05-24_12:01:00.000'
+                  '\nXXX2018-05-24_12:01:10.000\n')
+    result = f_one.build_session(str(data_dir)).diagnostics
+    assert result.counts == {'trailing_whitespace': 1, 'duplicate': 2,
+                             'malformed': 3, 'unknown_code': 1,
+                             'unmatched_start': 1, 'unmatched_end': 1,
+                             'implausible_lap': 3}
+    # Compiled file keeps diagnostics, text parse collects the same ones
+    assert list(f_one.build_session(str(data_dir)).diagnostics) == list(result)
+    monkeypatch.setattr(f_one, 'COMPILED_CACHE', False)
+    assert f_one.build_session(str(data_dir)).diagnostics.counts == \
+        result.counts
+    monkeypatch.undo()
+    mes = next(item for item in result if item.kind == 'trailing_whitespace')
+    assert (mes.file, mes.line, mes.code) == ('end.log', 1, 'MES')
+    assert result.to_dict()['truncated'] is False
+    report, _, _ = f_one.build_report(str(data_dir))
+    assert ('XXX', '') in {(rec[1], rec[2]) for rec in report}
+    bounded = validation.Diagnostics(max_per_kind=1)
+    for line in range(5):
+        bounded.add('malformed', 'end.log', line)
+    assert len(bounded) == 5 and len(list(bounded)) == 1
+    assert bounded.to_dict()['truncated'] is True
+    monkeypatch.setattr(sys, 'argv', ['f_one', '-f', str(data_dir),
+                                      '--diagnostics'])
+    f_one.main()
+    lines = capsys.readouterr().out.splitlines()
+    assert 'end.log:1 trailing_whitespace MES whitespace at the end of line' \
+        in lines
+    assert lines[-1].startswith('12 problems: duplicate 2, implausible_lap 3')
+
+
+def test_build_report_many_laps_per_driver(tmp_path):
+    session = tmp_path / 'monaco' / 'Q2'
+    session.mkdir(parents=True)
+    (session / 'abbreviations.txt').write_text(
+        'AAA_Driver A_TEAM A\nBBB_Driver B_TEAM B\n')
+    (session / 'start.log').write_text(
+        'AAA2018-05-24_12:00:00.000\nBBB2018-05-24_12:00:10.000\n'
+        'AAA2018-05-24_12:01:20.000\n')
+    (session / 'end.log').write_text(
+        'AAA2018-05-24_12:01:15.000\nBBB2018-05-24_12:01:22.500\n'
+        'AAA2018-05-24_12:02:30.100\n')
+    result = f_one.build_session(str(session))
+    assert (result.event, result.session) == ('monaco', 'Q2')
+    assert result.laps_count == {'AAA': 2, 'BBB': 1}
+    report = f_one.build_report(str(session))[0]
+    assert report == [(1, 'Driver A', 'TEAM A', '1:10.100'),
+                      (2, 'Driver B', 'TEAM B', '1:12.500')]
+    assert f_one.cut_line(str(session)) == 10
+
+
+def test_build_season_in_process_pool(tmp_path):
+    for event in ('2018/monaco/Q1', '2018/monaco/Q2', '2018/spa'):
+        shutil.copytree(DATA_DIR, tmp_path / 'archive' / event)
+    result = season.build_season(str(tmp_path / 'archive'), workers=2,
+                                 output_dir=tmp_path / 'out')
+    assert sorted((r.event, r.session) for r in result.sessions) == [
+        ('2018/monaco', 'Q1'), ('2018/monaco', 'Q2'), ('2018/spa', 'Q1')]
+    report = f_one.build_report(str(DATA_DIR))[0]
+    leader = result.standings[0]
+    assert (leader.name, leader.events, leader.poles) == (report[0][1], 2, 2)
+    assert len(result.classifications['2018/monaco']) == len(report)
+    written = json.loads((tmp_path / 'out/2018/monaco/Q2.json').read_text())
+    assert written['results'] == json.loads(json.dumps(report))
+
+
+def test_live_standings_moves_improved_driver():
+    standings = live.LiveStandings()
+    standings.add_start('AAA', 0)
+    standings.add_start('BBB', 0)
+    assert standings.add_end('AAA', 70)
+    assert standings.add_end('BBB', 80)
+    assert standings.ranking() == [(70, 'AAA'), (80, 'BBB')]
+    standings.add_start('BBB', 100)
+    standings.add_start('AAA', 100)
+    assert standings.add_end('BBB', 165)
+    assert not standings.add_end('AAA', 175)
+    assert standings.ranking() == [(65, 'BBB'), (70, 'AAA')]
+    # Driver improves twice and keeps one place in ranking
+    for start_ms, end_ms in ((200, 260), (300, 355)):
+        standings.add_start('AAA', start_ms)
+        assert standings.add_end('AAA', end_ms)
+    assert standings.ranking() == [(55, 'AAA'), (65, 'BBB')]
+
+
+def test_live_session_follows_appended_lines(data_dir):
+    session = live.LiveSession(str(data_dir))
+    session.poll()
+    version, payload = session.wait(0, timeout=0)
+    assert len(json.loads(payload)['results']) == 16
+    with open(data_dir / 'start.log', 'a') as start:
+        start.write('DRR2018-05-24_12:20:00.000\n')
+    with open(data_dir / 'end.log', 'a') as end:
+        end.write('DRR2018-05-24_12:21:00.000\n')
+    assert session.poll()
+    version, payload = session.wait(version, timeout=0)
+    results = json.loads(payload)['results']
+    assert results[0] == [1, 'Daniel Ricciardo', 'RED BULL RACING TAG HEUER',
+                          '1:0.000']
+
+
+def test_report_index():
+    report, pilots, unreliable_data = f_one.build_report('static/data')
+    index = f_one.ReportIndex(report, pilots, unreliable_data)
+    assert index.by_code['SVF'].result[0] == 1
+    assert index.find('Sebastian Vettel') is index.find('svf')
+    assert index.by_code['EOF'].result[3] == 'Unreliable'
+    assert {r.code for r in index.by_team['FERRARI']} == {'SVF', 'KRF'}
+
+
+def test_histogram_prometheus_format():
+    histogram = metrics.Histogram('test_seconds', 'Test', ('stage',),
+                                  buckets=(0.1, 1.0))
+    histogram.observe(0.05, 'parse')
+    histogram.observe(0.5, 'parse')
+    histogram.observe(5, 'parse')
+    lines = histogram.collect()
+    assert 'test_seconds_bucket{stage="parse",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="parse",le="1.0"} 2' in lines
+    assert 'test_seconds_bucket{stage="parse",le="+Inf"} 3' in lines
+    assert 'test_seconds_count{stage="parse"} 3' in lines
+    metrics.REGISTRY.remove(histogram)
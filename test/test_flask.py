@@ -1,7 +1,26 @@
+import asyncio
 import flask
+import gzip
 import pytest
 import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
 from flaskr import app, api
+import asgi
+import page_cache
+import serializers
+from f_one import metrics
+
+FLASKR_DIR = Path(__file__).resolve().parents[1] / 'flaskr'
+# Cumulative import time budgets in microseconds (python -X importtime)
+IMPORT_BUDGETS = {'f_one.f_one': 100_000, 'app': 500_000}
 
 
 @pytest.fixture
@@ -28,3 +47,384 @@ def test_json():
         resp = tc.get('api/v1/report/?format=json')
         json_data = json.loads(resp.data)
         assert 'Monaco Q1 Results' in json_data
+
+
+def test_report_desc_does_not_change_cached_report():
+    with app.app.test_client() as tc:
+        desc = tc.get('/report?order=desc').data
+        asc = tc.get('/report').data
+        assert desc != asc
+        assert tc.get('/report?order=desc').data == desc
+
+
+def test_api_etag_not_modified():
+    with api.app.test_client() as tc:
+        resp = tc.get('api/v1/report/?format=xml')
+        assert resp.status_code == 200
+        assert resp.mimetype == 'application/xml'
+        etag = resp.headers['ETag']
+        resp = tc.get('api/v1/report/?format=xml',
+                      headers={'If-None-Match': etag})
+        assert resp.status_code == 304
+
+
+def test_api_order_desc():
+    with api.app.test_client() as tc:
+        asc = json.loads(tc.get('api/v1/report/').data)['Monaco Q1 Results']
+        desc = json.loads(tc.get('api/v1/report/?order=desc').data)
+        assert desc['Monaco Q1 Results'] == asc[::-1]
+        assert tc.get('api/v1/report/?order=up').status_code == 404
+
+
+def test_api_query_selects_and_projects_rows():
+    with api.app.test_client() as tc:
+        full = json.loads(tc.get('api/v1/report/').data)['Monaco Q1 Results']
+        top = json.loads(tc.get('api/v1/report/?limit=10&offset=0&fields='
+                                'position_number,pilot').data)
+        assert top['Monaco Q1 Results'] == [row[:2] for row in full[:10]]
+        team = full[0][2]
+        rows = json.loads(tc.get(f'api/v1/report/?team={team.lower()}'
+                                 '&order=desc').data)['Monaco Q1 Results']
+        assert rows == [row for row in full if row[2] == team][::-1]
+        rows = json.loads(tc.get('api/v1/report/?min_pos=5&max_pos=8'
+                                 '&order=desc&offset=1&limit=2').data)
+        assert rows['Monaco Q1 Results'] == full[4:8][::-1][1:3]
+        csv = tc.get('api/v1/pilots/?fields=code&limit=2&format=csv').data
+        assert csv.decode().splitlines()[0] == 'code'
+        assert len(csv.decode().splitlines()) == 3
+        for query in ('limit=-1', 'offset=x', 'fields=speed', 'min_pos=0'):
+            assert tc.get(f'api/v1/report/?{query}').status_code == 404
+        assert tc.get('api/v1/pilots/?min_pos=2').status_code == 404
+
+
+def test_report_stream_first_event():
+    with api.app.test_client() as tc:
+        resp = tc.get('api/v1/report/stream/', buffered=False)
+        assert resp.mimetype == 'text/event-stream'
+        event = next(resp.response)
+        resp.close()
+        assert event.startswith(b'id: ')
+        assert b'event: standings' in event
+
+
+def test_unknown_pilot_id_is_404():
+    with app.app.test_client() as tc:
+        assert tc.get('/report/pilots?pilot_id=SVF').status_code == 200
+        assert tc.get('/report/pilots?pilot_id=XXX').status_code == 404
+
+
+def test_api_driver():
+    with api.app.test_client() as tc:
+        driver = json.loads(tc.get('api/v1/drivers/svf/').data)['driver']
+        assert driver == {'code': 'SVF', 'name': 'Sebastian Vettel',
+                          'car': 'FERRARI', 'position': 1, 'time': '1:12.415'}
+        resp = tc.get('api/v1/drivers/EOF/?format=xml')
+        assert b'<time>Unreliable</time>' in resp.data
+        assert tc.get('api/v1/drivers/XXX/').status_code == 404
+
+
+def test_streaming_serializers_match_previous_output():
+    report = [(i, f'Driver <{i}> & co', 'TEAM', '1:12.415')
+              for i in range(1, 2500)]
+    xml = ''.join(serializers.iter_xml(report, 'report')).encode()
+    assert xml == api.qual_report_to_xml_et(report)
+    with api.app.test_request_context():
+        expected = flask.jsonify({'Monaco Q1 Results': report}).data
+    assert ''.join(serializers.iter_json(report)).encode() == expected
+    csv_lines = ''.join(serializers.iter_csv(report, 'report')).splitlines()
+    assert csv_lines[0] == 'position_number,pilot,car,time'
+    assert len(csv_lines) == 2500
+
+
+def test_api_pilots_xml_root_and_csv():
+    with api.app.test_client() as tc:
+        xml = tc.get('api/v1/pilots/?format=xml').data
+        assert xml.startswith(b'<MonacoPilotsQ1Report><pilot>')
+        resp = tc.get('api/v1/pilots/?format=csv')
+        assert resp.mimetype == 'text/csv'
+        assert resp.data.startswith(b'code,name,car\n')
+
+
+def test_report_page_cache_etag_and_gzip():
+    with app.create_app().test_client() as tc:
+        plain = tc.get('/report?order=desc')
+        assert plain.headers['Cache-Control'] == 'public, max-age=0'
+        assert 'Content-Encoding' not in plain.headers
+        hits = metrics.cache_requests.value('page', 'hit')
+        packed = tc.get('/report?order=desc&x=1',
+                        headers={'Accept-Encoding': 'gzip'})
+        assert metrics.cache_requests.value('page', 'hit') == hits + 1
+        assert packed.headers['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(packed.data) == plain.data
+        resp = tc.get('/report?order=desc',
+                      headers={'If-None-Match': plain.headers['ETag']})
+        assert resp.status_code == 304
+
+
+def test_page_cache_lru_and_version():
+    cache = page_cache.PageCache(max_entries=2)
+    renders = []
+
+    def render(text):
+        return lambda: renders.append(text) or text
+
+    cache.get('v1', ('a',), render('a'))
+    cache.get('v1', ('b',), render('b'))
+    cache.get('v1', ('a',), render('a'))
+    cache.get('v1', ('c',), render('c'))  # drops b, least recently used
+    assert cache.get('v1', ('a',), render('a')).body == b'a'
+    cache.get('v1', ('b',), render('b'))
+    assert renders == ['a', 'b', 'c', 'b']
+    cache.get('v2', ('a',), render('a2'))
+    assert len(cache) == 1 and renders[-1] == 'a2'
+
+
+def test_metrics_endpoint():
+    with api.app.test_client() as tc:
+        tc.get('/report')
+        tc.get('api/v1/report/?format=xml')
+        text = tc.get('/metrics').data.decode()
+        assert 'f1_http_request_duration_seconds_count{route="/report",' \
+               'method="GET",status="200"}' in text
+        assert 'f1_stage_duration_seconds_count{stage="render"}' in text
+        assert 'f1_report_cache_requests_total{cache="report",result="hit"}' \
+               in text
+
+
+def test_metrics_count_failed_requests():
+    from flaskr import app
+
+    def fail():
+        raise RuntimeError('view failed')
+
+    test_app = app.create_app({'SWAGGER_ENABLED': False,
+                               'PROPAGATE_EXCEPTIONS': True})
+    test_app.add_url_rule('/fail', view_func=fail)
+    with test_app.test_client() as tc:
+        with pytest.raises(RuntimeError):
+            tc.get('/fail')
+        text = tc.get('/metrics').data.decode()
+    assert 'f1_http_request_duration_seconds_count{route="/fail",' \
+           'method="GET",status="500"} 1' in text
+
+
+def test_profiling_header():
+    api.app.config['PROFILING_ENABLED'] = True
+    try:
+        with api.app.test_client() as tc:
+            resp = tc.get('/report', headers={'X-Profile': '1'})
+            profile_id = resp.headers['X-Profile-Id']
+            assert tc.get(f'/metrics/profiles/{profile_id}').status_code == 200
+            assert 'X-Profile-Id' not in tc.get('/report').headers
+    finally:
+        api.app.config['PROFILING_ENABLED'] = False
+
+
+def test_api_analytics():
+    with app.create_app().test_client() as tc:
+        resp = tc.get('/api/v1/analytics/')
+        assert resp.status_code == 200
+        result = json.loads(resp.data)['analytics']
+        assert result['drivers'][0]['code'] == 'SVF'
+        assert result['cut_line']['position'] == 15
+        xml = tc.get('/api/v1/analytics/?format=xml').data
+        assert xml.startswith(b'<analytics><drivers><driver><position>1<')
+        assert tc.get('/api/v1/analytics/?format=csv').status_code == 404
+
+
+def test_api_diagnostics():
+    with app.create_app().test_client() as tc:
+        resp = tc.get('/api/v1/diagnostics/')
+        assert resp.status_code == 200
+        result = json.loads(resp.data)['diagnostics']
+        assert result['counts'] == {'implausible_lap': 3,
+                                    'trailing_whitespace': 1}
+        assert result['diagnostics'][0] == {
+            'kind': 'trailing_whitespace', 'file': 'end.log', 'line': 1,
+            'code': 'MES', 'message': 'whitespace at the end of line'}
+        etag = resp.headers['ETag']
+        assert tc.get('/api/v1/diagnostics/', headers={
+            'If-None-Match': etag}).status_code == 304
+        xml = tc.get('/api/v1/diagnostics/?format=xml').data
+        assert xml.startswith(b'<diagnostics><total>4</total>')
+        assert tc.get('/api/v1/diagnostics/?format=csv').status_code == 404
+        assert tc.get('/api/v2/diagnostics/').status_code == 404
+
+
+def test_create_app_without_swagger():
+    test_app = app.create_app({'SWAGGER_ENABLED': False, 'TESTING': True})
+    with test_app.test_client() as tc:
+        assert tc.get('/apidocs/').status_code == 404
+        assert tc.get('/api/v1/report/').status_code == 200
+
+
+def import_times(code: str) -> dict:
+    """Run code with python -X importtime in flaskr directory. Return
+    cumulative import time of every module in microseconds"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            cwd=FLASKR_DIR, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, total, module = line.split('|')
+            if total.strip().isdigit():
+                cumulative[module.strip()] = int(total)
+    return cumulative
+
+
+def test_import_time_budget():
+    cli = import_times('import f_one.f_one')
+    assert 'peewee' not in cli and 'flask' not in cli
+    ingest = import_times('import db')
+    assert 'flask' not in ingest and 'repository' not in ingest
+    web = import_times('import sys, app; '
+                       'app.create_app({"SWAGGER_ENABLED": False}); '
+                       'from f_one import cache; '
+                       'assert not cache.report_cache._entries; '
+                       'assert "flasgger" not in sys.modules; '
+                       'assert "numpy" not in sys.modules')
+    for module, budget in IMPORT_BUDGETS.items():
+        total = {**cli, **web}[module]
+        assert total < budget, f'{module} imported in {total} us'
+
+
+def asgi_get(asgi_app, path: str, query: str = '', headers: list = ()):
+    """Send GET request to ASGI app. Return status, headers and body"""
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'method': 'GET', 'path': path,
+             'query_string': query.encode(), 'headers': list(headers)}
+    asyncio.run(asgi_app(scope, receive, send))
+    body = b''.join(message.get('body', b'') for message in messages[1:])
+    return messages[0]['status'], dict(messages[0]['headers']), body
+
+
+def test_asgi_api_matches_flask_api():
+    asgi_app = asgi.create_asgi_app()
+    with app.create_app().test_client() as tc:
+        for url, query in (('/api/v1/report/', 'format=xml&order=desc'),
+                           ('/api/v1/pilots/', 'format=csv'),
+                           ('/api/v1/report/', 'limit=3&fields=pilot'),
+                           ('/api/v1/drivers/SVF/', ''),
+                           ('/api/v2/report/', '')):
+            resp = tc.get(f'{url}?{query}')
+            status, headers, body = asgi_get(asgi_app, url, query)
+            assert (status, body) == (resp.status_code, resp.data)
+    status, headers, _ = asgi_get(asgi_app, '/api/v1/report/')
+    status, _, body = asgi_get(asgi_app, '/api/v1/report/', headers=[
+        (b'if-none-match', headers[b'etag'])])
+    assert (status, body) == (304, b'')
+
+
+def test_asgi_reads_configured_database(tmp_path):
+    import db
+    import models
+    database = models.db.database
+    asgi_app = asgi.create_asgi_app({
+        'REPORT_BACKEND': 'db', 'REPORT_EVENT': 'data',
+        'DATABASE': str(tmp_path / 'asgi.sqlite3'),
+        'SQLITE_PRAGMAS': {'mmap_size': 0}})
+    try:
+        assert models.db.database == str(tmp_path / 'asgi.sqlite3')
+        with models.db.connection_context():
+            assert models.db.execute_sql('PRAGMA mmap_size').fetchone() == (0,)
+            db.create_tables()
+            db.ingest('static/data')
+            db.store_drivers([('SVF', 'Sebastian Vettel', 'ASGI TEAM')])
+        status, _, body = asgi_get(asgi_app, '/api/v1/drivers/SVF/')
+        assert status == 200
+        assert json.loads(body)['driver']['car'] == 'ASGI TEAM'
+    finally:
+        asgi_app.executor.shutdown()
+        models.configure(database)
+
+
+def test_asgi_coalesces_concurrent_requests(monkeypatch):
+    asgi_app = asgi.create_asgi_app()
+    calls = []
+    load_report = asgi_app.load_report
+
+    def counted_load_report():
+        calls.append(1)
+        time.sleep(0.05)
+        return load_report()
+
+    monkeypatch.setattr(asgi_app, 'load_report', counted_load_report)
+
+    async def many():
+        async def receive():
+            return {'type': 'http.request'}
+
+        async def send(message):
+            pass
+
+        scope = {'type': 'http', 'method': 'GET', 'path': '/api/v1/report/',
+                 'query_string': b'', 'headers': []}
+        await asyncio.gather(*(asgi_app(scope, receive, send)
+                               for _ in range(20)))
+
+    asyncio.run(many())
+    assert len(calls) == 1
+
+
+def get_ready(url: str, version: str = None, timeout: float = 20) -> dict:
+    """Poll /ready until server is ready with version other than version"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as resp:
+                status = json.loads(resp.read())
+            if status['version'] != version:
+                return status
+        except OSError:
+            pass
+        time.sleep(0.1)
+    raise AssertionError(f'{url} is not ready')
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs os.fork')
+def test_serve_workers_reload_on_data_change(tmp_path):
+    laps_dir = tmp_path / 'data'
+    shutil.copytree(FLASKR_DIR / 'static' / 'data', laps_dir)
+    with socket.socket() as free:
+        free.bind(('127.0.0.1', 0))
+        port = free.getsockname()[1]
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'flaskr', 'serve', '--workers', '2',
+         '--bind', f'127.0.0.1:{port}', '--reload-interval', '0.2'],
+        cwd=FLASKR_DIR.parent, stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        env={**os.environ, 'FLASK_LAPS_DIR': str(laps_dir),
+             'FLASK_SWAGGER_ENABLED': 'false'})
+    try:
+        url = f'http://127.0.0.1:{port}'
+        first = get_ready(f'{url}/ready')
+        with urllib.request.urlopen(f'{url}/api/v1/report/?limit=1') as resp:
+            assert json.loads(resp.read())['Monaco Q1 Results'][0][0] == 1
+        # Live stream of old worker is closed on reload, not waited for
+        stream = urllib.request.urlopen(f'{url}/api/v1/report/stream/',
+                                        timeout=10)
+        assert stream.readline().startswith(b'id: ')
+        with open(laps_dir / 'end.log', 'a') as end:
+            end.write('SVF2018-05-24_12:04:03.332\n')
+        get_ready(f'{url}/ready', first['version'])
+        assert stream.read().endswith(b'\n\n')  # returns at end of stream
+        stream.close()
+        stream = urllib.request.urlopen(f'{url}/api/v1/report/stream/',
+                                        timeout=10)
+        assert stream.readline().startswith(b'id: ')
+        started = time.monotonic()
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(timeout=10) == 0
+        assert time.monotonic() - started < 5
+        stream.close()
+    finally:
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(timeout=20) == 0